@@ -1,11 +1,16 @@
 import os
 import argparse
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from functools import lru_cache
-from typing import TypedDict, Annotated, Sequence
-from operator import add
+from typing import TypedDict, Annotated
+from operator import or_
 from langchain_core.pydantic_v1 import BaseModel
 from langchain_core.output_parsers import JsonOutputParser, StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import Runnable
 from langchain_openai import ChatOpenAI
 from langgraph.graph import StateGraph, END
 from tavily import TavilyClient
@@ -18,6 +23,9 @@ load_dotenv()
 # 定数の定義
 LLM_MODEL_NAME = "gpt-4-turbo-2024-04-09"
 TAVILY_MAX_RESULTS = 5
+MAX_CONCURRENT_TASKS = 5
+# ドキュメントストアに保持する検索結果の最大数
+DOCUMENT_STORE_SIZE = 1000
 
 
 # タスクを表すデータクラス
@@ -33,9 +41,48 @@ class Tasks(BaseModel):
     tasks: list[Task]
 
 
-# 検索結果のコンテンツを表すデータクラス
+# 検索結果の本文（raw_contentを含む大きなデータ）を状態の外に保持するストア
+# 不要になった検索結果は削除し、削除漏れに備えて保持する件数にも上限を設ける
+class DocumentStore:
+    def __init__(self, max_size: int = DOCUMENT_STORE_SIZE):
+        self._documents: OrderedDict[str, list[dict]] = OrderedDict()
+        self._max_size = max_size
+        self._lock = threading.Lock()
+
+    def put(self, documents: list[dict]) -> str:
+        document_id = uuid.uuid4().hex
+        with self._lock:
+            self._documents[document_id] = documents
+            while len(self._documents) > self._max_size:
+                self._documents.popitem(last=False)
+        return document_id
+
+    def get(self, document_id: str) -> list[dict]:
+        with self._lock:
+            documents = self._documents.get(document_id)
+            if documents is not None:
+                self._documents.move_to_end(document_id)
+        if documents is None:
+            print(f"検索結果はすでに破棄されています: {document_id}")
+            return []
+        return documents
+
+    def delete(self, *document_ids: str):
+        with self._lock:
+            for document_id in document_ids:
+                self._documents.pop(document_id, None)
+
+
+document_store = DocumentStore()
+
+
+# 検索結果のコンテンツを表すデータクラス（状態にはドキュメントストアのIDのみを保持する）
 class SearchContent(BaseModel):
-    documents: list[dict]
+    document_id: str
+
+    @property
+    def documents(self) -> list[dict]:
+        return document_store.get(self.document_id)
 
     def __str__(self):
         return "\n\n".join(
@@ -62,14 +109,19 @@ class Artifact(BaseModel):
             return self.content
 
 
+# 成果物の辞書（タスクIDをキーとする）をマージする関数
+def merge_artifacts(left: dict[int, Artifact], right: dict[int, Artifact]) -> dict[int, Artifact]:
+    return {**left, **right}
+
+
 # エージェントの状態を表す型定義
 class AgentState(TypedDict):
     query: str
     tasks: list[Task]
-    artifacts: Annotated[Sequence[Artifact], add]
-    next_task: Task | None
+    artifacts: Annotated[dict[int, Artifact], merge_artifacts]
+    next_tasks: list[Task]
     next_node: str
-    completed_task_ids: Annotated[Sequence[int], add]
+    completed_task_ids: Annotated[set[int], or_]
 
 
 # Tavilyクライアントのインスタンスを取得する関数
@@ -78,26 +130,51 @@ def tavily_client() -> TavilyClient:
     return TavilyClient(api_key=os.environ["TAVILY_API_KEY"])
 
 
-# プロンプトファイルを読み込む関数
+# 読み込んだプロンプトのキャッシュ
+_prompt_cache: dict[str, tuple[float, str]] = {}
+
+
+# プロンプトファイルを読み込む関数（ファイルが更新されるまではキャッシュを返す）
 def load_prompt(name: str) -> str:
     prompt_path = os.path.join(os.path.dirname(__file__), "prompts", f"{name}.prompt")
-    with open(prompt_path, "r") as f:
-        return f.read()
+    mtime = os.path.getmtime(prompt_path)
+    cached = _prompt_cache.get(prompt_path)
+    if cached is None or cached[0] != mtime:
+        with open(prompt_path, "r") as f:
+            cached = (mtime, f.read())
+        _prompt_cache[prompt_path] = cached
+    return cached[1]
+
+
+# LLMクライアントを取得する関数（同じ設定のクライアントは使い回す）
+@lru_cache
+def chat_model(model: str, temperature: float) -> ChatOpenAI:
+    return ChatOpenAI(model=model, temperature=temperature)
+
+
+# 実行可能なタスク（依存するタスクがすべて完了している未完了のタスク）を見つける関数
+def find_ready_tasks(tasks: list[Task], completed_task_ids: set[int]) -> list[Task]:
+    return [
+        task
+        for task in tasks
+        if task.id not in completed_task_ids
+        and all(related_id in completed_task_ids for related_id in task.related_ids)
+    ]
 
 
-# 次のタスクを見つける関数
-def find_next_task(tasks: list[Task], completed_task_ids: list[int]) -> Task | None:
-    for task in tasks:
-        if task.id not in completed_task_ids and all(
-                related_id in completed_task_ids for related_id in task.related_ids
-        ):
-            return task
-    return None
+# 次に実行するタスクを見つける関数（同じアクションの実行可能なタスクをまとめて返す）
+def find_next_tasks(tasks: list[Task], completed_task_ids: set[int]) -> list[Task]:
+    ready_tasks = find_ready_tasks(tasks, completed_task_ids)
+    if not ready_tasks:
+        return []
+    # 検索タスクを優先し、実行可能な検索をすべて同時に実行する
+    action = "search" if any(task.action == "search" for task in ready_tasks) else ready_tasks[0].action
+    return [task for task in ready_tasks if task.action == action]
 
 
 # 関連する成果物を取得する関数
-def fetch_artifact(artifacts: list[Artifact], related_ids: list[int]) -> list[Artifact]:
-    return [artifact for artifact in artifacts if artifact.id in related_ids]
+def fetch_artifact(artifacts: dict[int, Artifact], related_ids: list[int]) -> list[Artifact]:
+    return [artifacts[related_id] for related_id in related_ids if related_id in artifacts]
 
 
 # タスクを計画する関数
@@ -115,18 +192,24 @@ def plan(query: str) -> list[Task]:
 
     @retry(tries=3)
     def invoke_chain(query: str) -> list[Task]:
-        llm = ChatOpenAI(model=LLM_MODEL_NAME, temperature=0).bind(
-            response_format={"type": "json_object"}
-        )
-        prompt = ChatPromptTemplate.from_messages(
-            [("system", "{system_message}"), ("user", "{message}")]
-        ).partial(system_message=load_prompt("plan_system"))
-        chain = prompt | llm | JsonOutputParser(pydantic_model=Tasks) | dict_to_task
+        chain = plan_chain(load_prompt("plan_system")) | dict_to_task
         return chain.invoke({"message": query})
 
     return invoke_chain(query)
 
 
+# 計画のチェインを構築する関数（プロンプトの内容ごとに構築済みのチェインを再利用する）
+@lru_cache
+def plan_chain(system_message: str) -> Runnable:
+    llm = chat_model(LLM_MODEL_NAME, 0).bind(
+        response_format={"type": "json_object"}
+    )
+    prompt = ChatPromptTemplate.from_messages(
+        [("system", "{system_message}"), ("user", "{message}")]
+    ).partial(system_message=system_message)
+    return prompt | llm | JsonOutputParser(pydantic_model=Tasks)
+
+
 # 検索を実行する関数
 def search(query: str) -> list[dict]:
     response = tavily_client().search(query, max_results=TAVILY_MAX_RESULTS, include_raw_content=True)
@@ -135,14 +218,20 @@ def search(query: str) -> list[dict]:
 
 # 書き込みを実行する関数
 def write(task: str, documents: str) -> str:
-    llm = ChatOpenAI(model=LLM_MODEL_NAME, temperature=0.7)
+    chain = write_chain(load_prompt("write_system"), load_prompt("write_user"))
+    return chain.invoke({"task": task, "documents": documents})
+
+
+# 書き込みのチェインを構築する関数（プロンプトの内容ごとに構築済みのチェインを再利用する）
+@lru_cache
+def write_chain(system_message: str, user_message: str) -> Runnable:
+    llm = chat_model(LLM_MODEL_NAME, 0.7)
     prompt = ChatPromptTemplate.from_messages(
-        [("system", "{system_message}"), ("user", load_prompt("write_user"))]
+        [("system", "{system_message}"), ("user", user_message)]
     ).partial(
-        system_message=load_prompt("write_system")
+        system_message=system_message
     )
-    chain = prompt | llm | StrOutputParser()
-    return chain.invoke({"task": task, "documents": documents})
+    return prompt | llm | StrOutputParser()
 
 
 # 調査グラフを表すクラス
@@ -169,47 +258,62 @@ class ResearchGraph:
         tasks = plan(state["query"])
         return {"tasks": tasks}
 
-    # 検索を実行するメソッド
+    # 検索を実行するメソッド（実行可能な検索タスクを並行して実行する）
     def _run_search(self, state: AgentState) -> dict:
-        current_task = state["next_task"]
-        query = current_task.description
-        documents = search(query)
-        new_artifact = Artifact(
-            id=current_task.id,
-            task=current_task,
-            content=SearchContent(documents=documents),
-        )
+        current_tasks = state["next_tasks"]
+        with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_TASKS) as executor:
+            results = list(executor.map(lambda task: search(task.description), current_tasks))
+        new_artifacts = {
+            task.id: Artifact(
+                id=task.id,
+                task=task,
+                content=SearchContent(document_id=document_store.put(documents)),
+            )
+            for task, documents in zip(current_tasks, results)
+        }
         return {
-            "artifacts": [new_artifact],
-            "completed_task_ids": [current_task.id],
+            "artifacts": new_artifacts,
+            "completed_task_ids": {task.id for task in current_tasks},
         }
 
-    # 書き込みを実行するメソッド
+    # 書き込みを実行するメソッド（実行可能な書き込みタスクを並行して実行する）
     def _run_write(self, state: AgentState) -> dict:
-        current_task = state["next_task"]
-        query = current_task.description
-        related_artifacts = fetch_artifact(
-            list(state["artifacts"]), current_task.related_ids
-        )
-        documents = "\n\n".join(str(artifact.content) for artifact in related_artifacts)
-        report = write(query, documents)
-        new_artifact = Artifact(
-            id=current_task.id, task=current_task, content=report
-        )
+        current_tasks = state["next_tasks"]
+        artifacts = state["artifacts"]
+
+        def run(task: Task) -> str:
+            related_artifacts = fetch_artifact(artifacts, task.related_ids)
+            documents = "\n\n".join(str(artifact.content) for artifact in related_artifacts)
+            return write(task.description, documents)
+
+        with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_TASKS) as executor:
+            reports = list(executor.map(run, current_tasks))
+        new_artifacts = {
+            task.id: Artifact(id=task.id, task=task, content=report)
+            for task, report in zip(current_tasks, reports)
+        }
         return {
-            "artifacts": [new_artifact],
-            "completed_task_ids": [current_task.id],
+            "artifacts": new_artifacts,
+            "completed_task_ids": {task.id for task in current_tasks},
         }
 
     # ルーティングを実行するメソッド
     def _run_route(self, state: AgentState) -> dict:
         tasks = state["tasks"]
         completed_task_ids = state["completed_task_ids"]
-        current_task = find_next_task(tasks, completed_task_ids)
-        if current_task:
-            return {"next_task": current_task, "next_node": current_task.action}
+        current_tasks = find_next_tasks(tasks, completed_task_ids)
+        if current_tasks:
+            return {"next_tasks": current_tasks, "next_node": current_tasks[0].action}
         else:
-            return {"next_task": None, "next_node": "end"}
+            # すべてのタスクが完了したため、検索結果をドキュメントストアから削除する
+            document_store.delete(
+                *(
+                    artifact.content.document_id
+                    for artifact in state["artifacts"].values()
+                    if isinstance(artifact.content, SearchContent)
+                )
+            )
+            return {"next_tasks": [], "next_node": "end"}
 
     # ルーターを定義するメソッド
     def _router(self, state: AgentState) -> str:
@@ -235,9 +339,9 @@ def main():
         "query": query,
         "tasks": [],
         "documents": [],
-        "next_task": None,
+        "next_tasks": [],
         "next_node": "",
-        "completed_task_ids": []
+        "completed_task_ids": set()
     }
     final_output = None
 
@@ -254,11 +358,10 @@ def main():
                 print(f"[{task.id}] {task.action}: {task.description}, related_ids: {task.related_ids}")
             print("\n")
         elif "route" in s:
-            next_task = s["route"]["next_task"]
-            if next_task:
+            for next_task in s["route"]["next_tasks"]:
                 print(f"* [{next_task.id}] {next_task.action}: '{next_task.description}' processing...")
         elif "write" in s:
-            final_output = s["write"]["artifacts"][0]
+            final_output = list(s["write"]["artifacts"].values())[-1]
     print("\n\n")
     print("## final output ##")
     print(final_output)
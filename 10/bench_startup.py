@@ -0,0 +1,99 @@
+import time
+
+# プロセスの起動からの経過時間を計測するため、他のモジュールより先に計測を開始する
+PROCESS_STARTED = time.perf_counter()
+
+import os
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+# 計測に使用するクエリと検索結果
+BENCH_QUERY = "生成AIスタートアップの最新動向"
+BENCH_DOCUMENTS = [
+    "生成AIスタートアップの資金調達額が過去最高を更新した。",
+    "国内の生成AI関連企業による新サービスの発表が相次いでいる。",
+    "今週の天気は全国的に晴れの日が多くなる見込みです。",
+]
+BACKENDS = ["torch", "onnx", "onnx-int8"]
+# モデルの読み込み方法（crag_agent.pyの--preloadに対応）
+MODES = ["cold", "sync", "background"]
+# 最初の評価までに行うクエリの改善と検索にかかる時間の目安（秒）
+DEFAULT_WORK_SECONDS = 3.0
+
+
+# 子プロセスでリランカーを読み込み、最初のスコアが得られるまでの時間を計測する関数
+# cold: 最初の評価でモデルを読み込む（従来の遅延読み込み）
+# sync: グラフの構築時にウォームアップを済ませてから処理を開始する
+# background: 別スレッドでウォームアップしながら、クエリの改善と検索（を模擬した待ち時間）を進める
+def measure(backend: str, mode: str, work_seconds: float) -> dict:
+    from reranker import RerankerService
+
+    service = RerankerService(backend=backend)
+    if mode == "sync":
+        service.warmup()
+    elif mode == "background":
+        service.warmup(background=True)
+    ready = time.perf_counter()
+
+    # 最初の評価の前に行うクエリの改善と検索の時間を模擬する
+    time.sleep(work_seconds)
+    requested = time.perf_counter()
+
+    service.score(BENCH_QUERY, BENCH_DOCUMENTS)
+    scored = time.perf_counter()
+
+    return {
+        "startup_ms": (ready - PROCESS_STARTED) * 1000,
+        "first_score_ms": (scored - requested) * 1000,
+        "total_ms": (scored - PROCESS_STARTED) * 1000,
+    }
+
+
+# 新しいプロセスで計測を実行する関数
+def run_child(backend: str, mode: str, work_seconds: float) -> dict:
+    result = subprocess.run(
+        [
+            sys.executable, os.path.abspath(__file__), "--child",
+            "--backend", backend, "--mode", mode, "--work", str(work_seconds),
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    # コマンドライン引数のパーサーを作成
+    parser = argparse.ArgumentParser(description='Benchmark time-to-first-score of the reranker.')
+    parser.add_argument('--backend', type=str, nargs='+', choices=BACKENDS, default=BACKENDS,
+                        help='The backends to benchmark')
+    parser.add_argument('--repeat', type=int, default=3, help='The number of processes per setting')
+    parser.add_argument('--work', type=float, default=DEFAULT_WORK_SECONDS,
+                        help='The seconds of simulated query refinement and search before the first score')
+    parser.add_argument('--mode', type=str, choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+
+    # コマンドライン引数を解析
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure(args.backend[0], args.mode, args.work)))
+        return
+
+    print(f"{'backend':<12}{'mode':<12}{'起動(ms)':>12}{'初回スコア(ms)':>16}{'合計(ms)':>12}")
+    for backend in args.backend:
+        for mode in MODES:
+            results = [run_child(backend, mode, args.work) for _ in range(args.repeat)]
+            startup = statistics.median(result["startup_ms"] for result in results)
+            first_score = statistics.median(result["first_score_ms"] for result in results)
+            total = statistics.median(result["total_ms"] for result in results)
+            print(f"{backend:<12}{mode:<12}{startup:>12,.0f}{first_score:>16,.0f}{total:>12,.0f}")
+
+
+if __name__ == "__main__":
+    main()
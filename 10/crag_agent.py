@@ -1,16 +1,19 @@
 import os
 import argparse
+import threading
+import uuid
+from collections import OrderedDict
 from functools import lru_cache
-from typing import TypedDict, Annotated, Sequence
-from operator import add
-from sentence_transformers.cross_encoder import CrossEncoder
+from typing import TypedDict, Annotated
 from langchain_core.pydantic_v1 import BaseModel
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import Runnable
 from langchain_openai import ChatOpenAI
 from langgraph.graph import StateGraph, END
 from tavily import TavilyClient
 from dotenv import load_dotenv
+from reranker import get_reranker
 
 # 環境変数を読み込む
 load_dotenv()
@@ -18,19 +21,84 @@ load_dotenv()
 # 定数の定義
 LLM_MODEL_NAME = "gpt-4o-2024-05-13"
 TAVILY_MAX_RESULTS = 5
-
-
-# 検索結果のコンテンツを表すデータクラス
+# 検索結果が十分とみなす関連度スコアの平均の閾値
+SCORE_THRESHOLD = 0.6
+# クエリの改善と検索を繰り返す最大回数
+MAX_ITERATIONS = 5
+# レポートの作成に使用するドキュメントの最大数
+DOCUMENT_POOL_SIZE = 5
+# プロンプトに含める1ドキュメントあたりの本文の最大文字数
+MAX_DOCUMENT_CHARS = 4000
+# ドキュメントストアに保持する検索結果の最大数
+DOCUMENT_STORE_SIZE = 1000
+
+
+# 検索結果の本文を状態の外に保持するストア（保持する件数には上限を設ける）
+class DocumentStore:
+    def __init__(self, max_size: int = DOCUMENT_STORE_SIZE):
+        self._documents: OrderedDict[str, list[dict]] = OrderedDict()
+        self._max_size = max_size
+        self._lock = threading.Lock()
+
+    def put(self, documents: list[dict]) -> str:
+        document_id = uuid.uuid4().hex
+        with self._lock:
+            self._documents[document_id] = documents
+            while len(self._documents) > self._max_size:
+                self._documents.popitem(last=False)
+        return document_id
+
+    def get(self, document_id: str) -> list[dict]:
+        with self._lock:
+            documents = self._documents.get(document_id)
+            if documents is not None:
+                self._documents.move_to_end(document_id)
+        if documents is None:
+            print(f"検索結果はすでに破棄されています: {document_id}")
+            return []
+        return documents
+
+    def delete(self, *document_ids: str):
+        with self._lock:
+            for document_id in document_ids:
+                self._documents.pop(document_id, None)
+
+
+document_store = DocumentStore()
+
+
+# プロンプトに含めるドキュメントの本文を取得する関数
+# （raw_contentが取得できなかった場合はcontentを使用し、長い本文は先頭のみに切り詰める）
+def document_body(item: dict, max_chars: int = MAX_DOCUMENT_CHARS) -> str:
+    body = item.get("raw_content") or item.get("content") or ""
+    return body[:max_chars]
+
+
+# 検索結果のコンテンツを表すデータクラス（状態にはドキュメントストアのIDのみを保持する）
 class SearchContent(BaseModel):
-    documents: list[dict]
+    document_id: str
+
+    @property
+    def documents(self) -> list[dict]:
+        return document_store.get(self.document_id)
 
     def __str__(self):
         return "\n\n".join(
-            f"\"\"\"\ntitle: {item['title']}\nurl: {item['url']}\ncontent: {item['raw_content']}\n\"\"\""
+            f"\"\"\"\ntitle: {item['title']}\nurl: {item['url']}\ncontent: {document_body(item)}\n\"\"\""
             for item in self.documents
         )
 
 
+# これまでの検索結果からスコアの高いドキュメントを蓄積するプールを表すデータクラス
+class DocumentPool(SearchContent):
+    scores: list[float]
+
+    # プールのドキュメントのスコアの平均
+    @property
+    def average_score(self) -> float:
+        return sum(self.scores) / len(self.scores) if self.scores else 0.0
+
+
 # 評価結果のコンテンツを表すデータクラス
 class EvaluationContent(BaseModel):
     score: float
@@ -57,11 +125,19 @@ class Artifact(BaseModel):
             return self.content
 
 
+# 成果物の辞書（アクションごとの直近の成果物）をマージする関数
+def merge_artifacts(left: dict[str, Artifact], right: dict[str, Artifact]) -> dict[str, Artifact]:
+    return {**left, **right}
+
+
 # エージェントの状態を表す型定義
 class AgentState(TypedDict):
     task: str
     refined_query: str
-    artifacts: Annotated[Sequence[Artifact], add]
+    artifacts: Annotated[dict[str, Artifact], merge_artifacts]
+    document_pool: DocumentPool | None
+    iteration: int
+    max_iterations: int
 
 
 # Tavilyクライアントのインスタンスを取得する関数
@@ -70,18 +146,31 @@ def tavily_client() -> TavilyClient:
     return TavilyClient(api_key=os.environ["TAVILY_API_KEY"])
 
 
-# プロンプトファイルを読み込む関数
+# 読み込んだプロンプトのキャッシュ
+_prompt_cache: dict[str, tuple[float, str]] = {}
+
+
+# プロンプトファイルを読み込む関数（ファイルが更新されるまではキャッシュを返す）
 def load_prompt(name: str) -> str:
     prompt_path = os.path.join(os.path.dirname(__file__), "prompts", f"{name}.prompt")
-    with open(prompt_path, "r") as f:
-        return f.read()
+    mtime = os.path.getmtime(prompt_path)
+    cached = _prompt_cache.get(prompt_path)
+    if cached is None or cached[0] != mtime:
+        with open(prompt_path, "r") as f:
+            cached = (mtime, f.read())
+        _prompt_cache[prompt_path] = cached
+    return cached[1]
+
+
+# LLMクライアントを取得する関数（同じ設定のクライアントは使い回す）
+@lru_cache
+def chat_model(model: str, temperature: float) -> ChatOpenAI:
+    return ChatOpenAI(model=model, temperature=temperature)
 
 
 # 関連する成果物を取得する関数
-def retrieve_last_artifact(artifacts: list[Artifact], action: str) -> Artifact | None:
-    reversed_artifacts = reversed(artifacts)
-    selected_artifacts = (artifact for artifact in reversed_artifacts if artifact.action == action)
-    return next(selected_artifacts, None)
+def retrieve_last_artifact(artifacts: dict[str, Artifact], action: str) -> Artifact | None:
+    return artifacts.get(action)
 
 
 # 検索を実行する関数
@@ -90,55 +179,81 @@ def search(query: str) -> list[dict]:
     return response["results"]
 
 
-@lru_cache
-def load_cross_encoder(
-        model_name: str = "hotchpotch/japanese-reranker-cross-encoder-xsmall-v1",
-        default_activation_function=None
-):
-    _cross_encoder = CrossEncoder(
-        model_name,
-        default_activation_function=default_activation_function,
-    )
-    _cross_encoder.max_length = 512
-    return _cross_encoder
-
-
-# 検索クエリと検索結果の関連度スコアの平均スコアを算出する
-def evaluate(query: str, tavily_result: list[dict]) -> float:
+# タスクの質問と検索結果の各ドキュメントの関連度スコアを算出する
+# （改善のたびに変わる検索クエリではなく質問で評価するため、反復をまたいでスコアを比較・再利用できる）
+def evaluate(task: str, tavily_result: list[dict]) -> list[float]:
     # 検索結果を文字列に変換
     documents = [record["title"] + " " + record["content"] for record in tavily_result]
-    # Cross Encoderでスコアを算出
-    ranks = load_cross_encoder().rank(query, documents)
-    # スコアの平均を計算
-    scores = [rank['score'] for rank in ranks]
-    average_score = sum(scores) / len(scores)
-    return average_score
+    # Cross Encoderでスコアを算出（同じ質問で算出済みのドキュメントはキャッシュから取得）
+    result = get_reranker().score(task, documents)
+    print(f"rerank: {result}")
+    return result.scores
+
+
+# ドキュメントプールに検索結果をマージする関数（URLで重複を除き、スコアの高い上位k件を残す）
+def merge_document_pool(
+        pool: DocumentPool | None,
+        documents: list[dict],
+        scores: list[float],
+        k: int = DOCUMENT_POOL_SIZE,
+) -> DocumentPool:
+    candidates = list(zip(pool.documents, pool.scores)) if pool else []
+    candidates += list(zip(documents, scores))
+    best: dict[str, tuple[dict, float]] = {}
+    for document, score in candidates:
+        url = document["url"]
+        if url not in best or score > best[url][1]:
+            best[url] = (document, score)
+    top = sorted(best.values(), key=lambda item: item[1], reverse=True)[:k]
+    return DocumentPool(
+        document_id=document_store.put([document for document, _ in top]),
+        scores=[score for _, score in top],
+    )
 
 
 # 書き込みを実行する関数
 def write(task: str, documents: str) -> str:
-    llm = ChatOpenAI(model=LLM_MODEL_NAME, temperature=0.7)
+    chain = write_chain(load_prompt("write_system"), load_prompt("write_user"))
+    return chain.invoke({"task": task, "documents": documents})
+
+
+# 書き込みのチェインを構築する関数（プロンプトの内容ごとに構築済みのチェインを再利用する）
+@lru_cache
+def write_chain(system_message: str, user_message: str) -> Runnable:
+    llm = chat_model(LLM_MODEL_NAME, 0.7)
     prompt = ChatPromptTemplate.from_messages(
-        [("system", "{system_message}"), ("user", load_prompt("write_user"))]
+        [("system", "{system_message}"), ("user", user_message)]
     ).partial(
-        system_message=load_prompt("write_system")
+        system_message=system_message
     )
-    chain = prompt | llm | StrOutputParser()
-    return chain.invoke({"task": task, "documents": documents})
+    return prompt | llm | StrOutputParser()
 
 
 def query_refine(task: str, query: str | None, previous_score: float | None) -> str:
-    llm = ChatOpenAI(model=LLM_MODEL_NAME, temperature=0.0)
+    chain = query_refine_chain(load_prompt("query_refine_user"))
+    return chain.invoke({"task": task, "refined_query": query, "previous_score": previous_score})
+
+
+# クエリ改善のチェインを構築する関数（プロンプトの内容ごとに構築済みのチェインを再利用する）
+@lru_cache
+def query_refine_chain(user_message: str) -> Runnable:
+    llm = chat_model(LLM_MODEL_NAME, 0.0)
     prompt = ChatPromptTemplate.from_messages(
-        [("user", load_prompt("query_refine_user"))]
+        [("user", user_message)]
     )
-    chain = prompt | llm | StrOutputParser()
-    return chain.invoke({"task": task, "refined_query": query, "previous_score": previous_score})
+    return prompt | llm | StrOutputParser()
 
 
 # リサーチエージェントの実装
 class ResearchGraph:
-    def __init__(self):
+    def __init__(self, preload: str = "background"):
+        # Cross Encoderを事前に読み込み、最初の評価で読み込み待ちが発生しないようにする
+        # （backgroundの場合はクエリの改善や検索と並行して読み込む）
+        if preload == "sync":
+            get_reranker().warmup()
+        elif preload == "background":
+            get_reranker().warmup(background=True)
+
         self._graph = StateGraph(AgentState)
         self._graph.add_node("query_refine", self._run_query_refine)
         self._graph.add_node("search", self._run_search)
@@ -173,23 +288,34 @@ class ResearchGraph:
         documents = search(query)
         new_artifact = Artifact(
             action="search",
-            content=SearchContent(documents=documents),
+            content=SearchContent(document_id=document_store.put(documents)),
         )
+        # 前回の検索結果は評価済みのため、ドキュメントストアから削除する
+        previous_artifact = retrieve_last_artifact(state["artifacts"], "search")
+        if previous_artifact:
+            document_store.delete(previous_artifact.content.document_id)
         return {
-            "artifacts": [new_artifact],
+            "artifacts": {"search": new_artifact},
+            "iteration": state["iteration"] + 1,
         }
 
     # 評価を実行するメソッド
     def _run_evaluate(self, state: AgentState) -> dict:
-        refined_query = state["refined_query"]
+        task = state["task"]
         # 直近の検索結果を取得
         artifacts = state["artifacts"]
         relative_artifact = retrieve_last_artifact(artifacts, "search")
         # 検索結果のコンテンツを取得
         documents = relative_artifact.content.documents
         # 検索結果のコンテンツを評価
-        score = evaluate(query=refined_query, tavily_result=documents)
-        judge = "CORRECT" if score > 0.6 else "INCORRECT"
+        scores = evaluate(task=task, tavily_result=documents)
+        score = sum(scores) / len(scores) if scores else 0.0
+        # これまでの検索結果と合わせてスコアの高いドキュメントを残し、プール全体で十分かを判定
+        document_pool = merge_document_pool(state["document_pool"], documents, scores)
+        # 置き換えたプールのドキュメントはドキュメントストアから削除する
+        if state["document_pool"]:
+            document_store.delete(state["document_pool"].document_id)
+        judge = "CORRECT" if document_pool.average_score > SCORE_THRESHOLD else "INCORRECT"
 
         # 評価結果を成果物として追加
         new_artifact = Artifact(
@@ -197,21 +323,26 @@ class ResearchGraph:
             content=EvaluationContent(score=score, judge=judge),
         )
         return {
-            "artifacts": [new_artifact],
+            "artifacts": {"evaluate": new_artifact},
+            "document_pool": document_pool,
         }
 
-    # 書き込みを実行するメソッド
+    # 書き込みを実行するメソッド（ドキュメントプールのスコアの高いドキュメントのみを使用する）
     def _run_write(self, state: AgentState) -> dict:
         task = state["task"]
-        artifacts = state["artifacts"]
-        relative_artifact = retrieve_last_artifact(artifacts, "search")
-        report = write(task, relative_artifact.content.documents)
+        report = write(task, str(state["document_pool"]))
+        # レポートを作成したため、検索結果とプールのドキュメントをドキュメントストアから削除する
+        search_artifact = retrieve_last_artifact(state["artifacts"], "search")
+        document_store.delete(
+            state["document_pool"].document_id,
+            *([search_artifact.content.document_id] if search_artifact else []),
+        )
         new_artifact = Artifact(
             action="write",
             content=report
         )
         return {
-            "artifacts": [new_artifact]
+            "artifacts": {"write": new_artifact}
         }
 
     # ルーティングを実行するメソッド
@@ -220,6 +351,9 @@ class ResearchGraph:
         relative_artifact = retrieve_last_artifact(artifacts, "evaluate")
         if relative_artifact.content.judge == "CORRECT":
             return "write"
+        # 最大回数に達した場合は、それまでに集めたドキュメントでレポートを作成する
+        elif state["iteration"] >= state["max_iterations"]:
+            return "write"
         else:
             return "query_refine"
 
@@ -233,15 +367,22 @@ def main():
     # コマンドライン引数のパーサーを作成
     parser = argparse.ArgumentParser(description='Process some queries.')
     parser.add_argument('--task', type=str, required=True, help='The query to search')
+    parser.add_argument('--preload', type=str, choices=['sync', 'background', 'none'], default='background',
+                        help='How to preload the reranker model')
+    parser.add_argument('--max-iterations', type=int, default=MAX_ITERATIONS,
+                        help='The maximum number of search iterations')
 
     # コマンドライン引数を解析
     args = parser.parse_args()
 
-    graph = ResearchGraph()
+    graph = ResearchGraph(preload=args.preload)
     task = args.task
     initial_state = {
         "task": task,
-        "artifacts": [],
+        "artifacts": {},
+        "document_pool": None,
+        "iteration": 0,
+        "max_iterations": args.max_iterations,
     }
 
     print("processing...\n\n")
@@ -258,7 +399,7 @@ def main():
                 print(value)
         print("\n---\n")
     print("## final output ##")
-    print(value["artifacts"][-1].content)
+    print(value["artifacts"]["write"].content)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,255 @@
+import os
+import argparse
+import hashlib
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from functools import lru_cache
+from typing import TYPE_CHECKING
+from langchain_core.pydantic_v1 import BaseModel
+
+# sentence-transformers（torch）の読み込みには時間がかかるため、モデルの読み込み時にインポートする
+if TYPE_CHECKING:
+    from sentence_transformers import CrossEncoder
+
+# 定数の定義
+RERANKER_MODEL_NAME = "hotchpotch/japanese-reranker-cross-encoder-xsmall-v1"
+RERANKER_MAX_LENGTH = 512
+# 推論バックエンド（torch / onnx / onnx-int8）
+RERANKER_BACKEND = os.environ.get("RERANKER_BACKEND", "torch")
+# int8量子化したONNXモデルの保存先とファイル名（保存先は書き出しと読み込みで共通）
+RERANKER_ONNX_INT8_DIR = os.environ.get(
+    "RERANKER_ONNX_INT8_DIR", os.path.join(os.path.dirname(__file__), "models", "reranker-onnx-int8")
+)
+RERANKER_ONNX_INT8_CONFIG = "avx2"
+RERANKER_ONNX_INT8_FILE_NAME = f"onnx/model_qint8_{RERANKER_ONNX_INT8_CONFIG}.onnx"
+# 1回の推論にまとめる（クエリ, ドキュメント）ペアの最大数
+RERANKER_MAX_BATCH_SIZE = 32
+# バッチに他のリクエストを相乗りさせるために待つ最大時間（秒）
+RERANKER_MAX_WAIT = 0.01
+# スコアのキャッシュに保持する（クエリ, ドキュメント）ペアの最大数
+RERANKER_CACHE_SIZE = 10000
+# 1回のスコアリングを待つ最大時間（秒、モデルの読み込み時間を含む）
+RERANKER_TIMEOUT = float(os.environ.get("RERANKER_TIMEOUT", "120"))
+
+
+# スコアリング結果を表すデータクラス
+class RerankResult(BaseModel):
+    scores: list[float]
+    cache_hits: int
+    latency_ms: float
+
+    def __str__(self):
+        return f"{len(self.scores)}件 (キャッシュ {self.cache_hits}件) {self.latency_ms:.1f}ms"
+
+
+# int8量子化したONNXモデルを書き出す関数
+def export_int8_model(model_name: str = RERANKER_MODEL_NAME, output_dir: str = RERANKER_ONNX_INT8_DIR) -> str:
+    from sentence_transformers import CrossEncoder, export_dynamic_quantized_onnx_model
+
+    cross_encoder = CrossEncoder(model_name, max_length=RERANKER_MAX_LENGTH, backend="onnx")
+    cross_encoder.save_pretrained(output_dir)
+    export_dynamic_quantized_onnx_model(
+        cross_encoder,
+        quantization_config=RERANKER_ONNX_INT8_CONFIG,
+        model_name_or_path=output_dir,
+    )
+    return os.path.join(output_dir, RERANKER_ONNX_INT8_FILE_NAME)
+
+
+# 指定したバックエンドでCross Encoderを読み込む関数
+def load_cross_encoder(model_name: str = RERANKER_MODEL_NAME, backend: str = RERANKER_BACKEND) -> "CrossEncoder":
+    from sentence_transformers import CrossEncoder
+
+    if backend == "torch":
+        return CrossEncoder(model_name, max_length=RERANKER_MAX_LENGTH)
+    if backend == "onnx":
+        return CrossEncoder(model_name, max_length=RERANKER_MAX_LENGTH, backend="onnx")
+    if backend == "onnx-int8":
+        # 量子化済みのモデルがなければ書き出してから読み込む
+        if not os.path.exists(os.path.join(RERANKER_ONNX_INT8_DIR, RERANKER_ONNX_INT8_FILE_NAME)):
+            export_int8_model(model_name, RERANKER_ONNX_INT8_DIR)
+        return CrossEncoder(
+            RERANKER_ONNX_INT8_DIR,
+            max_length=RERANKER_MAX_LENGTH,
+            backend="onnx",
+            model_kwargs={"file_name": RERANKER_ONNX_INT8_FILE_NAME},
+        )
+    raise ValueError(f"未対応のバックエンドです: {backend}")
+
+
+# バッチ処理待ちのリクエスト
+class _ScoreRequest:
+    def __init__(self, pairs: list[tuple[str, str]]):
+        self.pairs = pairs
+        self.future: Future = Future()
+
+
+# Cross Encoderによる関連度スコアの算出をまとめて行うサービス
+# 同時に実行されている複数のグラフからのリクエストを1回の推論にまとめ、
+# 算出済みの（クエリ, ドキュメントの内容のハッシュ）の組のスコアはキャッシュから返す
+class RerankerService:
+    def __init__(
+            self,
+            model_name: str = RERANKER_MODEL_NAME,
+            backend: str = RERANKER_BACKEND,
+            max_batch_size: int = RERANKER_MAX_BATCH_SIZE,
+            max_wait: float = RERANKER_MAX_WAIT,
+            cache_size: int = RERANKER_CACHE_SIZE,
+            timeout: float = RERANKER_TIMEOUT,
+    ):
+        self._model_name = model_name
+        self._backend = backend
+        self._max_batch_size = max_batch_size
+        self._max_wait = max_wait
+        self._cache_size = cache_size
+        self._timeout = timeout
+        self._cache: OrderedDict[tuple[str, str], float] = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._model: "CrossEncoder | None" = None
+        self._model_lock = threading.Lock()
+        self._queue: queue.Queue[_ScoreRequest] = queue.Queue()
+        self._worker: threading.Thread | None = None
+        self._worker_lock = threading.Lock()
+        self._ensure_worker()
+
+    # ワーカースレッドが停止していれば起動し直すメソッド
+    def _ensure_worker(self):
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run_batches, name="reranker", daemon=True)
+                self._worker.start()
+
+    # Cross Encoderのモデル（初回アクセス時に読み込む）
+    @property
+    def model(self) -> "CrossEncoder":
+        with self._model_lock:
+            if self._model is None:
+                self._model = load_cross_encoder(self._model_name, self._backend)
+            return self._model
+
+    # モデルの読み込みと初回推論を事前に済ませておくメソッド（backgroundの場合は別スレッドで実行する）
+    def warmup(self, background: bool = False) -> threading.Thread | None:
+        if background:
+            thread = threading.Thread(target=self._warmup, name="reranker-warmup", daemon=True)
+            thread.start()
+            return thread
+        self._warmup()
+        return None
+
+    def _warmup(self):
+        try:
+            # トークナイザーと推論セッションの初期化を済ませるため、ダミーの入力で1回推論する
+            self.model.predict([("warmup", "warmup")], show_progress_bar=False)
+        except Exception as e:
+            print(f"リランカーのウォームアップに失敗しました: {e}")
+
+    # クエリと各ドキュメントの関連度スコアを算出するメソッド
+    def score(self, query: str, documents: list[str]) -> RerankResult:
+        started = time.perf_counter()
+        keys = [(query, hashlib.sha256(document.encode()).hexdigest()) for document in documents]
+
+        scores: dict[tuple[str, str], float] = {}
+        with self._cache_lock:
+            for key in keys:
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    scores[key] = self._cache[key]
+        cache_hits = sum(1 for key in keys if key in scores)
+
+        # キャッシュにないドキュメントのみ推論する（同じ内容のドキュメントは1回だけ）
+        missing = {}
+        for key, document in zip(keys, documents):
+            if key not in scores:
+                missing.setdefault(key, document)
+        if missing:
+            request = _ScoreRequest([(query, document) for document in missing.values()])
+            self._ensure_worker()
+            self._queue.put(request)
+            try:
+                results = request.future.result(timeout=self._timeout)
+            except FutureTimeoutError:
+                # ワーカーが応答しない場合は、他のグラフを巻き込まないようリクエストを破棄して中断する
+                request.future.cancel()
+                raise TimeoutError(f"リランカーの応答が{self._timeout}秒以内にありませんでした")
+            new_scores = dict(zip(missing.keys(), results))
+            scores.update(new_scores)
+            self._store(new_scores)
+
+        return RerankResult(
+            scores=[scores[key] for key in keys],
+            cache_hits=cache_hits,
+            latency_ms=(time.perf_counter() - started) * 1000,
+        )
+
+    # 算出したスコアをキャッシュに保存するメソッド
+    def _store(self, scores: dict[tuple[str, str], float]):
+        with self._cache_lock:
+            self._cache.update(scores)
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+
+    # キューに溜まったリクエストをまとめて推論するワーカー
+    def _run_batches(self):
+        while True:
+            batch = [self._queue.get()]
+            batch_size = len(batch[0].pairs)
+            deadline = time.perf_counter() + self._max_wait
+            while batch_size < self._max_batch_size:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    request = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                batch.append(request)
+                batch_size += len(request.pairs)
+
+            # タイムアウトで破棄されたリクエストは推論しない
+            batch = [request for request in batch if request.future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            pairs = [pair for request in batch for pair in request.pairs]
+            try:
+                predictions = self.model.predict(
+                    pairs, batch_size=self._max_batch_size, show_progress_bar=False
+                )
+            except Exception as e:
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+
+            offset = 0
+            for request in batch:
+                request.future.set_result(
+                    [float(score) for score in predictions[offset:offset + len(request.pairs)]]
+                )
+                offset += len(request.pairs)
+
+
+# アプリケーション共通のリランカーを取得する関数
+@lru_cache
+def get_reranker() -> RerankerService:
+    return RerankerService()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Manage the reranker model.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    export_parser = subparsers.add_parser('export', help='Export the int8 quantized ONNX model')
+    export_parser.add_argument('--model', type=str, default=RERANKER_MODEL_NAME, help='The model to export')
+
+    args = parser.parse_args()
+
+    if args.command == 'export':
+        # 読み込み時と同じ保存先に書き出す（保存先は環境変数RERANKER_ONNX_INT8_DIRで変更する）
+        path = export_int8_model(args.model, RERANKER_ONNX_INT8_DIR)
+        print(f"量子化したモデルを書き出しました: {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -33,11 +33,26 @@ class Settings(BaseSettings):
 settings = Settings()
 
 
-# プロンプトファイルを読み込む関数
+# 読み込んだプロンプトのキャッシュ
+_prompt_cache: dict[str, tuple[float, str]] = {}
+
+
+# プロンプトファイルを読み込む関数（ファイルが更新されるまではキャッシュを返す）
 def load_prompt(name: str) -> str:
     prompt_path = os.path.join(os.path.dirname(__file__), "prompts", f"{name}.prompt")
-    with open(prompt_path, "r") as f:
-        return f.read()
+    mtime = os.path.getmtime(prompt_path)
+    cached = _prompt_cache.get(prompt_path)
+    if cached is None or cached[0] != mtime:
+        with open(prompt_path, "r") as f:
+            cached = (mtime, f.read())
+        _prompt_cache[prompt_path] = cached
+    return cached[1]
+
+
+# LLMクライアントを取得する関数（同じ設定のクライアントは使い回す）
+@lru_cache
+def chat_model(model: str, temperature: float) -> ChatOpenAI:
+    return ChatOpenAI(model=model, temperature=temperature)
 
 
 # エージェントを実行する関数
@@ -52,13 +67,26 @@ def run_streaming_agent(agent: Runnable, user_task: str) -> str:
     return final_output
 
 
-# 検索結果をサマリするためのチェイン
-def summarize_search_chain() -> Runnable:
-    llm = ChatOpenAI(model=settings.FAST_LLM_MODEL_NAME, temperature=0.0)
+# 検索結果をサマリするためのチェイン（プロンプトの内容ごとに構築済みのチェインを再利用する）
+@lru_cache
+def summarize_search_chain(system: str) -> Runnable:
+    llm = chat_model(settings.FAST_LLM_MODEL_NAME, 0.0)
     prompt = ChatPromptTemplate.from_messages(
         [("system", "{system}"), ("user", "{query}")]
     ).partial(
-        system=load_prompt("summarize_search_system"),
+        system=system,
+    )
+    return prompt | llm | StrOutputParser()
+
+
+# システムプロンプトとユーザーの入力からなるチェイン（プロンプトの内容ごとに構築済みのチェインを再利用する）
+@lru_cache
+def system_user_chain(system: str) -> Runnable:
+    llm = chat_model(settings.LLM_MODEL_NAME, 0.0)
+    prompt = ChatPromptTemplate.from_messages(
+        [("system", "{system}"), ("user", "{user}")]
+    ).partial(
+        system=system,
     )
     return prompt | llm | StrOutputParser()
 
@@ -88,7 +116,7 @@ def search(query: str) -> str:
             }
         )
     # 検索結果をそれぞれ要約する
-    summarize_results = summarize_search_chain().batch(queries)
+    summarize_results = summarize_search_chain(load_prompt("summarize_search_system")).batch(queries)
     # 各要約結果にsourceタグを追加
     xml_results = []
     for result in summarize_results:
@@ -101,37 +129,23 @@ def search(query: str) -> str:
 @tool
 def report_writer(user_requirement: str, source: str) -> str:
     """Generate reports based on user requests and sources of information gathered through searches."""
-    llm = ChatOpenAI(model=settings.LLM_MODEL_NAME, temperature=0.0)
     user_prompt = f"ユーザーからの要求: {user_requirement}\n情報源: {source}\n必ず情報源を基にユーザーからの要求を満たすレポートを生成してください。"
-    prompt = ChatPromptTemplate.from_messages(
-        [("system", "{system}"), ("user", "{user}")]
-    ).partial(
-        system=load_prompt("report_writer_system"),
-        user=user_prompt,
-    )
-    chain = prompt | llm | StrOutputParser()
-    return chain.invoke({})
+    chain = system_user_chain(load_prompt("report_writer_system"))
+    return chain.invoke({"user": user_prompt})
 
 
 # 成果物の内容がユーザー要求に対して十分かどうかをチェックするツール
 @tool
 def sufficiency_check(user_requirement: str, result: str) -> str:
     """Determine whether the answers generated adequately answer the question."""
-    llm = ChatOpenAI(model=settings.LLM_MODEL_NAME, temperature=0.0)
     user_prompt = f"ユーザーからの要求: {user_requirement}\n生成結果: {result}\n十分かどうかを判断してください。"
-    prompt = ChatPromptTemplate.from_messages(
-        [("system", "{system}"), ("user", "{user}")]
-    ).partial(
-        system=load_prompt("sufficiency_classifier_system"),
-        user=user_prompt,
-    )
-    chain = prompt | llm | StrOutputParser()
-    return chain.invoke({})
+    chain = system_user_chain(load_prompt("sufficiency_classifier_system"))
+    return chain.invoke({"user": user_prompt})
 
 
 # エージェントを作成する関数
 def multi_step_agent():
-    llm = ChatOpenAI(model=settings.LLM_MODEL_NAME, temperature=0.0)
+    llm = chat_model(settings.LLM_MODEL_NAME, 0.0)
     # ツールとして検索、レポート生成、十分性チェックを指定
     tools = [search, report_writer, sufficiency_check]
     return create_react_agent(
@@ -2,13 +2,12 @@ from operator import add
 from typing import Annotated, Any, Literal, Optional
 
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.pydantic_v1 import BaseModel, Field
 from langchain_openai import ChatOpenAI
 from langgraph.graph import END, StateGraph
 from multi_step_approach import create_multi_step_agent
 from single_step_approach import create_single_step_agent
-from utility import load_prompt, run_invoke_agent
+from utility import chat_model, chat_prompt_template, load_prompt, run_invoke_agent
 
 
 class Artifact(BaseModel):
@@ -60,8 +59,8 @@ class AdaptiveRagAgent:
 
     def _run_method_classifier(self, state: AgentState) -> dict[str, Any]:
         """メソッド分類器を実行する"""
-        prompt = ChatPromptTemplate.from_messages(
-            [("system", load_prompt("method_classifier_system")), ("user", "{query}")]
+        prompt = chat_prompt_template(
+            ("system", load_prompt("method_classifier_system")), ("user", "{query}")
         )
         chain = prompt | self.llm | StrOutputParser()
         method = chain.invoke({"query": state.task})
@@ -69,8 +68,8 @@ class AdaptiveRagAgent:
 
     def _run_non_retrieval_qa(self, state: AgentState) -> dict[str, Any]:
         """非検索型QAを実行する"""
-        prompt = ChatPromptTemplate.from_messages(
-            [("system", load_prompt("non_retrieval_qa_system")), ("user", "{query}")]
+        prompt = chat_prompt_template(
+            ("system", load_prompt("non_retrieval_qa_system")), ("user", "{query}")
         )
         chain = prompt | self.llm | StrOutputParser()
         result = chain.invoke({"query": state.task})
@@ -119,7 +118,7 @@ def main():
     parser.add_argument("--task", type=str, required=True, help="実行するタスク")
     args = parser.parse_args()
 
-    llm = ChatOpenAI(model=settings.LLM_MODEL_NAME, temperature=0.0)
+    llm = chat_model(settings.LLM_MODEL_NAME, 0.0)
     research_graph = AdaptiveRagAgent(llm=llm)
     research_graph.stream(args.task)
 
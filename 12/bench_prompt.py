@@ -0,0 +1,58 @@
+import os
+import time
+import timeit
+
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_openai import ChatOpenAI
+from utility import chat_model, chat_prompt_template, load_prompt
+
+# LLMへのリクエストは送信しないため、APIキーが未設定の場合はダミーの値を使用する
+os.environ.setdefault("OPENAI_API_KEY", "dummy")
+
+PROMPT_DIR = os.path.join(os.path.dirname(__file__), "prompts")
+MODEL_NAME = "gpt-4o-2024-05-13"
+
+
+# キャッシュを使わずにプロンプトの読み込み・テンプレートの構築・クライアントの生成を行う（従来の処理）
+def build_uncached(name: str):
+    with open(os.path.join(PROMPT_DIR, f"{name}.prompt"), "r") as f:
+        system = f.read()
+    prompt = ChatPromptTemplate.from_messages([("system", system), ("user", "{query}")])
+    llm = ChatOpenAI(model=MODEL_NAME, temperature=0.0)
+    return prompt, llm
+
+
+# キャッシュを使ってプロンプトの読み込み・テンプレートの構築・クライアントの取得を行う
+def build_cached(name: str):
+    prompt = chat_prompt_template(("system", load_prompt(name)), ("user", "{query}"))
+    llm = chat_model(MODEL_NAME, 0.0)
+    return prompt, llm
+
+
+# 1回あたりの処理時間（マイクロ秒）を計測する関数
+def measure(func, name: str, number: int) -> float:
+    return min(timeit.repeat(lambda: func(name), number=number, repeat=3)) / number * 1_000_000
+
+
+def main():
+    import argparse
+
+    # コマンドライン引数のパーサーを作成
+    parser = argparse.ArgumentParser(description="プロンプトの読み込みとクライアント生成のオーバーヘッドを計測します")
+    parser.add_argument("--number", type=int, default=200, help="1回の計測での呼び出し回数")
+    args = parser.parse_args()
+
+    names = sorted(os.path.splitext(file)[0] for file in os.listdir(PROMPT_DIR) if file.endswith(".prompt"))
+
+    print(f"{'prompt':<32}{'従来(us)':>12}{'キャッシュ(us)':>16}{'削減(us)':>12}")
+    for name in names:
+        started = time.perf_counter()
+        build_cached(name)
+        first = (time.perf_counter() - started) * 1_000_000
+        uncached = measure(build_uncached, name, args.number)
+        cached = measure(build_cached, name, args.number)
+        print(f"{name:<32}{uncached:>12,.1f}{cached:>16,.1f}{uncached - cached:>12,.1f}  (初回 {first:,.1f}us)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,7 @@
 from langchain_openai import ChatOpenAI
 from langgraph.prebuilt import create_react_agent
 from tools import report_writer, search, sufficiency_check
-from utility import load_prompt, run_streaming_agent
+from utility import chat_model, load_prompt, run_streaming_agent
 
 
 def create_multi_step_agent(llm: ChatOpenAI):
@@ -25,7 +25,7 @@ def main():
     # コマンドライン引数を解析
     args = parser.parse_args()
 
-    llm = ChatOpenAI(model=settings.LLM_MODEL_NAME, temperature=0.0)
+    llm = chat_model(settings.LLM_MODEL_NAME, 0.0)
     inputs = {"messages": [("user", args.task)]}
     agent = create_multi_step_agent(llm=llm)
     final_output = run_streaming_agent(agent, inputs)
@@ -2,13 +2,11 @@ import os
 from functools import lru_cache
 
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.runnables import Runnable
 from langchain_core.tools import tool
-from langchain_openai import ChatOpenAI
 from settings import Settings
 from tavily import TavilyClient
-from utility import load_prompt
+from utility import chat_model, chat_prompt_template, load_prompt
 
 TAVILY_MAX_RESULTS = 5
 
@@ -21,12 +19,22 @@ def tavily_client() -> TavilyClient:
     return TavilyClient(api_key=os.environ["TAVILY_API_KEY"])
 
 
-def summarize_search_chain() -> Runnable:
-    llm = ChatOpenAI(model=settings.FAST_LLM_MODEL_NAME, temperature=0.0)
-    prompt = ChatPromptTemplate.from_messages(
-        [("system", "{system}"), ("user", "{query}")]
-    ).partial(
-        system=load_prompt("summarize_search_system"),
+# 検索結果をサマリするためのチェイン（プロンプトの内容ごとに構築済みのチェインを再利用する）
+@lru_cache
+def summarize_search_chain(system: str) -> Runnable:
+    llm = chat_model(settings.FAST_LLM_MODEL_NAME, 0.0)
+    prompt = chat_prompt_template(("system", "{system}"), ("user", "{query}")).partial(
+        system=system,
+    )
+    return prompt | llm | StrOutputParser()
+
+
+# システムプロンプトとユーザーの入力からなるチェイン（プロンプトの内容ごとに構築済みのチェインを再利用する）
+@lru_cache
+def system_user_chain(system: str) -> Runnable:
+    llm = chat_model(settings.LLM_MODEL_NAME, 0.0)
+    prompt = chat_prompt_template(("system", "{system}"), ("user", "{user}")).partial(
+        system=system,
     )
     return prompt | llm | StrOutputParser()
 
@@ -48,7 +56,9 @@ def search(query: str) -> str:
                 "query": f"<source>\ntitle: {document['title']}\nurl: {document['url']}\ncontent: {document['raw_content']}\n</source>"
             }
         )
-    summarize_results = summarize_search_chain().batch(queries)
+    summarize_results = summarize_search_chain(
+        load_prompt("summarize_search_system")
+    ).batch(queries)
     xml_results = []
     for result in summarize_results:
         xml_result = "<source>{}</source>".format(result)
@@ -60,29 +70,15 @@ def search(query: str) -> str:
 @tool
 def sufficiency_check(user_requirement: str, result: str) -> str:
     """Determine whether the answers generated adequately answer the question."""
-    llm = ChatOpenAI(model=settings.LLM_MODEL_NAME, temperature=0.0)
     user_prompt = f"ユーザーからの要求: {user_requirement}\n生成結果: {result}\n十分かどうかを判断してください。"
-    prompt = ChatPromptTemplate.from_messages(
-        [("system", "{system}"), ("user", "{user}")]
-    ).partial(
-        system=load_prompt("sufficiency_classifier_system"),
-        user=user_prompt,
-    )
-    chain = prompt | llm | StrOutputParser()
-    return chain.invoke({})
+    chain = system_user_chain(load_prompt("sufficiency_classifier_system"))
+    return chain.invoke({"user": user_prompt})
 
 
 # レポートを生成するツール
 @tool
 def report_writer(user_requirement: str, source: str) -> str:
     """Generate reports based on user requests and sources of information gathered through searches."""
-    llm = ChatOpenAI(model=settings.LLM_MODEL_NAME, temperature=0.0)
     user_prompt = f"ユーザーからの要求: {user_requirement}\n情報源: {source}\n必ず情報源を基にユーザーからの要求を満たすレポートを生成してください。"
-    prompt = ChatPromptTemplate.from_messages(
-        [("system", "{system}"), ("user", "{user}")]
-    ).partial(
-        system=load_prompt("report_writer_system"),
-        user=user_prompt,
-    )
-    chain = prompt | llm | StrOutputParser()
-    return chain.invoke({})
+    chain = system_user_chain(load_prompt("report_writer_system"))
+    return chain.invoke({"user": user_prompt})
@@ -1,14 +1,37 @@
 import os
+from functools import lru_cache
 from typing import Any
 
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_openai import ChatOpenAI
 from langgraph.graph.graph import CompiledGraph
 
+# 読み込んだプロンプトのキャッシュ
+_prompt_cache: dict[str, tuple[float, str]] = {}
 
-# プロンプトファイルを読み込む関数
+
+# プロンプトファイルを読み込む関数（ファイルが更新されるまではキャッシュを返す）
 def load_prompt(name: str) -> str:
     prompt_path = os.path.join(os.path.dirname(__file__), "prompts", f"{name}.prompt")
-    with open(prompt_path, "r") as f:
-        return f.read()
+    mtime = os.path.getmtime(prompt_path)
+    cached = _prompt_cache.get(prompt_path)
+    if cached is None or cached[0] != mtime:
+        with open(prompt_path, "r") as f:
+            cached = (mtime, f.read())
+        _prompt_cache[prompt_path] = cached
+    return cached[1]
+
+
+# プロンプトテンプレートを取得する関数（同じ内容のテンプレートは構築済みのものを再利用する）
+@lru_cache
+def chat_prompt_template(*messages: tuple[str, str]) -> ChatPromptTemplate:
+    return ChatPromptTemplate.from_messages(list(messages))
+
+
+# LLMクライアントを取得する関数（同じ設定のクライアントは使い回す）
+@lru_cache
+def chat_model(model: str, temperature: float) -> ChatOpenAI:
+    return ChatOpenAI(model=model, temperature=temperature)
 
 
 # stream関数でエージェントを呼び出し、実行結果を逐次表示する
@@ -0,0 +1,84 @@
+"""
+MCPサーバーのコールドスタート時間を計測するベンチマーク
+
+新しいプロセスで src.mcp_servers.server をimportする時間と、
+stdioでサーバーを起動してからinitializeが完了するまでの時間を計測し、
+予算（秒）を超えた場合は終了コード1で終了します。
+
+実行方法:
+    uv run -m src.mcp_servers.bench_startup --runs 5 --budget 2.0
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from mcp.client.session import ClientSession
+from mcp.client.stdio import StdioServerParameters, stdio_client
+
+SERVER_MODULE = "src.mcp_servers.server"
+
+
+def measure_import_time() -> float:
+    """新しいPythonプロセスでサーバーモジュールのimportにかかる時間を計測します"""
+    code = (
+        "import time; started = time.perf_counter(); "
+        f"import {SERVER_MODULE}; "
+        "print(time.perf_counter() - started)"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    return float(output.stdout.strip().splitlines()[-1])
+
+
+async def measure_handshake_time() -> float:
+    """stdioでサーバーを起動し、initializeが完了するまでの時間を計測します"""
+    server_params = StdioServerParameters(
+        command=sys.executable, args=["-m", SERVER_MODULE], env=dict(os.environ)
+    )
+    started = time.perf_counter()
+    async with stdio_client(server_params) as (read, write):
+        async with ClientSession(read, write) as session:
+            await session.initialize()
+            return time.perf_counter() - started
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="MCPサーバーの起動時間を計測")
+    parser.add_argument("--runs", type=int, default=5, help="計測回数")
+    parser.add_argument(
+        "--budget",
+        type=float,
+        default=2.0,
+        help="initialize完了までの時間の予算（秒、中央値で判定）",
+    )
+    args = parser.parse_args()
+
+    import_times = [measure_import_time() for _ in range(args.runs)]
+    handshake_times = [
+        asyncio.run(measure_handshake_time()) for _ in range(args.runs)
+    ]
+
+    import_median = statistics.median(import_times)
+    handshake_median = statistics.median(handshake_times)
+    print(f"import時間         : 中央値 {import_median:.3f}秒 (最大 {max(import_times):.3f}秒)")
+    print(
+        f"initialize完了まで : 中央値 {handshake_median:.3f}秒 "
+        f"(最大 {max(handshake_times):.3f}秒)"
+    )
+
+    if handshake_median > args.budget:
+        print(f"予算 {args.budget:.3f}秒 を超えています", file=sys.stderr)
+        return 1
+
+    print(f"予算 {args.budget:.3f}秒 以内です")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
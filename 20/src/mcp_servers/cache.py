@@ -0,0 +1,56 @@
+import os
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict
+
+import src.mcp_servers.database as db
+
+# キャッシュを有効とみなす経過秒数（環境変数CACHE_TTL_SECONDSで変更可能、0で無効）
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", "3600"))
+
+# 実行中のリクエスト（同一キーの同時リクエストは1回のAPI呼び出しにまとめる）
+_inflight: Dict[str, Future] = {}
+_inflight_lock = threading.Lock()
+
+
+def fetch_with_cache(cache_key: str, fetch: Callable[[], Any]) -> Any:
+    """
+    キャッシュを参照し、なければfetchを呼び出して結果をキャッシュします。
+    同じキーのリクエストが実行中の場合は、その結果を待って共有します。
+
+    引数:
+        cache_key: リクエストを識別するキー
+        fetch: キャッシュがない場合に呼び出す関数（JSONに変換可能な値を返す）
+
+    返値:
+        キャッシュまたはfetchから得たレスポンス
+    """
+    if CACHE_TTL_SECONDS <= 0:
+        return fetch()
+
+    cached = db.get_cached_response(cache_key, CACHE_TTL_SECONDS)
+    if cached is not None:
+        return cached
+
+    with _inflight_lock:
+        future = _inflight.get(cache_key)
+        is_owner = future is None
+        if is_owner:
+            future = Future()
+            _inflight[cache_key] = future
+
+    # 他のリクエストが取得中であれば、その結果を待つ
+    if not is_owner:
+        return future.result()
+
+    try:
+        response = fetch()
+        db.save_cached_response(cache_key, response, CACHE_TTL_SECONDS)
+        future.set_result(response)
+        return response
+    except Exception as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(cache_key, None)
@@ -1,53 +1,376 @@
+import base64
 import datetime
+import hashlib
+import json
+import logging
 import os
+import re
 import sqlite3
-from typing import Any, Dict
+import threading
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
 
 # SQLiteデータベースの永続化設定（環境変数DB_PATHが指定されていなければ "data.db" を使用）
 DB_PATH = os.getenv("DB_PATH", "data.db")
 
+# 1回のツール呼び出しで返す結果の上限（行数・JSONのバイト数）
+MAX_PAGE_ROWS = int(os.getenv("MAX_PAGE_ROWS", "50"))
+MAX_PAGE_BYTES = int(os.getenv("MAX_PAGE_BYTES", "32000"))
+# 1つの値（本文など）として返す最大文字数
+MAX_VALUE_LENGTH = 2_000
+# fetchmanyで一度に読み込む行数
+FETCH_BATCH_SIZE = 20
 
-def get_connection():
-    """データベース接続を取得します"""
+# LLMが生成したSELECTクエリに対する制限
+# インデックスを使わずに走査する行数の上限（結合時は各テーブルの行数の積）
+MAX_SCAN_ROWS = int(os.getenv("MAX_SCAN_ROWS", "100000"))
+# クエリの実行時間の上限（秒）
+QUERY_TIMEOUT_SECONDS = float(os.getenv("QUERY_TIMEOUT_SECONDS", "5.0"))
+# 実行計画とともにログ出力する低速クエリの閾値（秒）
+SLOW_QUERY_SECONDS = float(os.getenv("SLOW_QUERY_SECONDS", "1.0"))
+
+# スキーマのバージョン（テーブル構成を変更した場合はインクリメントする）
+SCHEMA_VERSION = 1
+
+# スキーマの初期化が完了したDBファイルのパス
+_initialized_paths: Set[str] = set()
+_init_lock = threading.Lock()
+
+# MCPのstdioトランスポートは標準出力を使用するため、ログは標準エラー出力に書き出す
+logger = logging.getLogger(__name__)
+
+
+def _connect() -> sqlite3.Connection:
     conn = sqlite3.connect(DB_PATH)
     conn.row_factory = sqlite3.Row
     return conn
 
 
-def init_database():
-    """データベースの初期化と必要なテーブル・インデックスの作成を行います"""
-    with get_connection() as conn:
-        # search_resultsテーブルの作成
-        conn.execute(
-            """
-        CREATE TABLE IF NOT EXISTS search_results (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            query TEXT NOT NULL,                     -- 検索クエリ
-            source_url TEXT,                         -- 情報ソースURL
-            title TEXT,                              -- コンテンツタイトル
-            content TEXT,                            -- 抽出したコンテンツ
-            summary TEXT,                            -- LLMが生成した要約
-            content_type TEXT,                       -- 情報タイプ (ニュース/技術文書など)
-            tags TEXT,                               -- タグ (カンマ区切り)
-            reliability_score FLOAT,                 -- 信頼性スコア (0-1)
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-        );
-        """
-        )
+def get_connection():
+    """データベース接続を取得します（初回接続時にスキーマを初期化します）"""
+    if DB_PATH not in _initialized_paths:
+        init_database()
+    return _connect()
 
-        # インデックスの作成
-        conn.execute(
-            "CREATE INDEX IF NOT EXISTS index_search_results_on_query ON search_results(query);"
-        )
-        conn.execute(
-            "CREATE INDEX IF NOT EXISTS index_search_results_on_source_url ON search_results(source_url);"
-        )
-        conn.execute(
-            "CREATE INDEX IF NOT EXISTS index_search_results_on_content_type ON search_results(content_type);"
-        )
-        conn.execute(
-            "CREATE INDEX IF NOT EXISTS index_search_results_on_created_at ON search_results(created_at);"
+
+def _encode_cursor(offset: int, fingerprint: str) -> str:
+    """続きを取得するためのカーソル（継続トークン）を生成します"""
+    payload = json.dumps({"offset": offset, "fp": fingerprint})
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def _decode_cursor(cursor: str, fingerprint: str) -> int:
+    """カーソルを検証し、次に読み込むオフセットを返します"""
+    if not cursor:
+        return 0
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        offset = int(payload["offset"])
+    except Exception:
+        raise ValueError("不正なカーソルです。")
+    if payload.get("fp") != fingerprint or offset < 0:
+        raise ValueError("カーソルが別のクエリのものです。")
+    return offset
+
+
+def _fingerprint(*parts: Any) -> str:
+    """カーソルとクエリの対応を確認するためのハッシュ値を生成します"""
+    return hashlib.sha256(repr(parts).encode()).hexdigest()[:16]
+
+
+def _truncate_row(row: sqlite3.Row) -> Dict[str, Any]:
+    """長いテキストを切り詰めた辞書に変換します"""
+    result = {}
+    for key in row.keys():
+        value = row[key]
+        if isinstance(value, str) and len(value) > MAX_VALUE_LENGTH:
+            value = value[:MAX_VALUE_LENGTH] + "..."
+        elif isinstance(value, bytes):
+            value = f"<BLOB {len(value)} bytes>"
+        result[key] = value
+    return result
+
+
+def _fetch_page(cur: sqlite3.Cursor, page_size: int) -> Tuple[List[Dict], bool]:
+    """
+    カーソルから行数・バイト数の上限に達するまで結果を読み込みます。
+    クエリは page_size + 1 件を上限に実行しておくことで、続きの有無を判定します。
+
+    返値:
+        (結果のリスト, 続きがあるかどうか)
+    """
+    results: List[Dict] = []
+    total_bytes = 0
+    while True:
+        rows = cur.fetchmany(FETCH_BATCH_SIZE)
+        if not rows:
+            return results, False
+        for row in rows:
+            if len(results) >= page_size:
+                return results, True
+            item = _truncate_row(row)
+            size = len(json.dumps(item, ensure_ascii=False, default=str).encode())
+            # 少なくとも1件は返すことで、ページングが必ず前に進むようにする
+            if results and total_bytes + size > MAX_PAGE_BYTES:
+                return results, True
+            results.append(item)
+            total_bytes += size
+
+
+def _explain_query_plan(
+    conn: sqlite3.Connection, sql: str, params: Tuple = ()
+) -> List[str]:
+    """EXPLAIN QUERY PLANを実行し、実行計画の各ステップの説明を返します"""
+    cur = conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+    return [row[3] for row in cur.fetchall()]
+
+
+def _estimate_table_rows(conn: sqlite3.Connection) -> Dict[str, int]:
+    """各テーブルのおおよその行数を返します（rowidの最大値で近似）"""
+    estimates = {}
+    cur = conn.execute(
+        "SELECT name FROM sqlite_master WHERE type='table' "
+        "AND sql NOT LIKE 'CREATE VIRTUAL%' AND name NOT LIKE 'search_results_fts_%';"
+    )
+    for (table,) in cur.fetchall():
+        try:
+            row = conn.execute(f'SELECT MAX(rowid) FROM "{table}"').fetchone()
+            estimates[table] = row[0] or 0
+        except sqlite3.Error:
+            estimates[table] = 0
+    return estimates
+
+
+# LIMIT句（LIMIT n OFFSET m / LIMIT m, n）
+_LIMIT_PATTERN = re.compile(
+    r"\bLIMIT\s+(\d+)(?:\s+OFFSET\s+(\d+)|\s*,\s*(\d+))?\s*$", re.IGNORECASE
+)
+# 走査を途中で打ち切れない（全行を読む必要がある）句と集約関数
+_FULL_READ_PATTERN = re.compile(
+    r"\b(WHERE|GROUP\s+BY|HAVING|DISTINCT|JOIN|UNION|INTERSECT|EXCEPT"
+    r"|COUNT|SUM|AVG|MIN|MAX|TOTAL|GROUP_CONCAT)\b",
+    re.IGNORECASE,
+)
+
+
+def _query_row_limit(query: str) -> Optional[int]:
+    """クエリ末尾のLIMIT句から、読み込む行数の上限（LIMIT + OFFSET）を返します"""
+    match = _LIMIT_PATTERN.search(query)
+    if not match:
+        return None
+    if match.group(3) is not None:
+        # LIMIT m, n の形式（mがOFFSET）
+        return int(match.group(1)) + int(match.group(3))
+    return int(match.group(1)) + int(match.group(2) or 0)
+
+
+def _resolve_table_name(name: str, query: str, tables: Dict[str, int]) -> Optional[str]:
+    """実行計画に現れた名前（テーブル名または別名）から実際のテーブル名を返します"""
+    if name in tables:
+        return name
+    alias = re.search(
+        rf'(?:FROM|JOIN|,)\s+"?(\w+)"?\s+(?:AS\s+)?"?{re.escape(name)}"?\b',
+        query,
+        re.IGNORECASE,
+    )
+    if alias and alias.group(1) in tables:
+        return alias.group(1)
+    return None
+
+
+def _check_query_plan(
+    plan: List[str],
+    conn: sqlite3.Connection,
+    query: str = "",
+    row_limit: Optional[int] = None,
+) -> str:
+    """
+    実行計画を検査し、インデックスを使わない走査が上限を超える場合はその理由を返します。
+    問題がなければ空文字列を返します。
+
+    引数:
+        plan: EXPLAIN QUERY PLANの各ステップの説明
+        conn: データベース接続
+        query: 検査するクエリ（別名の解決とLIMIT句の判定に使用）
+        row_limit: 呼び出し側で付与するLIMITによって読み込む行数の上限
+    """
+    # CTEやサブクエリの結果の走査は、その内側の走査として計上済み
+    materialized = {
+        detail.split()[1] for detail in plan if detail.startswith("MATERIALIZE ")
+    }
+
+    # インデックスを使わないテーブル全体の走査（"SCAN <テーブル>"）のみを計上する
+    # （"USING [COVERING] INDEX" はインデックスの走査、"SEARCH" はインデックス検索）
+    scanned_names = []
+    for detail in plan:
+        if not detail.startswith("SCAN ") or " USING " in detail:
+            continue
+        name = detail.split()[1]
+        if (
+            detail == "SCAN CONSTANT ROW"
+            or name.startswith("(")
+            or name == "VIRTUAL"
+            or name in materialized
+        ):
+            continue
+        scanned_names.append(name)
+    if not scanned_names:
+        return ""
+
+    estimates = _estimate_table_rows(conn)
+    # テーブル名が特定できない場合は最大のテーブルとみなす
+    largest = max(estimates.values(), default=0)
+    scans = [
+        estimates.get(_resolve_table_name(name, query, estimates) or "", largest)
+        for name in scanned_names
+    ]
+
+    # 単一テーブルを絞り込み・並べ替え・集約なしで走査する場合は、LIMITの行数で打ち切られる
+    if (
+        len(scans) == 1
+        and not any("TEMP B-TREE" in detail for detail in plan)
+        and not _FULL_READ_PATTERN.search(query)
+    ):
+        limits = [limit for limit in (_query_row_limit(query), row_limit) if limit is not None]
+        if limits:
+            scans[0] = min(scans[0], *limits)
+
+    scanned_rows = 1
+    for rows in scans:
+        scanned_rows *= max(rows, 1)
+
+    if scanned_rows > MAX_SCAN_ROWS:
+        return (
+            f"インデックスを使わない走査が多すぎます（推定 {scanned_rows:,} 行, "
+            f"上限 {MAX_SCAN_ROWS:,} 行）。"
+            "インデックスのある列（query, source_url, content_type, created_at）で絞り込むか、"
+            "search_knowledgeツールによる全文検索を利用してください。"
         )
+    return ""
+
+
+def _set_deadline(conn: sqlite3.Connection, seconds: float) -> None:
+    """指定した秒数を超えたクエリを中断するプログレスハンドラを設定します"""
+    deadline = time.monotonic() + seconds
+    conn.set_progress_handler(lambda: int(time.monotonic() > deadline), 10_000)
+
+
+def init_database():
+    """
+    データベースの初期化と必要なテーブル・インデックスの作成を行います。
+    スキーマのバージョンをPRAGMA user_versionで管理し、DBファイルごとに一度だけ実行します。
+    """
+    with _init_lock:
+        if DB_PATH in _initialized_paths:
+            return
+
+        with _connect() as conn:
+            version = conn.execute("PRAGMA user_version;").fetchone()[0]
+            if version < SCHEMA_VERSION:
+                # 複数のクライアントから同時に読み書きできるようWALモードを使用
+                conn.execute("PRAGMA journal_mode=WAL;")
+
+                # search_resultsテーブルの作成
+                conn.execute(
+                    """
+                CREATE TABLE IF NOT EXISTS search_results (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    query TEXT NOT NULL,                     -- 検索クエリ
+                    source_url TEXT,                         -- 情報ソースURL
+                    title TEXT,                              -- コンテンツタイトル
+                    content TEXT,                            -- 抽出したコンテンツ
+                    summary TEXT,                            -- LLMが生成した要約
+                    content_type TEXT,                       -- 情報タイプ (ニュース/技術文書など)
+                    tags TEXT,                               -- タグ (カンマ区切り)
+                    reliability_score FLOAT,                 -- 信頼性スコア (0-1)
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                );
+                """
+                )
+
+                # インデックスの作成
+                conn.execute(
+                    "CREATE INDEX IF NOT EXISTS index_search_results_on_query ON search_results(query);"
+                )
+                conn.execute(
+                    "CREATE INDEX IF NOT EXISTS index_search_results_on_source_url ON search_results(source_url);"
+                )
+                conn.execute(
+                    "CREATE INDEX IF NOT EXISTS index_search_results_on_content_type ON search_results(content_type);"
+                )
+                conn.execute(
+                    "CREATE INDEX IF NOT EXISTS index_search_results_on_created_at ON search_results(created_at);"
+                )
+
+                # 全文検索用のFTS5仮想テーブルの作成（日本語に対応するためtrigramトークナイザを使用）
+                fts_exists = conn.execute(
+                    "SELECT 1 FROM sqlite_master WHERE type='table' AND name='search_results_fts';"
+                ).fetchone()
+                conn.execute(
+                    """
+                CREATE VIRTUAL TABLE IF NOT EXISTS search_results_fts USING fts5(
+                    title,
+                    content,
+                    summary,
+                    tags,
+                    content='search_results',
+                    content_rowid='id',
+                    tokenize='trigram'
+                );
+                """
+                )
+
+                # search_resultsテーブルとFTS5テーブルを同期させるトリガーの作成
+                conn.execute(
+                    """
+                CREATE TRIGGER IF NOT EXISTS search_results_after_insert AFTER INSERT ON search_results BEGIN
+                    INSERT INTO search_results_fts(rowid, title, content, summary, tags)
+                    VALUES (new.id, new.title, new.content, new.summary, new.tags);
+                END;
+                """
+                )
+                conn.execute(
+                    """
+                CREATE TRIGGER IF NOT EXISTS search_results_after_delete AFTER DELETE ON search_results BEGIN
+                    INSERT INTO search_results_fts(search_results_fts, rowid, title, content, summary, tags)
+                    VALUES ('delete', old.id, old.title, old.content, old.summary, old.tags);
+                END;
+                """
+                )
+                conn.execute(
+                    """
+                CREATE TRIGGER IF NOT EXISTS search_results_after_update AFTER UPDATE ON search_results BEGIN
+                    INSERT INTO search_results_fts(search_results_fts, rowid, title, content, summary, tags)
+                    VALUES ('delete', old.id, old.title, old.content, old.summary, old.tags);
+                    INSERT INTO search_results_fts(rowid, title, content, summary, tags)
+                    VALUES (new.id, new.title, new.content, new.summary, new.tags);
+                END;
+                """
+                )
+
+                # 外部API（Tavily）のレスポンスキャッシュ用テーブルの作成
+                conn.execute(
+                    """
+                CREATE TABLE IF NOT EXISTS api_cache (
+                    cache_key TEXT PRIMARY KEY,              -- リクエストを識別するキー
+                    response TEXT NOT NULL,                  -- レスポンス（JSON）
+                    created_at REAL NOT NULL                 -- 取得時刻（UNIX時間）
+                );
+                """
+                )
+                conn.execute(
+                    "CREATE INDEX IF NOT EXISTS index_api_cache_on_created_at ON api_cache(created_at);"
+                )
+
+                # FTS5テーブルを新規作成した場合は既存データからインデックスを構築
+                if not fts_exists:
+                    conn.execute(
+                        "INSERT INTO search_results_fts(search_results_fts) VALUES ('rebuild');"
+                    )
+
+                conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION};")
+
+        _initialized_paths.add(DB_PATH)
 
 
 def save_search_result(
@@ -136,20 +459,25 @@ def save_search_result(
 
 
 def get_recent_results(
-    days: int = 7, limit: int = 10, content_type: str = ""
+    days: int = 7, limit: int = 10, content_type: str = "", cursor: str = ""
 ) -> Dict[str, Any]:
     """
     指定された日数以内の最近の検索結果を取得します。
 
     引数:
         days: 何日前までの検索結果を取得するか (デフォルト: 7)
-        limit: 返す結果の最大数 (デフォルト: 10)
+        limit: 1ページで返す結果の最大数 (デフォルト: 10)
         content_type: 特定のコンテンツタイプでフィルタリング (オプション)
+        cursor: 前回の結果で返された続きを取得するためのカーソル (オプション)
 
     返値:
-        {"success": bool, "message": str, "results": List[Dict]}
+        {"success": bool, "message": str, "results": List[Dict], "next_cursor": str}
     """
     try:
+        fingerprint = _fingerprint("recent", days, content_type)
+        offset = _decode_cursor(cursor, fingerprint)
+        page_size = max(1, min(limit, MAX_PAGE_ROWS))
+
         # days日前の日付を計算
         date_threshold = (
             datetime.datetime.now() - datetime.timedelta(days=days)
@@ -169,18 +497,120 @@ def get_recent_results(
             params.append(content_type)
 
         # 信頼性スコアの高い順にソート
-        sql += " ORDER BY reliability_score DESC, created_at DESC LIMIT ?"
-        params.append(str(limit))  # intをstrに変換
+        sql += " ORDER BY reliability_score DESC, created_at DESC, id DESC LIMIT ? OFFSET ?"
+        params.extend([str(page_size + 1), str(offset)])  # intをstrに変換
 
         with get_connection() as conn:
             cur = conn.cursor()
             cur.execute(sql, params)
+            results, has_more = _fetch_page(cur, page_size)
+
+            if not results:
+                return {
+                    "success": True,
+                    "message": "指定された期間内の検索結果は見つかりませんでした。",
+                    "results": [],
+                    "next_cursor": "",
+                }
+
+            next_cursor = (
+                _encode_cursor(offset + len(results), fingerprint) if has_more else ""
+            )
+            return {
+                "success": True,
+                "message": f"{len(results)}件の検索結果が見つかりました。",
+                "results": results,
+                "next_cursor": next_cursor,
+            }
+
+    except Exception as e:
+        return {
+            "success": False,
+            "message": f"検索結果取得エラー: {e}",
+            "results": [],
+            "next_cursor": "",
+        }
+
+
+def _like_pattern(term: str) -> str:
+    """LIKEの部分一致パターンを生成します（ワイルドカード文字はエスケープ）"""
+    return "%" + re.sub(r"([\\%_])", r"\\\1", term) + "%"
+
+
+def search_knowledge(query: str, limit: int = 10) -> Dict[str, Any]:
+    """
+    保存済みの検索結果（タイトル・本文・要約・タグ）を全文検索し、関連度の高い順に返します。
+    空白区切りで複数のキーワードを指定した場合は、すべてのキーワードを含む結果を返します。
+    trigramトークナイザでは3文字未満のキーワードを検索できないため、
+    3文字未満のキーワードはLIKEによる部分一致で絞り込みます（3文字未満のキーワードのみの場合は新しい順に返します）。
+
+    引数:
+        query: 検索キーワード（空白区切りで複数指定可）
+        limit: 返す結果の最大数 (デフォルト: 10)
+
+    返値:
+        {"success": bool, "message": str, "results": List[Dict]}
+    """
+    keyword = query.strip()
+    terms = keyword.split()
+    if not terms:
+        return {
+            "success": False,
+            "message": "エラー: 検索キーワードを指定してください。",
+            "results": [],
+        }
+
+    # FTS5の検索構文として解釈されないよう、各キーワードをフレーズとしてエスケープしてANDで結合
+    fts_terms = [term for term in terms if len(term) >= 3]
+    match_expr = " AND ".join('"' + term.replace('"', '""') + '"' for term in fts_terms)
+
+    # 3文字未満のキーワードはいずれかの列に部分一致するものに絞り込む
+    like_terms = [term for term in terms if len(term) < 3]
+    like_conditions = [
+        "(s.title LIKE ? ESCAPE '\\' OR s.content LIKE ? ESCAPE '\\' "
+        "OR s.summary LIKE ? ESCAPE '\\' OR s.tags LIKE ? ESCAPE '\\')"
+    ] * len(like_terms)
+    like_params = [_like_pattern(term) for term in like_terms for _ in range(4)]
+
+    try:
+        with get_connection() as conn:
+            cur = conn.cursor()
+            if fts_terms:
+                where = " AND ".join(["search_results_fts MATCH ?", *like_conditions])
+                cur.execute(
+                    f"""
+            SELECT s.id, s.query, s.source_url, s.title, s.content_type, s.tags,
+                s.reliability_score, s.created_at,
+                snippet(search_results_fts, -1, '[', ']', '...', 32) AS snippet,
+                bm25(search_results_fts) AS score
+            FROM search_results_fts
+            JOIN search_results AS s ON s.id = search_results_fts.rowid
+            WHERE {where}
+            ORDER BY score
+            LIMIT ?
+            """,
+                    (match_expr, *like_params, limit),
+                )
+            else:
+                cur.execute(
+                    f"""
+            SELECT s.id, s.query, s.source_url, s.title, s.content_type, s.tags,
+                s.reliability_score, s.created_at,
+                substr(s.content, 1, 64) AS snippet,
+                NULL AS score
+            FROM search_results AS s
+            WHERE {" AND ".join(like_conditions)}
+            ORDER BY s.created_at DESC, s.id DESC
+            LIMIT ?
+            """,
+                    (*like_params, limit),
+                )
             rows = cur.fetchall()
 
             if not rows:
                 return {
                     "success": True,
-                    "message": "指定された期間内の検索結果は見つかりませんでした。",
+                    "message": f"「{keyword}」に一致する検索結果は見つかりませんでした。",
                     "results": [],
                 }
 
@@ -192,7 +622,53 @@ def get_recent_results(
             }
 
     except Exception as e:
-        return {"success": False, "message": f"検索結果取得エラー: {e}", "results": []}
+        return {"success": False, "message": f"全文検索エラー: {e}", "results": []}
+
+
+def get_cached_response(cache_key: str, max_age_seconds: float) -> Optional[Any]:
+    """
+    キャッシュされたAPIレスポンスを取得します。
+
+    引数:
+        cache_key: リクエストを識別するキー
+        max_age_seconds: キャッシュを有効とみなす経過秒数
+
+    返値:
+        キャッシュされたレスポンス（存在しないか古い場合はNone）
+    """
+    try:
+        with get_connection() as conn:
+            row = conn.execute(
+                "SELECT response FROM api_cache WHERE cache_key = ? AND created_at >= ?",
+                (cache_key, time.time() - max_age_seconds),
+            ).fetchone()
+            return json.loads(row["response"]) if row else None
+    except Exception as e:
+        logger.warning("キャッシュ取得エラー: %s", e)
+        return None
+
+
+def save_cached_response(cache_key: str, response: Any, max_age_seconds: float) -> None:
+    """
+    APIレスポンスをキャッシュに保存し、有効期限切れのエントリを削除します。
+
+    引数:
+        cache_key: リクエストを識別するキー
+        response: JSONに変換可能なレスポンス
+        max_age_seconds: キャッシュを有効とみなす経過秒数
+    """
+    now = time.time()
+    try:
+        with get_connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO api_cache (cache_key, response, created_at) VALUES (?, ?, ?)",
+                (cache_key, json.dumps(response, ensure_ascii=False), now),
+            )
+            conn.execute(
+                "DELETE FROM api_cache WHERE created_at < ?", (now - max_age_seconds,)
+            )
+    except Exception as e:
+        logger.warning("キャッシュ保存エラー: %s", e)
 
 
 def get_content_by_id(result_id: int) -> Dict[str, Any]:
@@ -294,7 +770,11 @@ def get_schema() -> Dict[str, Any]:
         schema_info = ""
         with get_connection() as conn:
             cur = conn.cursor()
-            cur.execute("SELECT name FROM sqlite_master WHERE type='table';")
+            # FTS5の内部テーブル（シャドウテーブル）とAPIキャッシュは除外
+            cur.execute(
+                "SELECT name FROM sqlite_master WHERE type='table' "
+                "AND name NOT LIKE 'search_results_fts_%' AND name != 'api_cache';"
+            )
             tables = [row[0] for row in cur.fetchall()]
 
             for table in tables:
@@ -315,39 +795,96 @@ def get_schema() -> Dict[str, Any]:
         return {"success": False, "message": f"スキーマ取得エラー: {e}", "schema": ""}
 
 
-def execute_select_query(query: str) -> Dict[str, Any]:
+def execute_select_query(query: str, cursor: str = "") -> Dict[str, Any]:
     """
     SQLiteデータベースに対してSELECTクエリを実行し、結果を返します。
+    結果は行数・バイト数の上限ごとに分割され、続きはカーソルを指定して取得します。
 
     引数:
         query: 実行するSELECTクエリ
+        cursor: 前回の結果で返された続きを取得するためのカーソル (オプション)
 
     返値:
-        {"success": bool, "message": str, "results": List[Dict]}
+        {"success": bool, "message": str, "results": List[Dict], "next_cursor": str}
     """
     if not query.strip().lower().startswith("select"):
         return {
             "success": False,
             "message": "Error: SELECT文のみ許可されています。",
             "results": [],
+            "next_cursor": "",
         }
 
+    # 末尾のセミコロンを除去し、サーバー側でLIMIT/OFFSETを付与する
+    inner_query = query.strip().rstrip(";").strip()
+
     try:
+        fingerprint = _fingerprint("select", inner_query)
+        offset = _decode_cursor(cursor, fingerprint)
+
+        # 末尾が行コメント（-- ...）のクエリでも閉じ括弧がコメントにならないよう改行で囲む
+        sql = f"SELECT * FROM (\n{inner_query}\n) LIMIT ? OFFSET ?"
+        params = (MAX_PAGE_ROWS + 1, offset)
+
         with get_connection() as conn:
+            # 実行前に実行計画を検査し、負荷の高いクエリを拒否する
+            plan = _explain_query_plan(conn, sql, params)
+            rejection = _check_query_plan(plan, conn, inner_query, MAX_PAGE_ROWS + 1 + offset)
+            if rejection:
+                logger.warning(
+                    "クエリを拒否しました: %s\nplan: %s", inner_query, plan
+                )
+                return {
+                    "success": False,
+                    "message": f"Error: {rejection}",
+                    "results": [],
+                    "next_cursor": "",
+                }
+
+            started = time.monotonic()
+            _set_deadline(conn, QUERY_TIMEOUT_SECONDS)
             cur = conn.cursor()
-            cur.execute(query)
-            rows = cur.fetchall()
+            try:
+                cur.execute(sql, params)
+                results, has_more = _fetch_page(cur, MAX_PAGE_ROWS)
+            except sqlite3.OperationalError as e:
+                if "interrupted" not in str(e):
+                    raise
+                logger.warning(
+                    "タイムアウトしたクエリ: %s\nplan: %s", inner_query, plan
+                )
+                return {
+                    "success": False,
+                    "message": f"Error: クエリの実行が{QUERY_TIMEOUT_SECONDS}秒を超えたため中断しました。",
+                    "results": [],
+                    "next_cursor": "",
+                }
+            finally:
+                conn.set_progress_handler(None, 0)
 
-            results = [dict(row) for row in rows]
+            elapsed = time.monotonic() - started
+            if elapsed > SLOW_QUERY_SECONDS:
+                logger.warning(
+                    "低速クエリ (%.2f秒): %s\nplan: %s", elapsed, inner_query, plan
+                )
+
+            next_cursor = (
+                _encode_cursor(offset + len(results), fingerprint) if has_more else ""
+            )
+            message = f"{len(results)}件の結果が見つかりました。"
+            if has_more:
+                message += "続きの結果があります。"
             return {
                 "success": True,
-                "message": f"{len(results)}件の結果が見つかりました。",
+                "message": message,
                 "results": results,
+                "next_cursor": next_cursor,
             }
 
     except Exception as e:
-        return {"success": False, "message": f"SELECTエラー: {e}", "results": []}
-
-
-# 初期化処理
-init_database()
+        return {
+            "success": False,
+            "message": f"SELECTエラー: {e}",
+            "results": [],
+            "next_cursor": "",
+        }
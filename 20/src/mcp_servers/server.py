@@ -1,28 +1,54 @@
+import asyncio
+import functools
 import json
 import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
 
-from mcp.server.fastmcp import FastMCP
-from tavily import TavilyClient  # type: ignore
+from mcp.server.fastmcp import Context, FastMCP
 
 import src.mcp_servers.database as db
-
-print("MCPサーバーの初期化を開始します...")
+from src.mcp_servers.cache import fetch_with_cache
 
 # MCPサーバーの初期化
+# ※ stdioトランスポートでは標準出力がプロトコルに使われるため、ここでは何も出力しない
 mcp = FastMCP("knowledge-db-mcp-server")
 
-print("データベース操作ツールを登録します...")
+# 定数定義
+DEFAULT_HOST = "0.0.0.0"
+DEFAULT_PORT = 8000
+
+# ブロッキング処理（DBアクセス・外部API呼び出し）を実行するワーカースレッド数
+# HTTP/SSEで複数クライアントから同時に呼び出されても、イベントループを塞がないようにする
+MAX_WORKERS = int(os.getenv("MCP_MAX_WORKERS", "8"))
+executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+
+
+async def run_in_worker(func: Callable[..., Any], *args: Any) -> Any:
+    """ブロッキングな関数をワーカースレッドで実行します"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, functools.partial(func, *args))
+
 
 # --- ツール定義 ---
 
 # 1. Tavily APIを使ったWeb検索ツール
-TAVILY_API_KEY = os.getenv("TAVILY_API_KEY")
-tavily_client = TavilyClient(api_key=TAVILY_API_KEY)
+@functools.lru_cache(maxsize=1)
+def get_tavily_client() -> Any:
+    """Tavilyクライアントを初回利用時に生成して返します"""
+    from tavily import TavilyClient  # type: ignore
+
+    return TavilyClient(api_key=os.getenv("TAVILY_API_KEY"))
+
+
+# URL抽出時に1回のAPI呼び出しで処理するURL数と、同時に実行するAPI呼び出しの数
+EXTRACT_CHUNK_SIZE = 4
+EXTRACT_CONCURRENCY = 5
 
 
 @mcp.tool()
-def search_web(query: str, max_results: int = 5) -> str:
+async def search_web(query: str, max_results: int = 5) -> str:
     """
     Tavily APIを使用してWeb検索を行い、上位の結果を返します。
 
@@ -33,7 +59,12 @@ def search_web(query: str, max_results: int = 5) -> str:
     返値:
         検索結果のテキスト（各結果のタイトル・URL・スニペット）
     """
-    response = tavily_client.search(query, max_results=max_results)
+    # 同じクエリの検索結果はキャッシュから返す
+    response = await run_in_worker(
+        fetch_with_cache,
+        json.dumps(["search", query, max_results], ensure_ascii=False),
+        lambda: get_tavily_client().search(query, max_results=max_results),
+    )
     answer = response.get("answer")
     result_text = ""
     if answer:
@@ -54,9 +85,43 @@ def search_web(query: str, max_results: int = 5) -> str:
     return result_text.strip()
 
 
+def format_extract_result(
+    result: dict, include_images: bool, max_content_length: int
+) -> str:
+    """Tavily Extract APIの1件分の結果をテキストに整形します"""
+    url = result.get("url", "")
+    title = result.get("title", "(タイトルなし)")
+    raw_content = result.get("raw_content") or ""
+    images = result.get("images", [])
+
+    # コンテンツは長くなる可能性があるため、整形前に指定された最大文字数に切り詰める
+    content_preview = raw_content[:max_content_length]
+    if len(raw_content) > max_content_length:
+        content_preview += "..."
+
+    lines = [
+        f"URL: {url}",
+        f"タイトル: {title}",
+        f"コンテンツ: {content_preview}",
+    ]
+
+    if include_images and images:
+        lines.append(f"画像数: {len(images)}")
+        # 最初の3つの画像URLのみ表示
+        for i, img in enumerate(images[:3], start=1):
+            lines.append(f"  画像{i}: {img}")
+        if len(images) > 3:
+            lines.append(f"  他 {len(images) - 3} 枚の画像")
+
+    return "\n".join(lines)
+
+
 @mcp.tool()
-def extract_urls(
-    urls: list, include_images: bool = False, max_content_length: int = 5_000
+async def extract_urls(
+    urls: list,
+    ctx: Context,
+    include_images: bool = False,
+    max_content_length: int = 5_000,
 ) -> str:
     """
     指定されたURLリストの内容を抽出します。
@@ -74,44 +139,64 @@ def extract_urls(
     if len(urls) > 20:
         return "エラー: 一度に処理できるURLは最大20件までです。"
 
-    try:
-        response = tavily_client.extract(urls=urls, include_images=include_images)
-
-        result_text = ""
-        for result in response.get("results", []):
-            url = result.get("url", "")
-            title = result.get("title", "(タイトルなし)")
-            raw_content = result.get("raw_content", "")
-            images = result.get("images", [])
-
-            result_text += f"URL: {url}\n"
-            result_text += f"タイトル: {title}\n"
-
-            # コンテンツは長くなる可能性があるため、指定された最大文字数のみ表示
-            content_preview = (
-                raw_content[:max_content_length] + "..."
-                if len(raw_content) > max_content_length
-                else raw_content
-            )
-            result_text += f"コンテンツ: {content_preview}\n"
-
-            if include_images and images:
-                result_text += f"画像数: {len(images)}\n"
-                # 最初の3つの画像URLのみ表示
-                for i, img in enumerate(images[:3], start=1):
-                    result_text += f"  画像{i}: {img}\n"
-                if len(images) > 3:
-                    result_text += f"  他 {len(images) - 3} 枚の画像\n"
-
-            result_text += "\n---\n\n"
-
-        return result_text.strip()
-    except Exception as e:
-        return f"URLの内容抽出中にエラーが発生しました: {str(e)}"
+    # URLを複数のチャンクに分割し、同時実行数を制限しながら並行して抽出する
+    chunks = [
+        urls[i : i + EXTRACT_CHUNK_SIZE]
+        for i in range(0, len(urls), EXTRACT_CHUNK_SIZE)
+    ]
+    semaphore = asyncio.Semaphore(EXTRACT_CONCURRENCY)
+
+    async def extract_chunk(chunk: list) -> tuple:
+        async with semaphore:
+            try:
+                response = await run_in_worker(
+                    fetch_with_cache,
+                    json.dumps(
+                        ["extract", sorted(chunk), include_images], ensure_ascii=False
+                    ),
+                    lambda: get_tavily_client().extract(
+                        urls=chunk, include_images=include_images
+                    ),
+                )
+                return chunk, response, None
+            except Exception as e:
+                return chunk, None, e
+
+    sections: dict = {}
+    completed = 0
+    for finished in asyncio.as_completed([extract_chunk(c) for c in chunks]):
+        chunk, response, error = await finished
+        if error is not None:
+            for url in chunk:
+                sections[url] = (
+                    f"URL: {url}\nURLの内容抽出中にエラーが発生しました: {str(error)}"
+                )
+        else:
+            for result in response.get("results", []):
+                sections[result.get("url", "")] = format_extract_result(
+                    result, include_images, max_content_length
+                )
+            for failed in response.get("failed_results", []):
+                sections[failed.get("url", "")] = (
+                    f"URL: {failed.get('url', '')}\n"
+                    f"URLの内容抽出に失敗しました: {failed.get('error', '')}"
+                )
+
+        # 完了したURLから順に進捗と結果を通知する
+        completed += len(chunk)
+        await ctx.report_progress(completed, len(urls))
+        for url in chunk:
+            if url in sections:
+                await ctx.info(sections[url])
+
+    # 結果は指定されたURLの順に並べて返す
+    ordered = [sections.pop(url) for url in urls if url in sections]
+    ordered.extend(sections.values())  # リダイレクト等でURLが変わった結果
+    return "\n\n---\n\n".join(ordered)
 
 
 @mcp.tool()
-def save_search_result(
+async def save_search_result(
     query: str,
     url: str,
     title: str,
@@ -137,34 +222,80 @@ def save_search_result(
     返値:
         保存処理の結果メッセージ
     """
-    result = db.save_search_result(
-        query, url, title, content, content_type, summary, tags, reliability_score
+    result = await run_in_worker(
+        db.save_search_result,
+        query,
+        url,
+        title,
+        content,
+        content_type,
+        summary,
+        tags,
+        reliability_score,
     )
     return result["message"]
 
 
+def format_page(result: dict) -> str:
+    """ページングされた結果をJSON形式の文字列に変換し、続きがあればカーソルを付記します"""
+    result_text = json.dumps(result["results"], ensure_ascii=False, indent=2)
+    if result["next_cursor"]:
+        result_text += (
+            "\n\n続きの結果があります。"
+            f"続きを取得するには cursor=\"{result['next_cursor']}\" を指定してください。"
+        )
+    return result_text
+
+
 @mcp.tool()
-def get_recent_results(days: int = 7, limit: int = 10, content_type: str = "") -> str:
+async def get_recent_results(
+    days: int = 7, limit: int = 10, content_type: str = "", cursor: str = ""
+) -> str:
     """
     指定された日数以内の最近の検索結果を取得します。
 
     引数:
         days: 何日前までの検索結果を取得するか (デフォルト: 7)
-        limit: 返す結果の最大数 (デフォルト: 10)
+        limit: 1ページで返す結果の最大数 (デフォルト: 10)
         content_type: 特定のコンテンツタイプでフィルタリング (オプション)
+        cursor: 前回の結果で返された続きを取得するためのカーソル (オプション)
 
     返値:
         最近の検索結果とそのサマリー（JSON形式）
     """
-    result = db.get_recent_results(days, limit, content_type)
+    result = await run_in_worker(
+        db.get_recent_results, days, limit, content_type, cursor
+    )
     if not result["success"]:
         return result["message"]
 
+    return format_page(result)
+
+
+@mcp.tool()
+async def search_knowledge(query: str, limit: int = 10) -> str:
+    """
+    保存済みの検索結果（タイトル・本文・要約・タグ）を全文検索し、関連度の高い順に返します。
+    各結果には一致箇所の前後を抜き出したスニペットが含まれます。
+
+    引数:
+        query: 検索キーワード（空白区切りで複数指定した場合はすべてを含む結果を返します）
+        limit: 返す結果の最大数 (デフォルト: 10)
+
+    返値:
+        関連度順の検索結果とスニペット（JSON形式）
+    """
+    result = await run_in_worker(db.search_knowledge, query, limit)
+    if not result["success"]:
+        return result["message"]
+    if not result["results"]:
+        return result["message"]
+
     return json.dumps(result["results"], ensure_ascii=False, indent=2)
 
 
 @mcp.tool()
-def get_content_by_id(result_id: int) -> str:
+async def get_content_by_id(result_id: int) -> str:
     """
     特定IDの検索結果の詳細コンテンツを取得します。
 
@@ -174,7 +305,7 @@ def get_content_by_id(result_id: int) -> str:
     返値:
         検索結果の詳細（タイトル、URL、コンテンツなど）
     """
-    result = db.get_content_by_id(result_id)
+    result = await run_in_worker(db.get_content_by_id, result_id)
     if not result["success"]:
         return result["message"]
 
@@ -182,14 +313,14 @@ def get_content_by_id(result_id: int) -> str:
 
 
 @mcp.tool()
-def get_content_types() -> str:
+async def get_content_types() -> str:
     """
     データベースに保存されている全てのコンテンツタイプの一覧と各タイプの件数を返します。
 
     返値:
         コンテンツタイプとその件数の一覧（JSON形式）
     """
-    result = db.get_content_types()
+    result = await run_in_worker(db.get_content_types)
     if not result["success"]:
         return result["message"]
 
@@ -197,12 +328,12 @@ def get_content_types() -> str:
 
 
 @mcp.tool()
-def get_schema() -> str:
+async def get_schema() -> str:
     """
     SQLiteデータベースのスキーマ情報（テーブル名と各カラム）を返します。
     この情報は、LLMが適切なクエリを作成するためのヒントとして利用されます。
     """
-    result = db.get_schema()
+    result = await run_in_worker(db.get_schema)
     if not result["success"]:
         return result["message"]
 
@@ -210,27 +341,72 @@ def get_schema() -> str:
 
 
 @mcp.tool()
-def select_query(query: str) -> str:
+async def select_query(query: str, cursor: str = "") -> str:
     """
     SQLiteデータベースに対してSELECTクエリを実行し、結果を返します。
     例: "SELECT * FROM search_results WHERE content_type='ニュース' LIMIT 10;"
     ※SELECT文のみ許可されています。
+    ※結果が多い場合は分割して返されます。続きは同じクエリに cursor を指定して取得してください。
     """
-    result = db.execute_select_query(query)
+    result = await run_in_worker(db.execute_select_query, query, cursor)
     if not result["success"]:
         return result["message"]
 
-    return json.dumps(result["results"], ensure_ascii=False, indent=2)
+    return format_page(result)
+
+
+def start_server(
+    transport: str, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT
+) -> None:
+    """MCPサーバーを起動する
+
+    Args:
+        transport (str): 使用するトランスポートモード ('stdio', 'sse' または 'streamable-http')
+        host (str, optional): HTTPモード時のホスト名. デフォルトは DEFAULT_HOST
+        port (int, optional): HTTPモード時のポート番号. デフォルトは DEFAULT_PORT
+    """
+    if transport == "stdio":
+        mcp.run(transport="stdio")
+    elif transport in ("sse", "streamable-http"):
+        mcp.settings.host = host
+        mcp.settings.port = port
+        mcp.run(transport=transport)
+    else:
+        raise ValueError(f"不正なトランスポートモード: {transport}")
 
 
 if __name__ == "__main__":
+    import argparse
+
     from dotenv import load_dotenv
 
     load_dotenv()
 
-    print("MCPサーバーを起動します...")
+    parser = argparse.ArgumentParser(description="MCPサーバーの起動モードを指定")
+    parser.add_argument(
+        "--transport",
+        type=str,
+        choices=["stdio", "sse", "streamable-http"],
+        default="stdio",
+        help="使用するトランスポートモード (stdio, sse または streamable-http)",
+    )
+    parser.add_argument(
+        "--host",
+        type=str,
+        default=DEFAULT_HOST,
+        help="ホスト名",
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=DEFAULT_PORT,
+        help="ポート番号",
+    )
+    args = parser.parse_args()
+
+    print("MCPサーバーを起動します...", file=sys.stderr)
     try:
-        mcp.run(transport="stdio")
+        start_server(transport=args.transport, host=args.host, port=args.port)
     except Exception as e:
         print(f"サーバー実行中にエラーが発生しました: {e}", file=sys.stderr)
         sys.exit(1)
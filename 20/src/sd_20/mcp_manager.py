@@ -1,15 +1,51 @@
 import asyncio
+import atexit
 import json
 import os
 import sys
-from typing import Any, Dict, List, Optional, Tuple
+import threading
+from concurrent.futures import Future
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import (
+    Any,
+    AsyncIterator,
+    Coroutine,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+    TypeVar,
+    Union,
+)
 
 from langchain_core.tools.structured import StructuredTool
 from mcp.client.session import ClientSession
+from mcp.client.sse import sse_client
 from mcp.client.stdio import StdioServerParameters, stdio_client
+from mcp.client.streamable_http import streamablehttp_client
 from mcp.types import Tool as MCPTool
 
 
+@dataclass
+class HttpServerParameters:
+    """URLで接続するMCPサーバー（SSE / Streamable HTTP）のパラメータ"""
+
+    url: str
+    transport: str = "sse"
+
+
+ServerParameters = Union[StdioServerParameters, HttpServerParameters]
+
+T = TypeVar("T")
+
+# MCPサーバーとのセッションを保持するイベントループ（専用のスレッドで実行し続ける）
+_session_loop: Optional[asyncio.AbstractEventLoop] = None
+_session_loop_lock = threading.Lock()
+# 開いているサーバーとの接続（終了時に閉じる）
+_connections: List["MCPServerConnection"] = []
+
+
 def load_mcp_config(config_path="mcp_config.json") -> Dict[str, Any]:
     """JSON定義の読み込み"""
     print(f"設定ファイル '{config_path}' を読み込みます...")
@@ -19,14 +55,21 @@ def load_mcp_config(config_path="mcp_config.json") -> Dict[str, Any]:
 
 
 def get_available_servers(config: Dict[str, Any]) -> List[str]:
-    """設定ファイルから利用可能なサーバー名のリストを取得します"""
-    return list(config.get("mcpServers", {}).keys())
+    """設定ファイルから利用可能なサーバー名のリストを取得します（"disabled": true のサーバーは除く）"""
+    return [
+        server_name
+        for server_name, server_conf in config.get("mcpServers", {}).items()
+        if not server_conf.get("disabled", False)
+    ]
 
 
 def create_server_params(
     config: Dict[str, Any], server_name: Optional[str] = None
-) -> StdioServerParameters:
-    """指定されたサーバー名の設定から StdioServerParameters を作成します"""
+) -> ServerParameters:
+    """
+    指定されたサーバー名の設定からサーバーパラメータを作成します。
+    設定に "url" があれば HttpServerParameters、なければ StdioServerParameters を返します。
+    """
     available_servers = get_available_servers(config)
 
     if not available_servers:
@@ -40,6 +83,16 @@ def create_server_params(
 
     # 指定されたサーバーの設定を取得
     server_conf = config["mcpServers"][server_name]
+
+    # URLが指定されている場合は起動済みのサーバーにHTTPで接続する
+    if "url" in server_conf:
+        url = server_conf["url"]
+        transport = server_conf.get("transport", "sse")
+        if transport not in ("sse", "streamable-http"):
+            raise ValueError(f"不正なトランスポートモード: {transport}")
+        print(f"サーバー '{server_name}' の設定: url='{url}', transport='{transport}'")
+        return HttpServerParameters(url=url, transport=transport)
+
     command = server_conf["command"]
     args = server_conf["args"]
 
@@ -50,7 +103,7 @@ def create_server_params(
 
 def create_all_server_params(
     config: Dict[str, Any],
-) -> Dict[str, StdioServerParameters]:
+) -> Dict[str, ServerParameters]:
     """設定ファイルに定義されている全てのMCPサーバーのパラメータを作成"""
     servers = {}
     for server_name in get_available_servers(config):
@@ -61,6 +114,134 @@ def create_all_server_params(
     return servers
 
 
+@asynccontextmanager
+async def connect_server(
+    server_params: ServerParameters,
+) -> AsyncIterator[Tuple[Any, Any]]:
+    """サーバーパラメータに応じたトランスポートで接続し、(read, write) ストリームを返します"""
+    if isinstance(server_params, HttpServerParameters):
+        if server_params.transport == "streamable-http":
+            async with streamablehttp_client(server_params.url) as (read, write, _):
+                yield read, write
+        else:
+            async with sse_client(server_params.url) as (read, write):
+                yield read, write
+    else:
+        async with stdio_client(server_params) as (read, write):
+            yield read, write
+
+
+def _get_session_loop() -> asyncio.AbstractEventLoop:
+    """MCPサーバーとのセッションを保持するイベントループを返します（初回呼び出し時に起動）"""
+    global _session_loop
+    with _session_loop_lock:
+        if _session_loop is None:
+            _session_loop = asyncio.new_event_loop()
+            threading.Thread(
+                target=_session_loop.run_forever, name="mcp-sessions", daemon=True
+            ).start()
+        return _session_loop
+
+
+def run_in_session_loop(coro: Coroutine[Any, Any, T]) -> "Future[T]":
+    """セッションを保持するイベントループでコルーチンを実行します"""
+    return asyncio.run_coroutine_threadsafe(coro, _get_session_loop())
+
+
+class MCPServerConnection:
+    """
+    MCPサーバーとのセッションを開いたまま保持し、ツール呼び出しで使い回します。
+    ツール呼び出しのたびに接続（stdioの場合はサーバープロセスの起動）と
+    initializeを行わないよう、サーバーごとに1つのセッションを共有します。
+    セッションのメソッドは _get_session_loop() のイベントループ上で呼び出してください。
+    """
+
+    def __init__(
+        self, server_params: ServerParameters, server_name: Optional[str] = None
+    ):
+        self.server_params = server_params
+        self.server_name = server_name
+        self._session: Optional[ClientSession] = None
+        self._task: Optional["asyncio.Task[None]"] = None
+        self._closed: Optional[asyncio.Event] = None
+        self._lock = asyncio.Lock()
+
+    async def _hold_session(self, ready: "asyncio.Future[ClientSession]") -> None:
+        """
+        接続してセッションを開き、close() されるまで保持します。
+        トランスポートのコンテキストは開いたタスクで閉じる必要があるため、専用のタスクで実行します。
+        """
+        assert self._closed is not None
+        try:
+            async with connect_server(self.server_params) as (read, write):
+                async with ClientSession(read, write) as session:
+                    await session.initialize()
+                    self._session = session
+                    ready.set_result(session)
+                    await self._closed.wait()
+        except Exception as e:
+            if not ready.done():
+                ready.set_exception(e)
+            else:
+                print(f"サーバー '{self.server_name}' との接続が切断されました: {e}")
+        finally:
+            self._session = None
+
+    async def get_session(self) -> ClientSession:
+        """開いているセッションを返します（未接続・切断済みの場合は接続し直します）"""
+        async with self._lock:
+            if self._session is None:
+                self._closed = asyncio.Event()
+                ready: "asyncio.Future[ClientSession]" = (
+                    asyncio.get_running_loop().create_future()
+                )
+                self._task = asyncio.create_task(self._hold_session(ready))
+                await ready
+            assert self._session is not None
+            return self._session
+
+    async def call_tool(self, tool_name: str, arguments: Dict[str, Any]) -> Any:
+        """
+        ツールを呼び出します。通信に失敗した場合はセッションを閉じ、次の呼び出しで接続し直します
+        （ツールが実行済みの可能性があるため、失敗した呼び出しは再試行しません）。
+        """
+        session = await self.get_session()
+        try:
+            return await session.call_tool(tool_name, arguments=arguments)
+        except Exception:
+            await self.close()
+            raise
+
+    async def close(self) -> None:
+        """セッションを閉じて接続を切断します"""
+        if self._closed is not None:
+            self._closed.set()
+        if self._task is not None:
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+def close_all_connections(timeout: float = 5.0) -> None:
+    """開いているすべてのMCPサーバーとの接続を閉じます"""
+    if _session_loop is None or not _connections:
+        return
+
+    async def close_all() -> None:
+        await asyncio.gather(
+            *(connection.close() for connection in _connections), return_exceptions=True
+        )
+
+    try:
+        run_in_session_loop(close_all()).result(timeout=timeout)
+    except Exception as e:
+        print(f"MCPサーバーとの接続の切断に失敗しました: {e}")
+    _connections.clear()
+
+
+# 終了時にサーバーとの接続を閉じる（stdioの場合はサーバープロセスを終了させる）
+atexit.register(close_all_connections)
+
+
 def extract_tool_list(response: Any) -> List[Any]:
     """MCPサーバーのレスポンスからツールリストを抽出します"""
     if hasattr(response, "tools"):
@@ -88,32 +269,32 @@ async def create_langchain_tool(
     tool_desc: str,
     prefix: str,
     server_name: Optional[str],
-    server_params: StdioServerParameters,
+    connection: MCPServerConnection,
     tool_item: MCPTool,
 ) -> StructuredTool:
     """
     MCPツールをLangChainのStructuredToolとして生成
+    （ツール呼び出しはサーバーごとに保持しているセッションを使い回します）
     """
     # サーバー名をプレフィックスとしてツール名に追加（重複防止）
     full_tool_name = f"{prefix}{tool_name}"
     full_tool_desc = f"[{server_name}] {tool_desc}" if server_name else tool_desc
 
     try:
-        # 非同期の MCP 呼び出し関数を定義
+        # 非同期の MCP 呼び出し関数を定義（セッションを保持するイベントループで実行する）
         async def call_mcp_tool_async(**kwargs: Any) -> Any:
-            async with stdio_client(server_params) as (read, write):
-                async with ClientSession(read, write) as session:
-                    await session.initialize()
-                    result = await session.call_tool(tool_name, arguments=kwargs)
-                    return result
+            return await asyncio.wrap_future(
+                run_in_session_loop(connection.call_tool(tool_name, kwargs))
+            )
 
-        # 同期呼び出し用にラップする
+        # 同期呼び出し用の関数を定義する
         def tool_func(**kwargs: Any) -> Any:
-            return asyncio.run(call_mcp_tool_async(**kwargs))
+            return run_in_session_loop(connection.call_tool(tool_name, kwargs)).result()
 
         # StructuredToolを作成して返す
         return StructuredTool.from_function(
             func=tool_func,
+            coroutine=call_mcp_tool_async,
             name=full_tool_name,
             description=full_tool_desc,
             args_schema=tool_item.inputSchema,
@@ -137,57 +318,63 @@ async def get_mcp_tools(
 
 
 async def load_mcp_tools(
-    server_params: StdioServerParameters, server_name: Optional[str] = None
+    server_params: ServerParameters, server_name: Optional[str] = None
 ) -> List[StructuredTool]:
-    """指定したMCPサーバーからツールをロードします"""
+    """指定したMCPサーバーからツールをロードします（接続したセッションはツール呼び出しで使い回します）"""
     tools: List[StructuredTool] = []
     prefix = f"{server_name}__" if server_name else ""
+    connection = MCPServerConnection(server_params, server_name)
 
     print(f"サーバー '{server_name}' に接続しています...")
 
     try:
-        async with stdio_client(server_params) as (read, write):
-            print(f"サーバー '{server_name}' への接続が確立されました")
-
-            async with ClientSession(read, write) as session:
-                await session.initialize()
-                print(f"サーバー '{server_name}' のセッション初期化完了")
-
-                # MCPサーバーが提供するツール一覧を取得
-                tool_list = await get_mcp_tools(session, server_name)
-
-                # 各ツールを処理
-                processed_count = 0
-                for tool_item in tool_list:
-                    try:
-                        # ツール名と説明を取得
-                        tool_name, tool_desc = extract_tool_info(tool_item)
-
-                        if not tool_name:
-                            continue
-
-                        print(f"ツール処理中: {tool_name}")
-
-                        # StructuredToolを作成
-                        lc_tool = await create_langchain_tool(
-                            tool_name,
-                            tool_desc,
-                            prefix,
-                            server_name,
-                            server_params,
-                            tool_item,
-                        )
-                        tools.append(lc_tool)
-                        processed_count += 1
-                        print(f"ツール '{tool_name}' が正常に作成されました")
-                    except Exception as e:
-                        tool_name = getattr(tool_item, "name", str(tool_item))
-                        print(f"ツール '{tool_name}' の作成に失敗: {str(e)}")
-
-                print(f"処理したツール数: {processed_count}個")
+        session = await asyncio.wrap_future(
+            run_in_session_loop(connection.get_session())
+        )
+        print(f"サーバー '{server_name}' のセッション初期化完了")
+
+        # MCPサーバーが提供するツール一覧を取得
+        tool_list = await asyncio.wrap_future(
+            run_in_session_loop(get_mcp_tools(session, server_name))
+        )
+
+        # 各ツールを処理
+        processed_count = 0
+        for tool_item in tool_list:
+            try:
+                # ツール名と説明を取得
+                tool_name, tool_desc = extract_tool_info(tool_item)
+
+                if not tool_name:
+                    continue
+
+                print(f"ツール処理中: {tool_name}")
+
+                # StructuredToolを作成
+                lc_tool = await create_langchain_tool(
+                    tool_name,
+                    tool_desc,
+                    prefix,
+                    server_name,
+                    connection,
+                    tool_item,
+                )
+                tools.append(lc_tool)
+                processed_count += 1
+                print(f"ツール '{tool_name}' が正常に作成されました")
+            except Exception as e:
+                tool_name = getattr(tool_item, "name", str(tool_item))
+                print(f"ツール '{tool_name}' の作成に失敗: {str(e)}")
+
+        print(f"処理したツール数: {processed_count}個")
     except Exception as e:
         print(f"サーバー '{server_name}' との通信に失敗: {e}")
 
+    if tools:
+        _connections.append(connection)
+    else:
+        await asyncio.wrap_future(run_in_session_loop(connection.close()))
+
     return tools
 
 
@@ -1,43 +1,98 @@
-from typing import Annotated, Sequence
+from typing import Annotated, List, Optional, Sequence
 
-from langchain_core.messages import BaseMessage, trim_messages
+from langchain_core.messages import BaseMessage, RemoveMessage, SystemMessage
 from langchain_core.messages.utils import count_tokens_approximately
-from langgraph.graph.message import Messages, add_messages
+from langgraph.graph.message import REMOVE_ALL_MESSAGES, Messages, add_messages
 from langgraph.managed import IsLastStep, RemainingSteps
 from typing_extensions import TypedDict
 
 MAX_TOKENS = 128_000
 
+
+class TokenCountedMessages(List[BaseMessage]):
+    """合計トークン数を保持するメッセージ履歴（add_and_trim_messagesが返します）"""
+
+    total_tokens: int = 0
+
+
+def count_message_tokens(message: BaseMessage) -> int:
+    """メッセージ1件のトークン数を返します"""
+    return count_tokens_approximately([message])
+
+
+def _get_history_tokens(messages: Sequence[BaseMessage]) -> Optional[int]:
+    """履歴が保持している合計トークン数を返します（チェックポイントからの復元後などで保持していなければNone）"""
+    return getattr(messages, "total_tokens", None)
+
+
 def add_and_trim_messages(
     left_messages: Messages,
     right_messages: Messages
 ) -> Messages:
     """
     メッセージを結合した後、指定されたトークン数に基づいてトリムします。
+    結合前の履歴が保持している合計トークン数に、このステップで追加・置換・削除された
+    メッセージの分だけを加減するため、トークン数を計算するのは変更のあったメッセージと
+    トリムで削除するメッセージのみです。
 
     Args:
         left_messages: ベースとなるメッセージリスト
         right_messages: 追加するメッセージリスト
-        max_tokens: トリム後の最大トークン数
-        token_counter: トークン数をカウントするLLM
 
     Returns:
-        結合・トリムされたメッセージリスト
+        結合・トリムされたメッセージリスト（合計トークン数を保持する）
     """
-    # メッセージを結合
+    left = left_messages if isinstance(left_messages, list) else [left_messages]
+    right = right_messages if isinstance(right_messages, list) else [right_messages]
+    left_total = _get_history_tokens(left)
+
+    # メッセージを結合（変更のないメッセージは同じオブジェクトのまま引き継がれる）
     combined_messages = add_messages(left_messages, right_messages)
+    if not combined_messages:
+        return combined_messages
 
-    # メッセージをトリム
-    trimmed_messages = trim_messages(
-        combined_messages,
-        max_tokens=MAX_TOKENS,
-        token_counter=count_tokens_approximately,
-        strategy="last",  # 最新のメッセージを保持
-        include_system=True,  # システムメッセージを保持
+    remove_all = any(
+        isinstance(message, RemoveMessage) and message.id == REMOVE_ALL_MESSAGES
+        for message in right
     )
+    if left_total is None or remove_all:
+        # 合計を保持していない履歴（プロセスの再起動後など）と全削除後は一度だけ全体を計算する
+        total_tokens = sum(count_message_tokens(message) for message in combined_messages)
+    elif len(combined_messages) == len(left) + len(right):
+        # すべて末尾への追加の場合（通常のステップ）は、追加されたメッセージの分のみを足す
+        total_tokens = left_total + sum(
+            count_message_tokens(message) for message in combined_messages[len(left):]
+        )
+    else:
+        # 置換・削除を含む場合は、対象のIDのメッセージの分を引き、置換後と追加の分を足す
+        # （IDの照合のみで、変更のないメッセージのトークン数は計算しない）
+        changed_ids = {getattr(message, "id", None) for message in right} - {None}
+        left_ids = {message.id for message in left}
+        total_tokens = left_total
+        for message in left:
+            if message.id in changed_ids:
+                total_tokens -= count_message_tokens(message)
+        for message in combined_messages:
+            if message.id in changed_ids or message.id not in left_ids:
+                total_tokens += count_message_tokens(message)
 
+    # システムメッセージを保持したまま、上限以内になるまで古いメッセージから順に削除する
+    start = 1 if isinstance(combined_messages[0], SystemMessage) else 0
+    head = start
+    while head < len(combined_messages) and total_tokens > MAX_TOKENS:
+        total_tokens -= count_message_tokens(combined_messages[head])
+        head += 1
+
+    if head == start:
+        trimmed_messages = TokenCountedMessages(combined_messages)
+    else:
+        trimmed_messages = TokenCountedMessages(
+            combined_messages[:start] + combined_messages[head:]
+        )
+    trimmed_messages.total_tokens = total_tokens
     return trimmed_messages
 
+
 class CustomAgentState(TypedDict):
     messages: Annotated[Sequence[BaseMessage], add_and_trim_messages]
     is_last_step: IsLastStep
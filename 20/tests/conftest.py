@@ -0,0 +1,12 @@
+"""pytest共通フィクスチャ"""
+import pytest
+
+from src.mcp_servers import database
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    """テストごとに一時ディレクトリのSQLiteデータベースを使用する"""
+    path = str(tmp_path / "test.db")
+    monkeypatch.setattr(database, "DB_PATH", path)
+    return path
@@ -0,0 +1,156 @@
+"""mcp_servers.database のユニットテスト"""
+
+import pytest
+
+from src.mcp_servers import database
+
+
+def _save_results(count: int) -> None:
+    for i in range(count):
+        database.save_search_result(
+            query="テスト",
+            url=f"https://example.com/{i}",
+            title=f"タイトル{i}",
+            content=f"本文{i}",
+        )
+
+
+def test_execute_select_query_with_trailing_line_comment(db_path):
+    """末尾が行コメントのクエリでもLIMIT/OFFSETを付与して実行できる"""
+    result = database.execute_select_query("select 1 as value -- コメント")
+
+    assert result["success"], result["message"]
+    assert result["results"] == [{"value": 1}]
+    assert result["next_cursor"] == ""
+
+
+def test_execute_select_query_with_trailing_semicolon(db_path):
+    """末尾のセミコロンは除去して実行する"""
+    result = database.execute_select_query("SELECT 1 AS value;")
+
+    assert result["success"], result["message"]
+    assert result["results"] == [{"value": 1}]
+
+
+def test_execute_select_query_paginates_with_trailing_comment(db_path, monkeypatch):
+    """行コメント付きのクエリでもカーソルで続きの結果を取得できる"""
+    monkeypatch.setattr(database, "MAX_PAGE_ROWS", 2)
+    _save_results(3)
+    query = "SELECT title FROM search_results ORDER BY id -- 古い順"
+
+    first = database.execute_select_query(query)
+    assert first["success"], first["message"]
+    assert [row["title"] for row in first["results"]] == ["タイトル0", "タイトル1"]
+    assert first["next_cursor"]
+
+    second = database.execute_select_query(query, cursor=first["next_cursor"])
+    assert second["success"], second["message"]
+    assert [row["title"] for row in second["results"]] == ["タイトル2"]
+    assert second["next_cursor"] == ""
+
+
+def test_execute_select_query_rejects_non_select(db_path):
+    """SELECT以外のクエリは実行しない"""
+    result = database.execute_select_query("DELETE FROM search_results")
+
+    assert not result["success"]
+    assert "SELECT文のみ" in result["message"]
+
+
+def _insert_rows(count: int) -> None:
+    with database.get_connection() as conn:
+        conn.executemany(
+            "INSERT INTO search_results (query, source_url, title, content, created_at)"
+            " VALUES (?, ?, ?, ?, ?)",
+            [
+                ("テスト", f"https://example.com/{i}", f"タイトル{i}", f"本文{i}", f"2024-01-01 {i}")
+                for i in range(count)
+            ],
+        )
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        "SELECT 1",
+        "SELECT count(*) FROM search_results",
+        "SELECT * FROM search_results LIMIT 3",
+        "SELECT * FROM search_results LIMIT 3 OFFSET 10",
+        "SELECT title FROM search_results ORDER BY created_at DESC LIMIT 5",
+        "SELECT title FROM search_results WHERE id = 1",
+        "SELECT title FROM search_results WHERE query = 'テスト' LIMIT 5",
+        "SELECT title FROM (SELECT * FROM search_results ORDER BY created_at DESC LIMIT 5)",
+        "SELECT title FROM (WITH recent AS MATERIALIZED"
+        " (SELECT * FROM search_results ORDER BY created_at DESC LIMIT 5) SELECT * FROM recent)",
+    ],
+)
+def test_execute_select_query_allows_cheap_queries(db_path, monkeypatch, query):
+    """インデックスを使う走査や、LIMITで打ち切られる走査は拒否しない"""
+    monkeypatch.setattr(database, "MAX_SCAN_ROWS", 100)
+    _insert_rows(300)
+
+    result = database.execute_select_query(query)
+
+    assert result["success"], result["message"]
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        "SELECT title FROM search_results WHERE title LIKE '%1%'",
+        "SELECT s.title FROM search_results s WHERE s.content LIKE '%1%' LIMIT 3",
+        "SELECT title FROM search_results ORDER BY title LIMIT 3",
+        "SELECT sum(reliability_score) FROM search_results",
+        "SELECT a.title, b.title FROM search_results a, search_results b",
+    ],
+)
+def test_execute_select_query_rejects_full_scans(db_path, monkeypatch, query):
+    """インデックスを使わずに全行を読む必要があるクエリは拒否する"""
+    monkeypatch.setattr(database, "MAX_SCAN_ROWS", 100)
+    _insert_rows(300)
+
+    result = database.execute_select_query(query)
+
+    assert not result["success"]
+    assert "走査が多すぎます" in result["message"]
+
+
+def _save_article(title: str, content: str) -> None:
+    database.save_search_result(
+        query="テスト", url=f"https://example.com/{title}", title=title, content=content
+    )
+
+
+def test_search_knowledge_requires_all_terms(db_path):
+    """空白区切りのキーワードはすべてを含む結果のみを返す（フレーズ一致ではない）"""
+    _save_article("量子コンピュータ入門", "量子ビットと誤り訂正の基礎")
+    _save_article("古典コンピュータ", "誤り訂正符号の歴史")
+
+    result = database.search_knowledge("量子コンピュータ 誤り訂正")
+    assert result["success"]
+    assert [row["title"] for row in result["results"]] == ["量子コンピュータ入門"]
+
+
+@pytest.mark.parametrize("query", ["AI", "量子", "AI 量子ビット"])
+def test_search_knowledge_matches_short_terms(db_path, query):
+    """3文字未満のキーワードは部分一致で検索する"""
+    _save_article("AIと量子", "量子ビットの応用")
+    _save_article("その他", "関係のない本文")
+
+    result = database.search_knowledge(query)
+    assert result["success"]
+    assert [row["title"] for row in result["results"]] == ["AIと量子"]
+
+
+def test_search_knowledge_escapes_like_wildcards(db_path):
+    """部分一致のキーワードに含まれる%はワイルドカードとして扱わない"""
+    _save_article("割引", "50%オフ")
+    _save_article("その他", "関係のない本文")
+
+    result = database.search_knowledge("%")
+    assert [row["title"] for row in result["results"]] == ["割引"]
+
+
+def test_search_knowledge_rejects_empty_query(db_path):
+    """空のキーワードはエラーを返す"""
+    assert not database.search_knowledge("  ")["success"]
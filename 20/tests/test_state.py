@@ -0,0 +1,88 @@
+"""sd_20.state のユニットテスト"""
+
+from langchain_core.messages import AIMessage, HumanMessage, RemoveMessage, SystemMessage
+from langchain_core.messages.utils import count_tokens_approximately
+from langgraph.graph.message import REMOVE_ALL_MESSAGES
+
+from src.sd_20 import state
+
+
+def _total_tokens(messages) -> int:
+    return sum(count_tokens_approximately([message]) for message in messages)
+
+
+def test_running_total_follows_add_replace_and_remove():
+    """追加・置換・削除を繰り返しても、記録した合計トークン数は全体の再計算と一致する"""
+    messages = state.add_and_trim_messages([], [SystemMessage(content="system", id="sys")])
+    messages = state.add_and_trim_messages(messages, [HumanMessage(content="こんにちは" * 10)])
+    messages = state.add_and_trim_messages(messages, [AIMessage(content="短い回答", id="ai-1")])
+    messages = state.add_and_trim_messages(
+        messages, [AIMessage(content="置き換えた長い回答" * 20, id="ai-1")]
+    )
+    messages = state.add_and_trim_messages(
+        messages, [HumanMessage(content="追加の質問", id="human-2"), RemoveMessage(id="sys")]
+    )
+
+    assert [message.content for message in messages][-2:] == [
+        "置き換えた長い回答" * 20,
+        "追加の質問",
+    ]
+    assert state._get_history_tokens(messages) == _total_tokens(messages)
+
+
+def test_messages_without_id_do_not_share_counts():
+    """IDのないメッセージ同士でトークン数を取り違えない"""
+    short = state.add_and_trim_messages([], [HumanMessage(content="a")])
+    long = state.add_and_trim_messages([], [HumanMessage(content="a" * 1000)])
+
+    assert state._get_history_tokens(short) == _total_tokens(short)
+    assert state._get_history_tokens(long) == _total_tokens(long)
+
+
+def test_appends_count_only_new_messages(monkeypatch):
+    """末尾への追加では、追加されたメッセージのトークン数のみを計算する"""
+    messages = state.add_and_trim_messages([], [HumanMessage(content=f"{i}") for i in range(50)])
+    counted = []
+    monkeypatch.setattr(
+        state,
+        "count_message_tokens",
+        lambda message: counted.append(message) or count_tokens_approximately([message]),
+    )
+
+    messages = state.add_and_trim_messages(
+        messages, [AIMessage(content="回答"), HumanMessage(content="質問")]
+    )
+    assert [message.content for message in counted] == ["回答", "質問"]
+    assert state._get_history_tokens(messages) == _total_tokens(messages)
+
+
+def test_restored_history_is_counted_once():
+    """合計を保持していない履歴（チェックポイントからの復元後など）は全体を計算し直す"""
+    messages = state.add_and_trim_messages([], [HumanMessage(content="a" * 100, id="human-1")])
+    restored = list(messages)
+    assert state._get_history_tokens(restored) is None
+
+    messages = state.add_and_trim_messages(restored, [AIMessage(content="b", id="ai-1")])
+    assert state._get_history_tokens(messages) == _total_tokens(messages)
+
+    messages = state.add_and_trim_messages(
+        messages, [RemoveMessage(id=REMOVE_ALL_MESSAGES), HumanMessage(content="c", id="human-2")]
+    )
+    assert [message.id for message in messages] == ["human-2"]
+    assert state._get_history_tokens(messages) == _total_tokens(messages)
+
+
+def test_trims_oldest_messages_and_keeps_system_message(monkeypatch):
+    """上限を超えた場合はシステムメッセージを残して古いメッセージから削除する"""
+    monkeypatch.setattr(state, "MAX_TOKENS", 100)
+    messages = state.add_and_trim_messages([], [SystemMessage(content="system", id="sys")])
+    for i in range(10):
+        messages = state.add_and_trim_messages(
+            messages, [HumanMessage(content=f"{i}" + "x" * 100, id=f"human-{i}")]
+        )
+
+    assert messages[0].id == "sys"
+    assert messages[-1].id == "human-9"
+    assert "human-0" not in {message.id for message in messages}
+    assert _total_tokens(messages) <= 100
+    assert state._get_history_tokens(messages) == _total_tokens(messages)
@@ -2,15 +2,41 @@
 勘定科目提案機能
 """
 
+from functools import lru_cache
 from typing import Any, Dict
 
 from langchain_anthropic import ChatAnthropic
+from langchain_core.messages import SystemMessage
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.runnables import RunnableLambda
+from langchain_core.runnables import Runnable, RunnableLambda
 
+from src.receipt_processor.classifier import classify_receipt
 from src.receipt_processor.constants import CLAUDE_SMART_MODEL
 from src.receipt_processor.models import AccountInfo, ReceiptOCRResult
 
+# システムプロンプト（領収書によらず共通のため、モジュールの定数として定義する）
+ACCOUNT_SYSTEM_PROMPT = """\
+あなたは日本の会計士です。領収書の情報から最適な勘定科目を提案してください。
+中小企業の一般的な勘定科目を使用し、適切な補助科目、取引先情報、摘要も含めてください。
+なぜその勘定科目が適切かの理由も必ず含めてください。
+
+使用可能な主な勘定科目の例:
+- 旅費交通費: 交通機関の利用料、出張費など
+- 通信費: 電話料金、インターネット料金など
+- 消耗品費: 事務用品、日用品など
+- 会議費: 会議での飲食代など
+- 接待交際費: 取引先との会食、贈答品など
+- 広告宣伝費: 広告費、販促物など
+- 新聞図書費: 書籍、雑誌、新聞代など
+- 水道光熱費: 電気代、ガス代、水道代など
+- 地代家賃: オフィス賃料など
+- 雑費: 他の科目に当てはまらない少額の経費
+""".strip()
+
+
+# システムメッセージ（テンプレートとして解析しないよう、メッセージとして一度だけ生成する）
+ACCOUNT_SYSTEM_MESSAGE = SystemMessage(content=ACCOUNT_SYSTEM_PROMPT)
+
 
 def format_prompt(inputs: Dict[str, Any]) -> ChatPromptTemplate:
     """
@@ -51,25 +77,6 @@ def format_prompt(inputs: Dict[str, Any]) -> ChatPromptTemplate:
 {feedback}
 """
 
-    # システムプロンプト
-    system_prompt = """\
-あなたは日本の会計士です。領収書の情報から最適な勘定科目を提案してください。
-中小企業の一般的な勘定科目を使用し、適切な補助科目、取引先情報、摘要も含めてください。
-なぜその勘定科目が適切かの理由も必ず含めてください。
-
-使用可能な主な勘定科目の例:
-- 旅費交通費: 交通機関の利用料、出張費など
-- 通信費: 電話料金、インターネット料金など
-- 消耗品費: 事務用品、日用品など
-- 会議費: 会議での飲食代など
-- 接待交際費: 取引先との会食、贈答品など
-- 広告宣伝費: 広告費、販促物など
-- 新聞図書費: 書籍、雑誌、新聞代など
-- 水道光熱費: 電気代、ガス代、水道代など
-- 地代家賃: オフィス賃料など
-- 雑費: 他の科目に当てはまらない少額の経費
-""".strip()
-
     # ユーザープロンプト
     user_prompt = f"""\
 以下の領収書情報から、最適な勘定科目情報を提案してください。
@@ -87,33 +94,26 @@ def format_prompt(inputs: Dict[str, Any]) -> ChatPromptTemplate:
     # ChatPromptTemplateを作成して返す
     return ChatPromptTemplate.from_messages(
         [
-            ("system", system_prompt),
+            ACCOUNT_SYSTEM_MESSAGE,
             ("user", user_prompt),
         ]
     )
 
 
-def suggest_account_info(
-    ocr_result: ReceiptOCRResult,
-    feedback: str | None = None,
-    model_name: str = CLAUDE_SMART_MODEL,
-) -> AccountInfo:
+@lru_cache(maxsize=None)
+def get_account_chain(model_name: str = CLAUDE_SMART_MODEL) -> Runnable:
     """
-    OCR結果から適切な勘定科目情報を提案する
+    勘定科目提案用のチェーンを返す（モデル名ごとに一度だけ構築して再利用する）
 
     Parameters:
     -----------
-    ocr_result: ReceiptOCRResult
-        OCR処理結果の構造化データ
-    feedback: str | None
-        ユーザーからのフィードバック（あれば）
     model_name: str
         使用するClaudeモデル名
 
     Returns:
     --------
-    AccountInfo
-        提案された勘定科目情報
+    Runnable
+        OCR結果とフィードバックを受け取り、AccountInfoを返すチェーン
     """
     # LLMの初期化
     llm = ChatAnthropic(
@@ -128,11 +128,48 @@ def suggest_account_info(
     prompt_generator = RunnableLambda(format_prompt)
 
     # チェーンの構築
-    account_chain = prompt_generator | llm.with_structured_output(
+    return prompt_generator | llm.with_structured_output(
         AccountInfo,
         mode="function_calling",
     )
 
+
+def suggest_account_info(
+    ocr_result: ReceiptOCRResult,
+    feedback: str | None = None,
+    model_name: str = CLAUDE_SMART_MODEL,
+    use_rules: bool = True,
+) -> AccountInfo:
+    """
+    OCR結果から適切な勘定科目情報を提案する
+
+    ルールベースの判定で確信度が高い場合はLLMを呼び出さずにその結果を返し、
+    判断が難しい場合やフィードバックがある場合のみLLMで提案する。
+
+    Parameters:
+    -----------
+    ocr_result: ReceiptOCRResult
+        OCR処理結果の構造化データ
+    feedback: str | None
+        ユーザーからのフィードバック（あれば）
+    model_name: str
+        使用するClaudeモデル名
+    use_rules: bool
+        ルールベースの判定を先に試すかどうか
+
+    Returns:
+    --------
+    AccountInfo
+        提案された勘定科目情報
+    """
+    # フィードバックがある場合は前回の提案が不適切だったため、常にLLMで提案する
+    if use_rules and not feedback:
+        rule_account_info = classify_receipt(ocr_result)
+        if rule_account_info is not None:
+            return rule_account_info
+
+    account_chain = get_account_chain(model_name)
+
     # 勘定科目情報を生成
     account_info: AccountInfo = account_chain.invoke(
         {"ocr_result": ocr_result, "feedback": feedback}
@@ -3,14 +3,15 @@ LangGraph Workflowの定義
 """
 
 import os
+from concurrent.futures import Future, ThreadPoolExecutor
 from typing import Any, Dict, List, Optional
 
-from langgraph.checkpoint.memory import MemorySaver
 from langgraph.func import entrypoint, task
 from langgraph.types import StreamWriter, interrupt
 
 from src.receipt_processor.account import suggest_account_info
-from src.receipt_processor.constants import CSV_FILE_PATH
+from src.receipt_processor.checkpointer import SqliteCheckpointSaver
+from src.receipt_processor.classifier import fill_receipt_details, match_keyword_rules
 from src.receipt_processor.models import (
     AccountInfo,
     CommandType,
@@ -18,33 +19,157 @@ from src.receipt_processor.models import (
     Feedback,
     ReceiptOCRResult,
 )
-from src.receipt_processor.storage import backup_csv, save_to_csv
-from src.receipt_processor.vision import ocr_receipt
+from src.receipt_processor.ocr_cache import find_near_duplicates
+from src.receipt_processor.storage import save_to_ledger
+from src.receipt_processor.vision import ocr_image_streaming, preprocess_receipt_image
+
+# 勘定科目の先行提案を開始するために必要なOCR結果の項目
+SPECULATION_FIELDS = ("date", "amount", "shop_name")
+
+
+def combine_feedback(feedback_history: Optional[List[str]]) -> Optional[str]:
+    """
+    フィードバック履歴を1つのフィードバック文字列にまとめる
+
+    Parameters:
+    -----------
+    feedback_history: Optional[List[str]]
+        これまでのユーザーフィードバック履歴
+
+    Returns:
+    --------
+    Optional[str]
+        結合したフィードバック（履歴がない場合はNone）
+    """
+    if not feedback_history:
+        return None
+
+    # すべてのフィードバックを結合して渡す
+    return " ".join([f"フィードバック{i+1}: {fb}" for i, fb in enumerate(feedback_history)])
+
+
+def has_speculation_fields(partial: Dict[str, Any]) -> bool:
+    """
+    生成途中のOCR結果で、先行提案に必要な項目の生成が完了しているかを判定する
+
+    JSONは先頭から順に生成されるため、必要な項目が揃い、さらに後続の項目の生成が
+    始まっていれば、必要な項目の値は確定している。
+    """
+    return all(field in partial for field in SPECULATION_FIELDS) and any(
+        field not in SPECULATION_FIELDS for field in partial
+    )
+
+
+def speculation_matches(ocr_result: ReceiptOCRResult, partial: Dict[str, Any]) -> bool:
+    """確定したOCR結果と、先行提案に使用した項目（日付・金額・店舗名）が一致するかを判定する"""
+    return all(getattr(ocr_result, field) == partial.get(field) for field in SPECULATION_FIELDS)
+
+
+def items_change_account(ocr_result: ReceiptOCRResult, account_info: AccountInfo) -> bool:
+    """
+    確定したOCR結果の品目から判定される勘定科目が、先行提案の勘定科目と異なるかを判定する
+
+    先行提案は品目を含まない入力から作成しているため、品目のキーワードが別の勘定科目を
+    示す場合のみ、確定したOCR結果から提案し直す。
+    """
+    if not ocr_result.items:
+        return False
+    keyword_account, _ = match_keyword_rules(ocr_result)
+    return keyword_account is not None and keyword_account != account_info.account
 
 
 @task
-def process_and_ocr_image(image_path: str, *, writer: StreamWriter) -> ReceiptOCRResult:
+def process_and_ocr_image(
+    image_path: str,
+    feedback_history: Optional[List[str]] = None,
+    *,
+    writer: StreamWriter,
+) -> Dict[str, Any]:
     """
     画像の前処理とOCR処理を行う統合タスク
 
+    OCR結果をストリーミングで受け取り、日付・金額・店舗名が確定した時点で
+    勘定科目の先行提案をバックグラウンドで開始する（OCRの残りの生成と並行して実行する）。
+    確定したOCR結果の日付・金額・店舗名が一致し、品目が別の勘定科目を示していなければ、
+    先行提案をそのまま最終的な提案として採用する。
+
     Parameters:
     -----------
     image_path: str
         処理する画像のファイルパス
+    feedback_history: Optional[List[str]]
+        これまでのユーザーフィードバック履歴（先行提案に使用する）
     writer: StreamWriter
         イベント送信用のStreamWriter
 
     Returns:
     --------
-    ReceiptOCRResult
-        抽出された領収書情報（構造化データ）
+    Dict[str, Any]
+        抽出された領収書情報（"ocr_result"）と、採用できる場合は先行提案の結果（"account_info"）
     """
     # 画像パスが存在するかチェック
     if not os.path.exists(image_path):
         raise FileNotFoundError(f"画像ファイルが見つかりません: {image_path}")
 
-    # OCR処理を実行
-    ocr_result = ocr_receipt(image_path)
+    # 画像の前処理
+    image_data = preprocess_receipt_image(image_path)
+
+    # 二重提出の可能性がある領収書を検出（OCR結果をキャッシュに保存する前に確認する）
+    duplicates = find_near_duplicates(image_data)
+
+    speculation: Dict[str, Any] = {}
+    executor = ThreadPoolExecutor(max_workers=1)
+
+    def notify_suggestion(future: Future) -> None:
+        # 先行提案が完了していればイベントを送信（writerはタスクのスレッドからのみ呼び出す）
+        if speculation.get("notified") or not future.done() or future.exception():
+            return
+        speculation["notified"] = True
+        writer(
+            {
+                "event": EventType.ACCOUNT_SUGGESTED,
+                "account_info": future.result().model_dump(),
+                "speculative": True,
+            }
+        )
+
+    def on_partial(partial: Dict[str, Any]) -> None:
+        if "future" in speculation:
+            notify_suggestion(speculation["future"])
+            return
+        if not has_speculation_fields(partial):
+            return
+
+        # 確定した項目だけで勘定科目の先行提案を開始する
+        speculation["fields"] = {field: str(partial[field]) for field in SPECULATION_FIELDS}
+        writer({"event": EventType.OCR_PARTIAL, "structured_data": speculation["fields"]})
+        speculation["future"] = executor.submit(
+            suggest_account_info,
+            ReceiptOCRResult(raw_text="", **speculation["fields"]),
+            combine_feedback(feedback_history),
+        )
+
+    try:
+        # OCR処理を実行（同じ画像はキャッシュから取得）
+        ocr_result = ocr_image_streaming(image_data, on_partial)
+
+        # 確定したOCR結果の日付・金額・店舗名が先行提案の項目と一致し、
+        # 品目が別の勘定科目を示していなければ、その提案を採用する
+        account_info: Optional[AccountInfo] = None
+        future: Optional[Future] = speculation.get("future")
+        if future is not None and speculation_matches(ocr_result, speculation["fields"]):
+            try:
+                speculative_info: AccountInfo = future.result()
+                if not items_change_account(ocr_result, speculative_info):
+                    # インボイス番号など、確定したOCR結果にのみ含まれる項目を補う
+                    account_info = fill_receipt_details(speculative_info, ocr_result)
+                    notify_suggestion(future)
+            except Exception as e:
+                print(f"勘定科目の先行提案エラー: {e}")
+    finally:
+        # 項目が一致しなかった先行提案の完了は待たない
+        # （送信済みのリクエストは取り消せないため、項目が確定してから先行提案を開始している）
+        executor.shutdown(wait=False, cancel_futures=True)
 
     # OCR完了イベントを送信
     writer(
@@ -52,10 +177,11 @@ def process_and_ocr_image(image_path: str, *, writer: StreamWriter) -> ReceiptOC
             "event": EventType.OCR_DONE,
             "text": ocr_result.raw_text,
             "structured_data": ocr_result.model_dump(),
+            "duplicates": duplicates,
         }
     )
 
-    return ocr_result
+    return {"ocr_result": ocr_result, "account_info": account_info}
 
 
 @task
@@ -82,16 +208,8 @@ def generate_account_suggestion(
     AccountInfo
         提案された勘定科目情報
     """
-    # フィードバック履歴がある場合はフィードバックとして使用
-    combined_feedback = None
-    if feedback_history and len(feedback_history) > 0:
-        # すべてのフィードバックを結合して渡す
-        combined_feedback = " ".join(
-            [f"フィードバック{i+1}: {fb}" for i, fb in enumerate(feedback_history)]
-        )
-
-    # 勘定科目提案を取得
-    account_info = suggest_account_info(ocr_result, combined_feedback)
+    # 勘定科目提案を取得（フィードバック履歴がある場合はフィードバックとして使用）
+    account_info = suggest_account_info(ocr_result, combine_feedback(feedback_history))
 
     # 提案完了イベントを送信
     writer(
@@ -108,7 +226,7 @@ def generate_account_suggestion(
 @task
 def save_receipt_data(data: AccountInfo, *, writer: StreamWriter) -> bool:
     """
-    承認されたデータをCSVに保存するタスク
+    承認されたデータを台帳に保存するタスク
 
     Parameters:
     -----------
@@ -122,12 +240,8 @@ def save_receipt_data(data: AccountInfo, *, writer: StreamWriter) -> bool:
     bool
         保存が成功したかどうか
     """
-    # CSVファイルが既に存在する場合はバックアップを作成
-    if os.path.exists(CSV_FILE_PATH):
-        backup_csv()
-
-    # データをCSVに保存
-    save_success = save_to_csv(data)
+    # データを台帳に保存
+    save_success = save_to_ledger(data)
 
     # 保存完了イベントを送信
     writer(
@@ -140,7 +254,7 @@ def save_receipt_data(data: AccountInfo, *, writer: StreamWriter) -> bool:
     return save_success
 
 
-@entrypoint(checkpointer=MemorySaver())
+@entrypoint(checkpointer=SqliteCheckpointSaver())
 def receipt_workflow(
     image_path: str,
     *,
@@ -177,13 +291,18 @@ def receipt_workflow(
         # 新しい画像の場合はフィードバック履歴をリセット
         state["feedback_history"] = []
 
-    # OCRを実行して結果を保存
-    ocr_result = process_and_ocr_image(image_path, writer=writer).result()
-
-    # 勘定科目提案を取得（フィードバック履歴があれば利用）
-    account_info = generate_account_suggestion(
-        ocr_result, feedback_history=state.get("feedback_history", []), writer=writer
+    # OCRを実行して結果を保存（OCRと並行して勘定科目の先行提案も行う）
+    ocr_output = process_and_ocr_image(
+        image_path, feedback_history=state.get("feedback_history", []), writer=writer
     ).result()
+    ocr_result: ReceiptOCRResult = ocr_output["ocr_result"]
+    account_info: Optional[AccountInfo] = ocr_output["account_info"]
+
+    # 先行提案を採用できなかった場合は、確定したOCR結果から勘定科目提案を取得
+    if account_info is None:
+        account_info = generate_account_suggestion(
+            ocr_result, feedback_history=state.get("feedback_history", []), writer=writer
+        ).result()
 
     while True:
         # ユーザーからのフィードバックを待機
@@ -199,7 +318,7 @@ def receipt_workflow(
 
         # 承認コマンドの場合
         if feedback.command == CommandType.APPROVE:
-            # CSVに保存
+            # 台帳に保存
             save_receipt_data(account_info, writer=writer).result()
 
             # 状態を更新して完了とマーク
@@ -219,9 +338,7 @@ def receipt_workflow(
 
             if feedback_content:
                 # フィードバック履歴に追加
-                state["feedback_history"] = state.get("feedback_history", []) + [
-                    feedback_content
-                ]
+                state["feedback_history"] = state.get("feedback_history", []) + [feedback_content]
                 # フィードバックを使って勘定科目を再提案
                 account_info = generate_account_suggestion(
                     ocr_result,
@@ -3,31 +3,43 @@ Streamlitアプリケーション
 """
 
 import os
+import tempfile
 import uuid
 from typing import Any, Dict, Optional, Union
 
 import streamlit as st
 from langgraph.types import Command
 
-from src.receipt_processor.agent import receipt_workflow
+from src.receipt_processor.batch import approve_review_items, run_batch
+from src.receipt_processor.constants import HISTORY_PAGE_SIZE, JOB_POLL_INTERVAL
+from src.receipt_processor.jobs import get_job_queue
 from src.receipt_processor.models import (
     AccountInfo,
     CommandType,
     DisplayMode,
     EventType,
     Feedback,
+    JobStatus,
     ReceiptOCRResult,
     WorkflowState,
 )
-from src.receipt_processor.storage import get_saved_receipts
+from src.receipt_processor.storage import (
+    count_saved_receipts,
+    get_review_queue,
+    get_saved_receipts,
+)
 from src.receipt_processor.ui_components import (
     account_info_editor,
     display_action_buttons,
-    display_loading_spinner,
+    display_duplicate_warning,
     display_ocr_text,
     display_receipt_history,
+    display_review_queue,
     display_success_message,
+    handle_batch_input,
     handle_image_input,
+    save_uploaded_files,
+    select_history_page,
     setup_page,
 )
 
@@ -54,6 +66,8 @@ def init_session_state(force: bool = False) -> None:
         st.session_state.ocr_text = ""
     if force or "ocr_result" not in st.session_state:
         st.session_state.ocr_result = {}
+    if force or "duplicate_receipts" not in st.session_state:
+        st.session_state.duplicate_receipts = []
 
     # 会計情報の初期化
     if force or "account_info" not in st.session_state:
@@ -67,6 +81,14 @@ def init_session_state(force: bool = False) -> None:
     if force or "display_mode" not in st.session_state:
         st.session_state.display_mode = DisplayMode.INPUT
 
+    # バックグラウンドジョブの確認状況
+    if force or "job_event_index" not in st.session_state:
+        st.session_state.job_event_index = 0
+    if force or "progress_message" not in st.session_state:
+        st.session_state.progress_message = ""
+    if force or "spinner_message" not in st.session_state:
+        st.session_state.spinner_message = "処理中..."
+
 
 def handle_feedback_submission() -> Optional[Feedback]:
     """
@@ -93,7 +115,7 @@ def process_workflow(
     spinner_message: str = "処理中...",
 ) -> None:
     """
-    ワークフローを処理する共通関数
+    ワークフローの実行をバックグラウンドのジョブキューに登録する共通関数
 
     Parameters:
     -----------
@@ -102,78 +124,94 @@ def process_workflow(
     spinner_message: str
         処理中に表示するメッセージ
     """
-    # thread_idを設定
-    config = {"configurable": {"thread_id": st.session_state.thread_id}}
+    get_job_queue().submit(st.session_state.thread_id, input_data)
 
-    # 処理中の表示
-    with st.spinner(spinner_message):
-        try:
-            # ワークフローの実行
-            stream_iterator = receipt_workflow.stream(
-                input_data, config=config, stream_mode=["custom", "values"]
-            )
+    # 以降はジョブの状態を確認して表示を更新する
+    st.session_state.job_event_index = 0
+    st.session_state.progress_message = ""
+    st.session_state.spinner_message = spinner_message
+    st.session_state.workflow_state = WorkflowState.PROCESSING
+    st.rerun()
 
-            for mode, payload in stream_iterator:
-                # ペイロードがNoneの場合はスキップ
-                if payload is None:
-                    continue
-
-                if mode == "custom":
-                    event = payload.get("event", "")
-
-                    if event == EventType.OCR_DONE:
-                        raw_text = payload["text"]
-                        ocr_result = ReceiptOCRResult.model_validate(
-                            payload["structured_data"]
-                        )
-                        st.session_state.ocr_text = raw_text
-                        st.session_state.ocr_result = ocr_result
-
-                    elif event == EventType.ACCOUNT_SUGGESTED:
-                        account_info = AccountInfo.model_validate(
-                            payload["account_info"]
-                        )
-                        st.session_state.account_info = account_info
-
-                    elif event == EventType.SAVE_COMPLETED:
-                        st.session_state.workflow_state = (
-                            WorkflowState.WORKFLOW_COMPLETED
-                        )
-                        st.rerun()
-
-                    else:
-                        st.session_state.error_message = (
-                            f"未知のイベントを受信しました: {event}"
-                        )
-                        st.session_state.workflow_state = WorkflowState.ERROR
-                        st.rerun()
-
-                elif mode == "values":
-                    # 割り込みの検出
-                    if "__interrupt__" in payload:
-                        interrupt = payload["__interrupt__"][0]
-
-                        ocr_result = ReceiptOCRResult.model_validate(
-                            interrupt.value.get("ocr_result")
-                        )
-                        account_info = AccountInfo.model_validate(
-                            interrupt.value.get("account_info")
-                        )
-                        st.session_state.ocr_result = ocr_result
-                        st.session_state.account_info = account_info
-                        st.session_state.workflow_state = WorkflowState.WAIT_FEEDBACK
-                        st.rerun()
 
-        except Exception as e:
-            print(f"ワークフロー実行エラー: {e}")
-            import traceback
+def apply_workflow_event(payload: Dict[str, Any]) -> None:
+    """
+    ワークフローから受信したイベントをセッション状態に反映する
+
+    Parameters:
+    -----------
+    payload: Dict[str, Any]
+        ワークフローのイベント
+    """
+    event = payload.get("event", "")
 
-            print(f"詳細エラー: {traceback.format_exc()}")
-            st.session_state.error_message = (
-                f"ワークフロー実行中にエラーが発生しました: {e}"
+    if event == EventType.OCR_PARTIAL:
+        partial = payload["structured_data"]
+        st.session_state.progress_message = (
+            f"読み取り中: {partial['date']} / {partial['shop_name']} / "
+            f"{partial['amount']}円（勘定科目を提案しています）"
+        )
+
+    elif event == EventType.OCR_DONE:
+        st.session_state.ocr_text = payload["text"]
+        st.session_state.ocr_result = ReceiptOCRResult.model_validate(payload["structured_data"])
+        st.session_state.duplicate_receipts = payload.get("duplicates", [])
+
+    elif event == EventType.ACCOUNT_SUGGESTED:
+        account_info = AccountInfo.model_validate(payload["account_info"])
+        st.session_state.account_info = account_info
+        if payload.get("speculative"):
+            st.session_state.progress_message = (
+                f"勘定科目の候補: {account_info.account}（OCR結果を確認しています）"
             )
-            st.session_state.workflow_state = WorkflowState.ERROR
-            st.rerun()
+
+    elif event == EventType.SAVE_COMPLETED:
+        st.session_state.workflow_state = WorkflowState.WORKFLOW_COMPLETED
+
+    else:
+        st.session_state.error_message = f"未知のイベントを受信しました: {event}"
+        st.session_state.workflow_state = WorkflowState.ERROR
+
+
+@st.fragment(run_every=JOB_POLL_INTERVAL)
+def poll_workflow_job() -> None:
+    """
+    バックグラウンドで実行中のワークフローの状態を確認して表示を更新する
+
+    この部分だけを一定間隔で再実行するため、処理中もスクリプト全体はブロックされない。
+    """
+    job = get_job_queue().get(st.session_state.thread_id)
+    if job is None:
+        st.session_state.error_message = "ワークフローのジョブが見つかりません"
+        st.session_state.workflow_state = WorkflowState.ERROR
+        st.rerun()
+        return
+
+    # 前回の確認以降に受信したイベントを反映
+    for payload in job.events[st.session_state.job_event_index :]:
+        apply_workflow_event(payload)
+    st.session_state.job_event_index = len(job.events)
+
+    if job.status == JobStatus.INTERRUPTED and job.interrupt is not None:
+        st.session_state.ocr_result = ReceiptOCRResult.model_validate(
+            job.interrupt.get("ocr_result")
+        )
+        st.session_state.account_info = AccountInfo.model_validate(
+            job.interrupt.get("account_info")
+        )
+        st.session_state.workflow_state = WorkflowState.WAIT_FEEDBACK
+    elif job.status == JobStatus.FAILED:
+        st.session_state.error_message = f"ワークフロー実行中にエラーが発生しました: {job.error}"
+        st.session_state.workflow_state = WorkflowState.ERROR
+
+    # 状態が変わった場合は画面全体を更新
+    if st.session_state.workflow_state != WorkflowState.PROCESSING:
+        st.rerun()
+        return
+
+    st.info(st.session_state.spinner_message, icon="⏳")
+    if st.session_state.progress_message:
+        st.caption(st.session_state.progress_message)
 
 
 def start_workflow(image_path: str) -> None:
@@ -234,6 +272,33 @@ def clean_up_temp_files() -> None:
     st.session_state.temp_files = []
 
 
+def batch_page() -> None:
+    """一括処理画面（まとめて処理し、結果を後から一括承認する）"""
+    uploaded_files = handle_batch_input()
+
+    if uploaded_files and st.button("一括処理開始", type="primary", use_container_width=True):
+        with st.spinner("領収書を一括処理中..."):
+            with tempfile.TemporaryDirectory() as upload_dir:
+                save_uploaded_files(uploaded_files, upload_dir)
+                result = run_batch(upload_dir)
+        st.success(
+            f"{len(result.items)}件を処理しました（失敗: {result.error_count}件, "
+            f"{result.elapsed_seconds:.1f}秒, {result.receipts_per_minute:.1f}件/分）"
+        )
+
+    st.markdown("---")
+
+    # レビューキューの表示と一括承認
+    approved_ids = display_review_queue(get_review_queue())
+    if approved_ids:
+        saved_count = approve_review_items(approved_ids)
+        st.session_state.batch_message = f"{saved_count}件の領収書を保存しました"
+        st.rerun()
+
+    if "batch_message" in st.session_state:
+        st.success(st.session_state.pop("batch_message"), icon="✅")
+
+
 def main() -> None:
     """メインアプリケーション"""
     # ページ設定
@@ -251,13 +316,20 @@ def main() -> None:
             WorkflowState.PROCESSING,
             WorkflowState.WAIT_FEEDBACK,
         ]
-        if st.button(
-            "新規領収書処理", use_container_width=True, disabled=new_receipt_disabled
-        ):
+        if st.button("新規領収書処理", use_container_width=True, disabled=new_receipt_disabled):
             init_session_state(force=True)
             clean_up_temp_files()  # 一時ファイルをクリーンアップ
             st.rerun()
 
+        # 一括処理ボタン - 処理中は無効化
+        batch_disabled = st.session_state.workflow_state in [
+            WorkflowState.PROCESSING,
+            WorkflowState.WAIT_FEEDBACK,
+        ]
+        if st.button("一括処理", use_container_width=True, disabled=batch_disabled):
+            st.session_state.display_mode = DisplayMode.BATCH
+            st.rerun()
+
         # 履歴表示ボタン - 処理中は無効化
         history_disabled = st.session_state.workflow_state in [
             WorkflowState.PROCESSING,
@@ -274,11 +346,20 @@ def main() -> None:
 
     # 履歴表示モード
     if st.session_state.display_mode == DisplayMode.HISTORY:
-        # 保存済みデータを取得して表示
-        receipts = get_saved_receipts()
+        # 保存済みデータを1ページ分だけ取得して表示
+        total = count_saved_receipts()
+        page = select_history_page(total, HISTORY_PAGE_SIZE)
+        receipts = get_saved_receipts(
+            limit=HISTORY_PAGE_SIZE, offset=(page - 1) * HISTORY_PAGE_SIZE
+        )
         display_receipt_history(receipts)
         return
 
+    # 一括処理モード
+    if st.session_state.display_mode == DisplayMode.BATCH:
+        batch_page()
+        return
+
     # 入力モード - メイン画面を左右に分割
     left_col, right_col = st.columns([1, 1])
 
@@ -287,9 +368,7 @@ def main() -> None:
         image_path = handle_image_input()
 
         # 処理開始ボタン - 処理中は無効化
-        start_disabled = (
-            not image_path or st.session_state.workflow_state != WorkflowState.IDLE
-        )
+        start_disabled = not image_path or st.session_state.workflow_state != WorkflowState.IDLE
         if image_path and st.session_state.workflow_state == WorkflowState.IDLE:
             if st.button(
                 "処理開始",
@@ -300,14 +379,18 @@ def main() -> None:
                 # ワークフローを開始
                 start_workflow(image_path)
 
-        # 処理中の表示
+        # 処理中の表示（バックグラウンドのジョブの状態を確認して更新）
         if st.session_state.workflow_state == WorkflowState.PROCESSING:
-            display_loading_spinner("処理中...")
+            poll_workflow_job()
 
         # 現在の状態を表示（デバッグ用）
         st.caption(f"現在の状態: {st.session_state.workflow_state}")
 
     with right_col:
+        # 二重提出の可能性がある場合は警告を表示
+        if st.session_state.duplicate_receipts:
+            display_duplicate_warning(st.session_state.duplicate_receipts)
+
         # OCR結果の表示
         if st.session_state.ocr_text:
             display_ocr_text(st.session_state.ocr_text)
@@ -0,0 +1,222 @@
+"""
+領収書の一括処理機能
+
+ディレクトリまたはZIPファイル内の領収書画像をまとめて処理し、
+結果をレビューキューに登録する。承認は後から一括で行う。
+"""
+
+import asyncio
+import tempfile
+import time
+import uuid
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import List
+
+from pydantic import BaseModel, Field
+
+from src.receipt_processor.account import suggest_account_info
+from src.receipt_processor.constants import BATCH_MAX_CONCURRENCY, BATCH_MAX_WORKERS
+from src.receipt_processor.models import ReviewItem
+from src.receipt_processor.storage import (
+    add_to_review_queue,
+    get_review_queue,
+    remove_from_review_queue,
+    save_to_ledger,
+)
+from src.receipt_processor.vision import ocr_image, preprocess_receipt_image
+
+# 処理対象とする画像の拡張子
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png"}
+
+
+class BatchResult(BaseModel):
+    """一括処理の結果"""
+
+    items: List[ReviewItem] = Field(description="レビューキューに登録した項目")
+    elapsed_seconds: float = Field(description="処理時間（秒）")
+
+    @property
+    def receipts_per_minute(self) -> float:
+        """1分あたりの処理件数（スループット）"""
+        if self.elapsed_seconds <= 0:
+            return 0.0
+        return len(self.items) / self.elapsed_seconds * 60
+
+    @property
+    def error_count(self) -> int:
+        """処理に失敗した件数"""
+        return sum(1 for item in self.items if item.error)
+
+
+def collect_image_paths(source: str, extract_dir: str) -> List[Path]:
+    """
+    ディレクトリまたはZIPファイルから領収書画像のパスを収集する
+
+    Parameters:
+    -----------
+    source: str
+        画像を含むディレクトリ、またはZIPファイルのパス
+    extract_dir: str
+        ZIPファイルの展開先ディレクトリ
+
+    Returns:
+    --------
+    List[Path]
+        画像ファイルのパス（ファイル名順）
+    """
+    source_path = Path(source)
+    if zipfile.is_zipfile(source_path):
+        with zipfile.ZipFile(source_path) as archive:
+            archive.extractall(extract_dir)
+        source_path = Path(extract_dir)
+
+    if not source_path.is_dir():
+        raise FileNotFoundError(f"ディレクトリまたはZIPファイルが見つかりません: {source}")
+
+    return sorted(
+        path
+        for path in source_path.rglob("*")
+        if path.is_file()
+        and path.suffix.lower() in IMAGE_EXTENSIONS
+        and not path.name.startswith(".")
+    )
+
+
+async def process_receipt_images(
+    image_paths: List[Path],
+    max_workers: int = BATCH_MAX_WORKERS,
+    max_concurrency: int = BATCH_MAX_CONCURRENCY,
+) -> List[ReviewItem]:
+    """
+    複数の領収書画像を処理し、レビュー項目のリストを返す
+
+    画像の前処理はプロセスプールで並列に実行し、OCRと勘定科目提案の
+    LLM呼び出しはセマフォで同時実行数を制限しながら並行して実行する。
+
+    Parameters:
+    -----------
+    image_paths: List[Path]
+        処理する画像ファイルのパス
+    max_workers: int
+        画像前処理を行うプロセス数
+    max_concurrency: int
+        同時に実行するLLM呼び出しの数
+
+    Returns:
+    --------
+    List[ReviewItem]
+        画像ごとの処理結果（入力と同じ順序）
+    """
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+
+        async def process_one(image_path: Path) -> ReviewItem:
+            item = ReviewItem(id=str(uuid.uuid4()), image_name=image_path.name)
+            try:
+                # 画像の前処理（CPUバウンドのためプロセスプールで実行）
+                image_data = await loop.run_in_executor(
+                    executor, preprocess_receipt_image, str(image_path)
+                )
+
+                # OCRと勘定科目提案（同時実行数を制限）
+                async with semaphore:
+                    item.ocr_result = await asyncio.to_thread(ocr_image, image_data)
+                    item.account_info = await asyncio.to_thread(
+                        suggest_account_info, item.ocr_result
+                    )
+            except Exception as e:
+                item.error = str(e)
+            return item
+
+        return list(await asyncio.gather(*(process_one(path) for path in image_paths)))
+
+
+def run_batch(
+    source: str,
+    max_workers: int = BATCH_MAX_WORKERS,
+    max_concurrency: int = BATCH_MAX_CONCURRENCY,
+) -> BatchResult:
+    """
+    ディレクトリまたはZIPファイル内の領収書を一括処理し、結果をレビューキューに登録する
+
+    Parameters:
+    -----------
+    source: str
+        画像を含むディレクトリ、またはZIPファイルのパス
+    max_workers: int
+        画像前処理を行うプロセス数
+    max_concurrency: int
+        同時に実行するLLM呼び出しの数
+
+    Returns:
+    --------
+    BatchResult
+        一括処理の結果（処理件数と処理時間）
+    """
+    started = time.perf_counter()
+
+    with tempfile.TemporaryDirectory() as extract_dir:
+        image_paths = collect_image_paths(source, extract_dir)
+        items = asyncio.run(process_receipt_images(image_paths, max_workers, max_concurrency))
+
+    add_to_review_queue(items)
+
+    return BatchResult(items=items, elapsed_seconds=time.perf_counter() - started)
+
+
+def approve_review_items(item_ids: List[str]) -> int:
+    """
+    レビューキューの項目を承認して台帳に保存し、キューから削除する
+
+    Parameters:
+    -----------
+    item_ids: List[str]
+        承認するレビュー項目のID
+
+    Returns:
+    --------
+    int
+        保存した件数
+    """
+    targets = [
+        item for item in get_review_queue() if item.id in item_ids and item.account_info is not None
+    ]
+    if not targets:
+        return 0
+
+    saved_ids = [
+        item.id for item in targets if item.account_info and save_to_ledger(item.account_info)
+    ]
+    remove_from_review_queue(saved_ids)
+
+    return len(saved_ids)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from dotenv import load_dotenv
+
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="領収書画像を一括処理してレビューキューに登録")
+    parser.add_argument("source", help="領収書画像を含むディレクトリ、またはZIPファイルのパス")
+    parser.add_argument(
+        "--workers", type=int, default=BATCH_MAX_WORKERS, help="画像前処理を行うプロセス数"
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=BATCH_MAX_CONCURRENCY,
+        help="同時に実行するLLM呼び出しの数",
+    )
+    args = parser.parse_args()
+
+    result = run_batch(args.source, args.workers, args.concurrency)
+    print(f"処理件数: {len(result.items)}件（失敗: {result.error_count}件）")
+    print(f"処理時間: {result.elapsed_seconds:.1f}秒")
+    print(f"スループット: {result.receipts_per_minute:.1f}件/分")
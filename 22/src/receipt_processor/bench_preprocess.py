@@ -0,0 +1,115 @@
+"""
+画像前処理の設定ごとの送信量・入力トークン数・OCR精度を比較するベンチマーク
+
+サンプルの領収書画像を設定ごとに前処理し、画像のバイト数と入力トークン数の見積もり、
+前処理時間を表示します。--ocrを指定するとOCRを実行し、日付・金額・店舗名の正解率も表示します
+（正解データがない画像は、従来の固定の前処理でのOCR結果を正解とみなします）。
+
+実行方法:
+    uv run -m src.receipt_processor.bench_preprocess fixtures --expected fixtures/expected.json --ocr
+"""
+
+import argparse
+import json
+import statistics
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from src.receipt_processor.batch import IMAGE_EXTENSIONS
+from src.receipt_processor.constants import CLAUDE_FAST_MODEL
+from src.receipt_processor.vision import (
+    TARGET_TEXT_HEIGHT,
+    estimate_image_tokens,
+    ocr_processed_image,
+    preprocess_receipt_image,
+)
+
+# 精度を比較するOCR結果の項目
+ACCURACY_FIELDS = ("date", "amount", "shop_name")
+
+# 比較する前処理の設定（先頭が基準となる従来の固定の前処理）
+SETTINGS: Dict[str, Dict[str, Any]] = {
+    "固定 1000px JPEG95": {"adaptive": False},
+    f"適応 文字{TARGET_TEXT_HEIGHT + 4}px 自動": {"target_text_height": TARGET_TEXT_HEIGHT + 4},
+    f"適応 文字{TARGET_TEXT_HEIGHT}px 自動": {},
+    f"適応 文字{TARGET_TEXT_HEIGHT - 4}px 自動": {"target_text_height": TARGET_TEXT_HEIGHT - 4},
+    f"適応 文字{TARGET_TEXT_HEIGHT}px PNG": {"image_format": "PNG"},
+    f"適応 文字{TARGET_TEXT_HEIGHT}px JPEG": {"image_format": "JPEG"},
+}
+
+
+def field_accuracy(result: Dict[str, Any], expected: Dict[str, Any]) -> Optional[float]:
+    """OCR結果のうち、正解データと一致した項目の割合を返す（比較する項目がなければNone）"""
+    fields = [field for field in ACCURACY_FIELDS if field in expected]
+    if not fields:
+        return None
+    matched = sum(1 for field in fields if str(result.get(field, "")) == str(expected[field]))
+    return matched / len(fields)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="画像前処理の設定ごとの送信量と精度を比較")
+    parser.add_argument("source", help="領収書画像を含むディレクトリ")
+    parser.add_argument("--expected", help="正解データ（画像ファイル名をキーとするJSON）のパス")
+    parser.add_argument("--ocr", action="store_true", help="OCRを実行して精度を計測する")
+    parser.add_argument("--model", default=CLAUDE_FAST_MODEL, help="OCRに使用するモデル名")
+    args = parser.parse_args()
+
+    image_paths = sorted(
+        path
+        for path in Path(args.source).iterdir()
+        if path.is_file() and path.suffix.lower() in IMAGE_EXTENSIONS
+    )
+    if not image_paths:
+        print(f"領収書画像が見つかりません: {args.source}")
+        return 1
+
+    expected: Dict[str, Dict[str, Any]] = {}
+    if args.expected:
+        expected = json.loads(Path(args.expected).read_text(encoding="utf-8"))
+
+    print(f"{len(image_paths)}枚の画像で計測します")
+    header = f"{'設定':<22}{'平均バイト数':>12}{'平均トークン':>12}{'前処理(ms)':>12}"
+    print(header + (f"{'正解率':>10}" if args.ocr else ""))
+
+    for name, settings in SETTINGS.items():
+        sizes: List[int] = []
+        tokens: List[int] = []
+        elapsed: List[float] = []
+        accuracies: List[float] = []
+
+        for path in image_paths:
+            started = time.perf_counter()
+            image_data = preprocess_receipt_image(str(path), **settings)
+            elapsed.append((time.perf_counter() - started) * 1000)
+            sizes.append(len(image_data))
+            tokens.append(estimate_image_tokens(image_data))
+
+            if args.ocr:
+                # キャッシュを使わずにOCRを実行する
+                result = ocr_processed_image(image_data, args.model).model_dump()
+                # 正解データがない画像は、最初の設定（従来の前処理）の結果を正解とする
+                reference = expected.setdefault(path.name, {})
+                for field in ACCURACY_FIELDS:
+                    reference.setdefault(field, result[field])
+                accuracy = field_accuracy(result, reference)
+                if accuracy is not None:
+                    accuracies.append(accuracy)
+
+        line = (
+            f"{name:<22}{statistics.mean(sizes):>12,.0f}"
+            f"{statistics.mean(tokens):>12,.0f}{statistics.mean(elapsed):>12.1f}"
+        )
+        if args.ocr:
+            line += f"{statistics.mean(accuracies):>10.0%}" if accuracies else f"{'-':>10}"
+        print(line)
+
+    return 0
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    raise SystemExit(main())
@@ -0,0 +1,417 @@
+"""
+SQLiteを使用したワークフローのチェックポイント保存機能
+
+MemorySaverと異なり、ユーザーのフィードバック待ち（interrupt）の状態がプロセスの再起動後も残る。
+完了したスレッドや長期間放置されたスレッドは一定時間経過後に削除し、データベースの肥大化を防ぐ。
+"""
+
+import os
+import random
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from langgraph.checkpoint.serde.types import INTERRUPT, TASKS, ChannelProtocol
+
+from src.receipt_processor.constants import (
+    CHECKPOINT_CLEANUP_INTERVAL,
+    CHECKPOINT_COMPLETED_TTL,
+    CHECKPOINT_COMPRESS_MIN_BYTES,
+    CHECKPOINT_DB_PATH,
+    CHECKPOINT_PENDING_TTL,
+)
+
+
+class CompactSerializer(JsonPlusSerializer):
+    """
+    一定サイズ以上のデータをzlibで圧縮して保存するシリアライザ
+
+    ReceiptOCRResultやAccountInfoはmsgpackでフィールドの値のみがエンコードされ、
+    OCRの生テキストなど大きなデータはさらに圧縮して保存する。
+    """
+
+    def dumps_typed(self, obj: Any) -> Tuple[str, bytes]:
+        type_, data = super().dumps_typed(obj)
+        if len(data) >= CHECKPOINT_COMPRESS_MIN_BYTES:
+            return f"{type_}+zlib", zlib.compress(data)
+        return type_, data
+
+    def loads_typed(self, data: Tuple[str, bytes]) -> Any:
+        type_, payload = data
+        if type_.endswith("+zlib"):
+            return super().loads_typed((type_.removesuffix("+zlib"), zlib.decompress(payload)))
+        return super().loads_typed(data)
+
+
+class SqliteCheckpointSaver(BaseCheckpointSaver[str]):
+    """SQLiteにチェックポイントを保存するチェックポインタ"""
+
+    def __init__(self, db_path: str = CHECKPOINT_DB_PATH) -> None:
+        super().__init__(serde=CompactSerializer())
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir)
+
+        # Streamlitとワークフローのタスクは別スレッドから呼び出すため、接続をロックで保護して共有する
+        self._lock = threading.Lock()
+        self._last_cleanup = 0.0
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        with self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS checkpoints (
+                    thread_id TEXT NOT NULL,
+                    checkpoint_ns TEXT NOT NULL DEFAULT '',
+                    checkpoint_id TEXT NOT NULL,
+                    parent_checkpoint_id TEXT,
+                    type TEXT NOT NULL,
+                    checkpoint BLOB NOT NULL,
+                    metadata_type TEXT NOT NULL,
+                    metadata BLOB NOT NULL,
+                    created_at REAL NOT NULL,               -- 保存時刻（UNIX時間）
+                    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+                )
+                """)
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS writes (
+                    thread_id TEXT NOT NULL,
+                    checkpoint_ns TEXT NOT NULL DEFAULT '',
+                    checkpoint_id TEXT NOT NULL,
+                    task_id TEXT NOT NULL,
+                    idx INTEGER NOT NULL,
+                    channel TEXT NOT NULL,
+                    type TEXT NOT NULL,
+                    value BLOB NOT NULL,
+                    task_path TEXT NOT NULL DEFAULT '',
+                    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+                )
+                """)
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS index_checkpoints_on_created_at "
+                "ON checkpoints(created_at)"
+            )
+
+        self.cleanup()
+
+    def _load_tuple(
+        self,
+        thread_id: str,
+        checkpoint_ns: str,
+        row: Sequence[Any],
+    ) -> CheckpointTuple:
+        """チェックポイントの行からCheckpointTupleを組み立てる（ロック取得済みで呼び出す）"""
+        checkpoint_id, parent_checkpoint_id, type_, checkpoint, metadata_type, metadata = row
+
+        writes = self.conn.execute(
+            """
+            SELECT task_id, channel, type, value FROM writes
+            WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?
+            ORDER BY task_id, idx
+            """,
+            (thread_id, checkpoint_ns, checkpoint_id),
+        ).fetchall()
+
+        # 親チェックポイントで送信されたSendを復元する
+        sends: List[Tuple[str, bytes]] = []
+        if parent_checkpoint_id:
+            sends = [
+                (send_type, value)
+                for send_type, value in self.conn.execute(
+                    """
+                    SELECT type, value FROM writes
+                    WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? AND channel = ?
+                    ORDER BY task_path, task_id, idx
+                    """,
+                    (thread_id, checkpoint_ns, parent_checkpoint_id, TASKS),
+                )
+            ]
+
+        loaded: Checkpoint = self.serde.loads_typed((type_, checkpoint))
+        return CheckpointTuple(
+            config={
+                "configurable": {
+                    "thread_id": thread_id,
+                    "checkpoint_ns": checkpoint_ns,
+                    "checkpoint_id": checkpoint_id,
+                }
+            },
+            checkpoint={
+                **loaded,
+                "pending_sends": [self.serde.loads_typed(send) for send in sends],
+            },
+            metadata=self.serde.loads_typed((metadata_type, metadata)),
+            parent_config=(
+                {
+                    "configurable": {
+                        "thread_id": thread_id,
+                        "checkpoint_ns": checkpoint_ns,
+                        "checkpoint_id": parent_checkpoint_id,
+                    }
+                }
+                if parent_checkpoint_id
+                else None
+            ),
+            pending_writes=[
+                (task_id, channel, self.serde.loads_typed((value_type, value)))
+                for task_id, channel, value_type, value in writes
+            ],
+        )
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        """指定したスレッドのチェックポイント（checkpoint_idがなければ最新のもの）を取得する"""
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        columns = "checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata"
+
+        with self._lock:
+            if checkpoint_id := get_checkpoint_id(config):
+                row = self.conn.execute(
+                    f"""
+                    SELECT {columns} FROM checkpoints
+                    WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?
+                    """,
+                    (thread_id, checkpoint_ns, checkpoint_id),
+                ).fetchone()
+            else:
+                row = self.conn.execute(
+                    f"""
+                    SELECT {columns} FROM checkpoints
+                    WHERE thread_id = ? AND checkpoint_ns = ?
+                    ORDER BY checkpoint_id DESC LIMIT 1
+                    """,
+                    (thread_id, checkpoint_ns),
+                ).fetchone()
+
+            if row is None:
+                return None
+            return self._load_tuple(thread_id, checkpoint_ns, row)
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        """条件に一致するチェックポイントを新しい順に返す"""
+        conditions: List[str] = []
+        params: List[Any] = []
+        if config:
+            conditions.append("thread_id = ?")
+            params.append(config["configurable"]["thread_id"])
+            if (checkpoint_ns := config["configurable"].get("checkpoint_ns")) is not None:
+                conditions.append("checkpoint_ns = ?")
+                params.append(checkpoint_ns)
+            if checkpoint_id := get_checkpoint_id(config):
+                conditions.append("checkpoint_id = ?")
+                params.append(checkpoint_id)
+        if before and (before_checkpoint_id := get_checkpoint_id(before)):
+            conditions.append("checkpoint_id < ?")
+            params.append(before_checkpoint_id)
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        with self._lock:
+            rows = self.conn.execute(
+                f"""
+                SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id,
+                       type, checkpoint, metadata_type, metadata
+                FROM checkpoints {where}
+                ORDER BY checkpoint_id DESC
+                """,
+                params,
+            ).fetchall()
+
+            results: List[CheckpointTuple] = []
+            for thread_id, checkpoint_ns, *row in rows:
+                if limit is not None and len(results) >= limit:
+                    break
+                checkpoint_tuple = self._load_tuple(thread_id, checkpoint_ns, row)
+                if filter and not all(
+                    checkpoint_tuple.metadata.get(key) == value for key, value in filter.items()
+                ):
+                    continue
+                results.append(checkpoint_tuple)
+
+        yield from results
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        """チェックポイントを保存する"""
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+
+        # Sendは親チェックポイントの書き込みから復元するため保存しない
+        saved = checkpoint.copy()
+        saved.pop("pending_sends", None)  # type: ignore[misc]
+        type_, serialized = self.serde.dumps_typed(saved)
+        metadata_type, serialized_metadata = self.serde.dumps_typed(
+            get_checkpoint_metadata(config, metadata)
+        )
+
+        with self._lock, self.conn:
+            self.conn.execute(
+                """
+                INSERT OR REPLACE INTO checkpoints (
+                    thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id,
+                    type, checkpoint, metadata_type, metadata, created_at
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    thread_id,
+                    checkpoint_ns,
+                    checkpoint["id"],
+                    config["configurable"].get("checkpoint_id"),
+                    type_,
+                    serialized,
+                    metadata_type,
+                    serialized_metadata,
+                    time.time(),
+                ),
+            )
+
+        # 一定時間ごとに古いスレッドを削除する
+        if time.time() - self._last_cleanup >= CHECKPOINT_CLEANUP_INTERVAL:
+            self.cleanup()
+
+        return {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": checkpoint["id"],
+            }
+        }
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        """タスクの書き込み（タスクの結果やinterruptなど）を保存する"""
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+
+        # 特殊な書き込み（エラーやinterruptなど）は上書きし、通常の書き込みは最初のものを残す
+        replace_rows: List[Tuple[Any, ...]] = []
+        ignore_rows: List[Tuple[Any, ...]] = []
+        for idx, (channel, value) in enumerate(writes):
+            type_, serialized = self.serde.dumps_typed(value)
+            row = (
+                thread_id,
+                checkpoint_ns,
+                checkpoint_id,
+                task_id,
+                WRITES_IDX_MAP.get(channel, idx),
+                channel,
+                type_,
+                serialized,
+                task_path,
+            )
+            (replace_rows if channel in WRITES_IDX_MAP else ignore_rows).append(row)
+
+        with self._lock, self.conn:
+            for conflict, rows in (("REPLACE", replace_rows), ("IGNORE", ignore_rows)):
+                self.conn.executemany(
+                    f"""
+                    INSERT OR {conflict} INTO writes (
+                        thread_id, checkpoint_ns, checkpoint_id, task_id, idx,
+                        channel, type, value, task_path
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    rows,
+                )
+
+    def delete_thread(self, thread_id: str) -> None:
+        """スレッドのチェックポイントと書き込みをすべて削除する"""
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM checkpoints WHERE thread_id = ?", (thread_id,))
+            self.conn.execute("DELETE FROM writes WHERE thread_id = ?", (thread_id,))
+
+    def cleanup(
+        self,
+        completed_ttl: float = CHECKPOINT_COMPLETED_TTL,
+        pending_ttl: float = CHECKPOINT_PENDING_TTL,
+    ) -> int:
+        """
+        一定時間更新のないスレッドを削除する
+
+        Parameters:
+        -----------
+        completed_ttl: float
+            フィードバック待ちでないスレッド（完了したスレッド）を保持する秒数
+        pending_ttl: float
+            フィードバック待ちのスレッドを保持する秒数
+
+        Returns:
+        --------
+        int
+            削除したスレッドの数
+        """
+        now = time.time()
+        self._last_cleanup = now
+
+        with self._lock:
+            # スレッドごとの最新のチェックポイントと、その時点でinterruptが残っているかを取得
+            rows = self.conn.execute(
+                """
+                SELECT c.thread_id, c.updated_at, EXISTS (
+                    SELECT 1 FROM writes w
+                    WHERE w.thread_id = c.thread_id AND w.checkpoint_ns = ''
+                      AND w.checkpoint_id = c.checkpoint_id AND w.channel = ?
+                ) AS pending
+                FROM (
+                    SELECT thread_id, MAX(checkpoint_id) AS checkpoint_id,
+                           MAX(created_at) AS updated_at
+                    FROM checkpoints
+                    WHERE checkpoint_ns = ''
+                    GROUP BY thread_id
+                ) c
+                """,
+                (INTERRUPT,),
+            ).fetchall()
+
+            expired = [
+                (thread_id,)
+                for thread_id, updated_at, pending in rows
+                if now - updated_at >= (pending_ttl if pending else completed_ttl)
+            ]
+            if expired:
+                with self.conn:
+                    self.conn.executemany("DELETE FROM checkpoints WHERE thread_id = ?", expired)
+                    self.conn.executemany("DELETE FROM writes WHERE thread_id = ?", expired)
+
+        return len(expired)
+
+    def get_next_version(self, current: Optional[str], channel: ChannelProtocol) -> str:
+        """チャンネルの次のバージョンを返す（文字列として比較しても単調増加する形式）"""
+        if current is None:
+            current_v = 0
+        elif isinstance(current, int):
+            current_v = current
+        else:
+            current_v = int(current.split(".")[0])
+        return f"{current_v + 1:032}.{random.random():016}"
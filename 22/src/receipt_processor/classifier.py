@@ -0,0 +1,228 @@
+"""
+ルールベースの勘定科目判定機能
+
+承認済みの台帳から学習した取引先ごとの勘定科目の履歴と、品目名のキーワードルールを組み合わせて
+勘定科目を判定する。確信度が閾値以上の領収書はLLMを呼び出さずに判定結果を返し、
+判断が難しい領収書のみLLMによる提案に回す。
+"""
+
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from src.receipt_processor.constants import (
+    RULE_CONFIDENCE_THRESHOLD,
+    RULE_MIN_VENDOR_COUNT,
+    RULE_SHOP_NAME_CONFIDENCE,
+)
+from src.receipt_processor.models import AccountInfo, ReceiptOCRResult
+from src.receipt_processor.storage import get_vendor_accounts
+
+# 品目名・店舗名に含まれるキーワードと勘定科目の対応
+KEYWORD_RULES: Dict[str, List[str]] = {
+    "旅費交通費": [
+        "乗車券",
+        "特急券",
+        "運賃",
+        "切符",
+        "きっぷ",
+        "定期券",
+        "IC乗車",
+        "鉄道",
+        "JR",
+        "地下鉄",
+        "メトロ",
+        "路線バス",
+        "高速バス",
+        "タクシー",
+        "航空券",
+        "駐車場",
+        "高速道路",
+    ],
+    "通信費": ["切手", "はがき", "レターパック", "郵便", "ゆうパック", "宅急便", "送料", "通信料"],
+    "新聞図書費": ["書籍", "雑誌", "新聞", "書店", "文庫", "週刊"],
+    "消耗品費": [
+        "文具",
+        "ボールペン",
+        "ノート",
+        "コピー用紙",
+        "トナー",
+        "インク",
+        "電池",
+        "ファイル",
+    ],
+    "水道光熱費": ["電気料金", "ガス料金", "水道料金"],
+}
+
+# 適格請求書発行事業者の登録番号（Tから始まる13桁の数字）
+INVOICE_NUMBER_PATTERN = re.compile(r"T\d{13}")
+
+# 消費税額の記載（「内消費税等 ¥100」「消費税 100円」など。税率の「10%」は金額として扱わない）
+TAX_LABEL_PATTERN = re.compile(r"消費税|内税|税額")
+TAX_AMOUNT_PATTERN = re.compile(r"(?:消費税|内税|税額)[^\d\n]{0,8}?([\d,]+)(?![\d,%％])")
+
+
+def match_keyword_rules(ocr_result: ReceiptOCRResult) -> Tuple[Optional[str], float]:
+    """
+    キーワードルールで勘定科目を判定する
+
+    品目がある場合は、品目名がキーワードに一致した勘定科目の割合を確信度とする。
+    品目がない場合は店舗名のみで判定するが、店舗名の部分一致（「JR」を含む店名など）は
+    誤判定しやすいため、確信度をRULE_SHOP_NAME_CONFIDENCE（閾値未満）に抑えた参考値とする。
+
+    Parameters:
+    -----------
+    ocr_result: ReceiptOCRResult
+        OCR処理結果の構造化データ
+
+    Returns:
+    --------
+    Tuple[Optional[str], float]
+        判定した勘定科目（判定できない場合はNone）と確信度（0.0〜1.0）
+    """
+    texts = [item.name for item in ocr_result.items] or [ocr_result.shop_name]
+
+    votes: Counter = Counter()
+    for text in texts:
+        accounts = {
+            account
+            for account, keywords in KEYWORD_RULES.items()
+            if any(keyword in text for keyword in keywords)
+        }
+        # 複数の勘定科目に一致する品目は判定に使用しない
+        if len(accounts) == 1:
+            votes[accounts.pop()] += 1
+
+    if not votes:
+        return None, 0.0
+
+    account, count = votes.most_common(1)[0]
+    if not ocr_result.items:
+        return account, RULE_SHOP_NAME_CONFIDENCE
+    return account, count / len(texts)
+
+
+def match_vendor_history(ocr_result: ReceiptOCRResult) -> Tuple[Optional[Dict[str, str]], float]:
+    """
+    台帳の取引先ごとの履歴で勘定科目を判定する
+
+    Parameters:
+    -----------
+    ocr_result: ReceiptOCRResult
+        OCR処理結果の構造化データ
+
+    Returns:
+    --------
+    Tuple[Optional[Dict[str, str]], float]
+        最も多く使われた勘定科目とその中で最も多い補助科目（判定できない場合はNone）と
+        確信度（勘定科目の件数の割合、0.0〜1.0）
+    """
+    if not ocr_result.shop_name:
+        return None, 0.0
+
+    history = get_vendor_accounts(ocr_result.shop_name)
+    total = sum(row["count"] for row in history)
+    if total < RULE_MIN_VENDOR_COUNT:
+        return None, 0.0
+
+    # 確信度は勘定科目ごとの件数で求める（補助科目が分かれていても同じ勘定科目として数える）
+    account_counts: Counter = Counter()
+    sub_accounts: Dict[str, str] = {}
+    for row in history:
+        account_counts[row["account"]] += row["count"]
+        # 履歴は件数の多い順のため、最初に現れた補助科目がその勘定科目で最も多く使われたもの
+        sub_accounts.setdefault(row["account"], row["sub_account"])
+
+    account, count = account_counts.most_common(1)[0]
+    return {"account": account, "sub_account": sub_accounts[account]}, count / total
+
+
+def find_invoice_number(ocr_result: ReceiptOCRResult) -> str:
+    """OCR結果からインボイス番号（登録番号）を探す（見つからない場合は空文字列）"""
+    texts = [info.value for info in ocr_result.other_info] + [ocr_result.raw_text]
+    for text in texts:
+        match = INVOICE_NUMBER_PATTERN.search(text.replace("-", ""))
+        if match:
+            return match.group()
+    return ""
+
+
+def find_tax_amount(ocr_result: ReceiptOCRResult) -> str:
+    """OCR結果から消費税額を探す（数字のみ、カンマなし。見つからない場合は空文字列）"""
+    for info in ocr_result.other_info:
+        if TAX_LABEL_PATTERN.search(info.key) and not re.search(r"[%％]", info.value):
+            digits = re.sub(r"\D", "", info.value)
+            if digits:
+                return digits
+    match = TAX_AMOUNT_PATTERN.search(ocr_result.raw_text)
+    return match.group(1).replace(",", "") if match else ""
+
+
+def fill_receipt_details(account_info: AccountInfo, ocr_result: ReceiptOCRResult) -> AccountInfo:
+    """
+    勘定科目情報の空欄のうち、OCR結果から求められる項目（消費税額・インボイス番号）を補う
+
+    日付・金額・店舗名のみから作成した提案など、OCR結果の一部しか参照していない提案に使用する。
+    """
+    updates: Dict[str, str] = {}
+    if not account_info.tax_amount:
+        updates["tax_amount"] = find_tax_amount(ocr_result)
+    if not account_info.invoice_number:
+        updates["invoice_number"] = find_invoice_number(ocr_result)
+    return account_info.model_copy(update=updates)
+
+
+def classify_receipt(
+    ocr_result: ReceiptOCRResult,
+    threshold: float = RULE_CONFIDENCE_THRESHOLD,
+) -> Optional[AccountInfo]:
+    """
+    ルールベースで勘定科目を判定する（確信度が閾値未満の場合はNoneを返す）
+
+    取引先の履歴とキーワードルールの判定が食い違う場合は、判断が難しいものとしてNoneを返す。
+
+    Parameters:
+    -----------
+    ocr_result: ReceiptOCRResult
+        OCR処理結果の構造化データ
+    threshold: float
+        LLMを呼び出さずに判定結果を採用する確信度の下限
+
+    Returns:
+    --------
+    Optional[AccountInfo]
+        判定した勘定科目情報。LLMによる提案が必要な場合はNone
+    """
+    keyword_account, keyword_confidence = match_keyword_rules(ocr_result)
+    vendor_account, vendor_confidence = match_vendor_history(ocr_result)
+
+    if keyword_account and vendor_account and keyword_account != vendor_account["account"]:
+        return None
+
+    if vendor_account and vendor_confidence >= threshold:
+        account = vendor_account["account"]
+        sub_account = vendor_account["sub_account"]
+        reason = (
+            f"取引先「{ocr_result.shop_name}」の過去の承認履歴で"
+            f"{vendor_confidence:.0%}が{account}として処理されているため"
+        )
+    elif keyword_account and keyword_confidence >= threshold:
+        account = keyword_account
+        sub_account = vendor_account["sub_account"] if vendor_account else ""
+        reason = f"品目名が{account}のキーワードに一致したため（ルールによる自動判定）"
+    else:
+        return None
+
+    description = "、".join(item.name for item in ocr_result.items[:3]) or ocr_result.shop_name
+
+    return AccountInfo(
+        date=ocr_result.date,
+        account=account,
+        sub_account=sub_account,
+        amount=ocr_result.amount,
+        tax_amount=find_tax_amount(ocr_result),
+        vendor=ocr_result.shop_name,
+        invoice_number=find_invoice_number(ocr_result),
+        description=description,
+        reason=reason,
+    )
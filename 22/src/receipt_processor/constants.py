@@ -3,8 +3,45 @@
 """
 
 # ファイルパス関連
-CSV_FILE_PATH = "tmp/db.csv"
+LEDGER_DB_PATH = "tmp/ledger.db"
+CSV_FILE_PATH = "tmp/db.csv"  # 以前のバージョンで使用していたCSV（台帳の新規作成時に取り込む）
+REVIEW_QUEUE_PATH = "tmp/review_queue.json"
+JOURNAL_DIR = "tmp/journal"
+OCR_CACHE_DB_PATH = "tmp/ocr_cache.db"
+CHECKPOINT_DB_PATH = "tmp/checkpoints.db"
 
 # LLM関連
 CLAUDE_FAST_MODEL = "claude-3-5-haiku-20241022"
 CLAUDE_SMART_MODEL = "claude-3-7-sonnet-20250219"
+
+# ルールベースの勘定科目判定関連
+RULE_CONFIDENCE_THRESHOLD = 0.9  # LLMを呼び出さずに判定結果を採用する確信度の下限
+RULE_MIN_VENDOR_COUNT = 3  # 取引先の履歴を判定に使用する最小の承認件数
+RULE_SHOP_NAME_CONFIDENCE = 0.5  # 店舗名のみがキーワードに一致した場合の確信度（閾値未満の参考値）
+
+# OCRキャッシュ関連
+PHASH_MAX_DISTANCE = 4  # 重複の可能性ありとみなす知覚ハッシュのハミング距離
+
+# ジャーナル関連
+JOURNAL_FSYNC_BATCH_SIZE = 10  # この件数ごとにfsyncする
+JOURNAL_FSYNC_INTERVAL = 1.0  # 前回のfsyncからこの秒数が経過していればfsyncする
+JOURNAL_SEGMENT_MAX_RECORDS = 1000  # 1セグメントあたりの最大レコード数
+JOURNAL_COMPACT_SEGMENTS = 8  # セグメント数がこの値に達したらスナップショットに統合する
+
+# チェックポイント関連
+CHECKPOINT_COMPLETED_TTL = 24 * 60 * 60  # 完了したスレッドを保持する秒数
+CHECKPOINT_PENDING_TTL = 30 * 24 * 60 * 60  # フィードバック待ちのスレッドを保持する秒数
+CHECKPOINT_CLEANUP_INTERVAL = 60 * 60  # 古いスレッドを削除する間隔（秒）
+CHECKPOINT_COMPRESS_MIN_BYTES = 1024  # この大きさ以上のデータは圧縮して保存する
+
+# バックグラウンドジョブ関連
+JOB_MAX_WORKERS = 8  # ワークフローを同時に実行するスレッド数
+JOB_RETENTION = 60 * 60  # 終了したジョブの状態を保持する秒数
+JOB_POLL_INTERVAL = 0.5  # 画面がジョブの状態を確認する間隔（秒）
+
+# 履歴表示関連
+HISTORY_PAGE_SIZE = 50  # 履歴画面の1ページあたりの表示件数
+
+# 一括処理関連
+BATCH_MAX_WORKERS = 4  # 画像前処理を行うプロセス数
+BATCH_MAX_CONCURRENCY = 5  # 同時に実行するLLM呼び出しの数
@@ -0,0 +1,153 @@
+"""
+ワークフローをバックグラウンドで実行するジョブキュー
+
+Streamlitのスクリプト実行とLLM呼び出しを切り離すため、ワークフローはワーカースレッドで実行する。
+画面側はthread_idをキーにジョブの状態とイベントを取得して表示を更新する。
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional, Union
+
+from langgraph.types import Command
+
+from src.receipt_processor.agent import receipt_workflow
+from src.receipt_processor.constants import JOB_MAX_WORKERS, JOB_RETENTION
+from src.receipt_processor.models import JobStatus, WorkflowJob
+
+# 終了した（新しい入力を受け付けられる）ジョブの状態
+FINISHED_STATUSES = (JobStatus.INTERRUPTED, JobStatus.COMPLETED, JobStatus.FAILED)
+
+
+class WorkflowJobQueue:
+    """ワークフローのジョブキュー"""
+
+    def __init__(self, max_workers: int = JOB_MAX_WORKERS) -> None:
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="workflow")
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, WorkflowJob] = {}
+
+    def submit(self, thread_id: str, input_data: Union[str, Command]) -> WorkflowJob:
+        """
+        ワークフローの実行（開始または再開）をキューに登録する
+
+        同じthread_idのジョブが実行中の場合は新たに登録せず、実行中のジョブを返す
+        （Streamlitの再実行で同じ処理が二重に実行されるのを防ぐ）。
+
+        Parameters:
+        -----------
+        thread_id: str
+            ワークフローのスレッドID
+        input_data: Union[str, Command]
+            ワークフローへの入力（画像パスまたはフィードバックのCommand）
+
+        Returns:
+        --------
+        WorkflowJob
+            登録したジョブの状態
+        """
+        with self._lock:
+            self._remove_expired_jobs()
+
+            job = self._jobs.get(thread_id)
+            if job is not None and job.status not in FINISHED_STATUSES:
+                return job.model_copy(deep=True)
+
+            job = WorkflowJob(thread_id=thread_id, updated_at=time.time())
+            self._jobs[thread_id] = job
+            snapshot = job.model_copy(deep=True)
+
+        self._executor.submit(self._run, thread_id, input_data)
+        return snapshot
+
+    def get(self, thread_id: str) -> Optional[WorkflowJob]:
+        """
+        ジョブの状態を取得する
+
+        Parameters:
+        -----------
+        thread_id: str
+            ワークフローのスレッドID
+
+        Returns:
+        --------
+        Optional[WorkflowJob]
+            ジョブの状態のコピー。ジョブが存在しない場合はNone
+        """
+        with self._lock:
+            job = self._jobs.get(thread_id)
+            return job.model_copy(deep=True) if job is not None else None
+
+    def _update(self, thread_id: str, **changes: Any) -> None:
+        """ジョブの状態を更新する"""
+        with self._lock:
+            job = self._jobs[thread_id]
+            for key, value in changes.items():
+                setattr(job, key, value)
+            job.updated_at = time.time()
+
+    def _add_event(self, thread_id: str, event: Dict[str, Any]) -> None:
+        """ジョブにワークフローのイベントを追加する"""
+        with self._lock:
+            job = self._jobs[thread_id]
+            job.events.append(event)
+            job.updated_at = time.time()
+
+    def _run(self, thread_id: str, input_data: Union[str, Command]) -> None:
+        """ワーカースレッドでワークフローを実行する"""
+        self._update(thread_id, status=JobStatus.RUNNING)
+
+        config = {"configurable": {"thread_id": thread_id}}
+        try:
+            for mode, payload in receipt_workflow.stream(
+                input_data, config=config, stream_mode=["custom", "values"]
+            ):
+                # ペイロードがNoneの場合はスキップ
+                if payload is None:
+                    continue
+
+                if mode == "custom":
+                    self._add_event(thread_id, payload)
+
+                # 割り込みの検出
+                elif mode == "values" and "__interrupt__" in payload:
+                    self._update(
+                        thread_id,
+                        status=JobStatus.INTERRUPTED,
+                        interrupt=payload["__interrupt__"][0].value,
+                    )
+                    return
+
+            self._update(thread_id, status=JobStatus.COMPLETED)
+
+        except Exception as e:
+            print(f"ワークフロー実行エラー: {e}")
+            import traceback
+
+            print(f"詳細エラー: {traceback.format_exc()}")
+            self._update(thread_id, status=JobStatus.FAILED, error=str(e))
+
+    def _remove_expired_jobs(self) -> None:
+        """終了してから一定時間経過したジョブを削除する（ロック取得済みで呼び出す）"""
+        now = time.time()
+        expired = [
+            thread_id
+            for thread_id, job in self._jobs.items()
+            if job.status in FINISHED_STATUSES and now - job.updated_at >= JOB_RETENTION
+        ]
+        for thread_id in expired:
+            del self._jobs[thread_id]
+
+
+_job_queue: Optional[WorkflowJobQueue] = None
+_job_queue_lock = threading.Lock()
+
+
+def get_job_queue() -> WorkflowJobQueue:
+    """アプリケーション共通のジョブキューを返す（すべてのセッションで共有する）"""
+    global _job_queue
+    with _job_queue_lock:
+        if _job_queue is None:
+            _job_queue = WorkflowJobQueue()
+        return _job_queue
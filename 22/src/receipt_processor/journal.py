@@ -0,0 +1,314 @@
+"""
+領収書データの追記型ジャーナル
+
+台帳への書き込みをJSONL形式のセグメントファイルに追記していく。
+保存のたびにファイル全体をコピーするバックアップと異なり、1件あたりのコストは一定で、
+任意の時点の状態を復元（ポイントインタイムリストア）できる。
+
+- 台帳へのコミットより先にジャーナルへ書き込む（ジャーナルに書き込めない場合は保存しない）
+- fsyncは一定件数または一定時間ごとにまとめて行う
+- セグメントはプロセスごとに別のファイルを排他的に作成し、一定件数ごとに切り替える
+- 古いセグメントはスナップショットにまとめ（コンパクション）、スナップショットが増えたら1つに統合する
+- 書き込み中のセグメントはファイルロックで保護し、別のプロセスのコンパクションの対象にしない
+- 読み込み時は各ファイルのレコードを時刻順にマージする
+
+ファイルロック（fcntl）はPOSIX環境でのみ使用できる。Windowsではロックを行わないため、
+複数のプロセスから同じジャーナルに書き込む場合はPOSIX環境で実行すること。
+"""
+
+import atexit
+import heapq
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import IO, Any, Dict, Iterator, List, Optional, Sequence
+
+from src.receipt_processor.constants import (
+    JOURNAL_COMPACT_SEGMENTS,
+    JOURNAL_DIR,
+    JOURNAL_FSYNC_BATCH_SIZE,
+    JOURNAL_FSYNC_INTERVAL,
+    JOURNAL_SEGMENT_MAX_RECORDS,
+)
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None  # type: ignore[assignment]
+
+# コンパクションを同時に1つのプロセスでのみ実行するためのロックファイル
+COMPACT_LOCK_FILE_NAME = "compact.lock"
+
+
+def _lock(file: IO[str], blocking: bool = True) -> bool:
+    """ファイルの排他ロックを取得する（取得できなかった場合はFalse。POSIX以外では何もしない）"""
+    if fcntl is None:
+        return True
+    try:
+        fcntl.flock(file, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+    return True
+
+
+def _unique_name(prefix: str) -> str:
+    """プロセス間で重複しないファイル名を返す（作成時刻・プロセスID・乱数）"""
+    return f"{prefix}-{time.time_ns():020d}-{os.getpid()}-{uuid.uuid4().hex[:8]}.jsonl"
+
+
+class ReceiptJournal:
+    """領収書データの追記型ジャーナル"""
+
+    def __init__(self, journal_dir: str = JOURNAL_DIR) -> None:
+        self.journal_dir = Path(journal_dir)
+        self.journal_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._file: Optional[IO[str]] = None
+        self._segment_path: Optional[Path] = None
+        self._segment_records = 0
+        self._unsynced_records = 0
+        self._last_sync = time.monotonic()
+
+    def _segment_paths(self) -> List[Path]:
+        """セグメントファイルのパスを作成順に返す"""
+        return sorted(self.journal_dir.glob("segment-*.jsonl"))
+
+    def _snapshot_paths(self) -> List[Path]:
+        """スナップショットファイルのパスを作成順に返す"""
+        return sorted(self.journal_dir.glob("snapshot-*.jsonl"))
+
+    def _open_segment(self) -> IO[str]:
+        """新しいセグメントファイルを開く（必要に応じてコンパクションを行う）"""
+        if len(self._segment_paths()) >= JOURNAL_COMPACT_SEGMENTS:
+            self._compact_segments()
+
+        # 書き込み中のセグメントが別のプロセスのコンパクションで統合・削除されないよう、
+        # 重複しない一時ファイル名で排他的に作成してロックを取得してから、セグメント名を付ける
+        tmp_path = self.journal_dir / _unique_name("open").replace(".jsonl", ".tmp")
+        fd = os.open(tmp_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY | os.O_APPEND, 0o644)
+        file = os.fdopen(fd, mode="a", encoding="utf-8")
+        _lock(file)
+        while True:
+            path = self.journal_dir / _unique_name("segment")
+            try:
+                # リンクの作成は既存のファイルを上書きしない
+                os.link(tmp_path, path)
+                break
+            except FileExistsError:
+                continue
+        tmp_path.unlink()
+        self._segment_path = path
+        self._segment_records = 0
+        return file
+
+    def _sync(self) -> None:
+        """バッファをファイルに書き出してfsyncする"""
+        if self._file is None or self._unsynced_records == 0:
+            return
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced_records = 0
+        self._last_sync = time.monotonic()
+
+    def append(self, op: str, data: Dict[str, Any]) -> str:
+        """
+        レコードをジャーナルに追記する
+
+        レコードはOSに書き出してから返す（fsyncは一定件数または一定時間ごとにまとめて行う）。
+        書き込みに失敗した場合は例外を送出する。
+
+        Parameters:
+        -----------
+        op: str
+            操作の種類（例: "insert"）
+        data: Dict[str, Any]
+            保存したデータ
+
+        Returns:
+        --------
+        str
+            レコードのID
+        """
+        with self._lock:
+            if self._file is None or self._segment_records >= JOURNAL_SEGMENT_MAX_RECORDS:
+                if self._file is not None:
+                    self._sync()
+                    self._file.close()
+                    self._file = None
+                self._file = self._open_segment()
+
+            record_id = uuid.uuid4().hex
+            record = {
+                "id": record_id,
+                "ts": datetime.now().isoformat(timespec="microseconds"),
+                "op": op,
+                "data": data,
+            }
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._segment_records += 1
+            self._unsynced_records += 1
+
+            # fsyncは一定件数または一定時間ごとにまとめて行う
+            if (
+                self._unsynced_records >= JOURNAL_FSYNC_BATCH_SIZE
+                or time.monotonic() - self._last_sync >= JOURNAL_FSYNC_INTERVAL
+            ):
+                self._sync()
+            else:
+                self._file.flush()
+
+            return record_id
+
+    def flush(self) -> None:
+        """未同期のレコードをfsyncする"""
+        with self._lock:
+            self._sync()
+
+    def close(self) -> None:
+        """ジャーナルを閉じる"""
+        with self._lock:
+            self._sync()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _write_snapshot(self, files: Sequence[IO[str]]) -> Path:
+        """ファイルのレコードを時刻順にマージして新しいスナップショットに書き出す"""
+        snapshot_path = self.journal_dir / _unique_name("snapshot")
+        tmp_path = snapshot_path.with_suffix(".tmp")
+        with open(tmp_path, mode="w", encoding="utf-8") as snapshot:
+            for record in heapq.merge(
+                *(self._parse_lines(file) for file in files), key=lambda record: record["ts"]
+            ):
+                snapshot.write(json.dumps(record, ensure_ascii=False) + "\n")
+            snapshot.flush()
+            os.fsync(snapshot.fileno())
+        os.replace(tmp_path, snapshot_path)
+        return snapshot_path
+
+    def _compact_segments(self) -> int:
+        """
+        書き込み中でないセグメントを1つのスナップショットにまとめ、削除する
+
+        書き込み中のセグメントは書き込み側のプロセスがロックしているため、
+        ロックを取得できたセグメントのみを対象にする。
+        スナップショットの数がJOURNAL_COMPACT_SEGMENTSに達した場合は、スナップショットも1つに統合する。
+
+        Returns:
+        --------
+        int
+            まとめたセグメントの数
+        """
+        with open(self.journal_dir / COMPACT_LOCK_FILE_NAME, mode="a") as lock_file:
+            _lock(lock_file)
+
+            segments: List[IO[str]] = []
+            try:
+                for path in self._segment_paths():
+                    # 自身が書き込み中のセグメント（ロックを使えない環境向け）
+                    if self._file is not None and path == self._segment_path:
+                        continue
+                    try:
+                        file = open(path, encoding="utf-8")
+                    except FileNotFoundError:
+                        continue
+                    if not _lock(file, blocking=False):
+                        file.close()
+                        continue
+                    segments.append(file)
+
+                if not segments:
+                    return 0
+
+                self._write_snapshot(segments)
+                for segment in segments:
+                    Path(segment.name).unlink()
+            finally:
+                for segment in segments:
+                    segment.close()
+
+            # スナップショットが増えた場合は1つに統合する（統合の頻度を抑えてコストを償却する）
+            snapshot_paths = self._snapshot_paths()
+            if len(snapshot_paths) >= JOURNAL_COMPACT_SEGMENTS:
+                snapshots = [open(path, encoding="utf-8") for path in snapshot_paths]
+                try:
+                    self._write_snapshot(snapshots)
+                finally:
+                    for snapshot in snapshots:
+                        snapshot.close()
+                for path in snapshot_paths:
+                    path.unlink()
+
+            return len(segments)
+
+    def compact(self) -> int:
+        """
+        書き込み中でないセグメントをスナップショットにまとめる
+
+        Returns:
+        --------
+        int
+            まとめたセグメントの数
+        """
+        with self._lock:
+            return self._compact_segments()
+
+    @staticmethod
+    def _parse_lines(file: IO[str]) -> Iterator[Dict[str, Any]]:
+        """ジャーナルファイルの各行をレコードとして読み込む（書き込み途中の不完全な行は無視する）"""
+        for line in file:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+    @classmethod
+    def _read_file(cls, path: Path) -> Iterator[Dict[str, Any]]:
+        """ジャーナルファイルのレコードを読み込む"""
+        try:
+            file = open(path, encoding="utf-8")
+        except FileNotFoundError:
+            return
+        with file:
+            yield from cls._parse_lines(file)
+
+    def read_records(self, until: Optional[datetime] = None) -> Iterator[Dict[str, Any]]:
+        """
+        ジャーナルのレコードを時刻順に返す（すべてのスナップショットとセグメントをマージする）
+
+        Parameters:
+        -----------
+        until: Optional[datetime]
+            指定した場合、この時刻以前のレコードのみを返す
+
+        Returns:
+        --------
+        Iterator[Dict[str, Any]]
+            ジャーナルのレコード
+        """
+        paths = [*self._snapshot_paths(), *self._segment_paths()]
+        for record in heapq.merge(
+            *(self._read_file(path) for path in paths), key=lambda record: record["ts"]
+        ):
+            if until is not None and datetime.fromisoformat(record["ts"]) > until:
+                return
+            yield record
+
+
+_journal: Optional[ReceiptJournal] = None
+_journal_lock = threading.Lock()
+
+
+def get_journal() -> ReceiptJournal:
+    """アプリケーション共通のジャーナルを返す"""
+    global _journal
+    with _journal_lock:
+        if _journal is None:
+            _journal = ReceiptJournal()
+            # 終了時に未同期のレコードをfsyncする
+            atexit.register(_journal.close)
+        return _journal
@@ -3,7 +3,7 @@
 """
 
 from enum import Enum
-from typing import List
+from typing import Any, Dict, List, Optional
 
 from pydantic import BaseModel, Field
 
@@ -24,18 +24,30 @@ class DisplayMode(str, Enum):
     """表示モード定義（UI）"""
 
     INPUT = "input"  # 領収書入力モード
+    BATCH = "batch"  # 一括処理モード
     HISTORY = "history"  # 履歴表示モード
 
 
 class EventType(str, Enum):
     """イベントタイプ定義（ワークフロー）"""
 
+    OCR_PARTIAL = "ocr_partial"
     OCR_DONE = "ocr_done"
     ACCOUNT_SUGGESTED = "account_suggested"
     SAVE_COMPLETED = "save_completed"
     ERROR = "error"
 
 
+class JobStatus(str, Enum):
+    """バックグラウンドジョブの状態定義（ワークフローの実行）"""
+
+    QUEUED = "queued"  # 実行待ち
+    RUNNING = "running"  # 実行中
+    INTERRUPTED = "interrupted"  # ユーザーからのフィードバック待ちで停止中
+    COMPLETED = "completed"  # ワークフローが完了した
+    FAILED = "failed"  # エラーで終了した
+
+
 class CommandType(str, Enum):
     """コマンドタイプ定義（ワークフロー）"""
 
@@ -67,13 +79,9 @@ class ReceiptInfoItem(BaseModel):
 class ReceiptOCRResult(BaseModel):
     """OCR結果の構造化データモデル"""
 
-    raw_text: str = Field(description="領収書から抽出された生テキスト")
-    date: str = Field(
-        description="領収書の日付（YYYY-MM-DD形式、不明な場合は空文字列）"
-    )
-    amount: str = Field(
-        description="金額（数字のみ、カンマなし、不明な場合は空文字列）"
-    )
+    # 日付・金額・店舗名を先に生成させ、ストリーミング時に勘定科目の先行提案を早く開始できるようにする
+    date: str = Field(description="領収書の日付（YYYY-MM-DD形式、不明な場合は空文字列）")
+    amount: str = Field(description="金額（数字のみ、カンマなし、不明な場合は空文字列）")
     shop_name: str = Field(description="店舗・発行元名称（不明な場合は空文字列）")
     items: List[ReceiptItem] = Field(
         description="購入品目のリスト（ある場合のみ）", default_factory=list
@@ -82,10 +90,11 @@ class ReceiptOCRResult(BaseModel):
         description="その他抽出できた情報（領収書番号、支払方法など）",
         default_factory=list,
     )
+    raw_text: str = Field(description="領収書から抽出された生テキスト")
 
 
 class AccountInfo(BaseModel):
-    """勘定科目情報のデータモデル（CSVにも保存される）"""
+    """勘定科目情報のデータモデル（台帳にも保存される）"""
 
     date: str = Field(description="日付（YYYY-MM-DD形式）")
     account: str = Field(description="勘定科目")
@@ -93,8 +102,31 @@ class AccountInfo(BaseModel):
     amount: str = Field(description="金額", default="")
     tax_amount: str = Field(description="消費税額", default="")
     vendor: str = Field(description="取引先", default="")
-    invoice_number: str = Field(
-        description="インボイス番号（通常Tから始まる文字列）", default=""
-    )
+    invoice_number: str = Field(description="インボイス番号（通常Tから始まる文字列）", default="")
     description: str = Field(description="摘要", default="")
     reason: str = Field(description="この勘定科目と判断した理由")
+
+
+class ReviewItem(BaseModel):
+    """一括処理の結果を承認待ちとして保持するデータモデル（レビューキュー）"""
+
+    id: str = Field(description="レビュー項目のID")
+    image_name: str = Field(description="処理した画像のファイル名")
+    ocr_result: Optional[ReceiptOCRResult] = Field(description="OCR結果", default=None)
+    account_info: Optional[AccountInfo] = Field(description="勘定科目の提案", default=None)
+    error: str = Field(description="処理に失敗した場合のエラーメッセージ", default="")
+
+
+class WorkflowJob(BaseModel):
+    """バックグラウンドで実行するワークフローのジョブ（thread_idごとに1つ）"""
+
+    thread_id: str = Field(description="ワークフローのスレッドID")
+    status: JobStatus = Field(description="ジョブの状態", default=JobStatus.QUEUED)
+    events: List[Dict[str, Any]] = Field(
+        description="ワークフローから受信したイベント", default_factory=list
+    )
+    interrupt: Optional[Dict[str, Any]] = Field(
+        description="フィードバック待ちの割り込み情報", default=None
+    )
+    error: Optional[str] = Field(description="エラーメッセージ", default=None)
+    updated_at: float = Field(description="最終更新時刻（UNIX時間）", default=0.0)
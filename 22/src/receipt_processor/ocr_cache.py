@@ -0,0 +1,286 @@
+"""
+OCR結果のキャッシュ機能
+
+前処理済み画像のSHA-256ハッシュとモデル名をキーにOCR結果をSQLiteに保存し、
+同じ領収書の再アップロード時にVision APIの呼び出しを省略する。
+また、知覚ハッシュ（dHash）の距離から重複して提出された可能性のある領収書を検出する。
+"""
+
+import hashlib
+import io
+import os
+import sqlite3
+import threading
+from contextlib import closing
+from typing import Any, Dict, List, Optional, Set
+
+from PIL import Image
+
+from src.receipt_processor.constants import OCR_CACHE_DB_PATH, PHASH_MAX_DISTANCE
+from src.receipt_processor.models import ReceiptOCRResult
+
+# スキーマのバージョン（テーブル構成を変更した場合はインクリメントする）
+SCHEMA_VERSION = 1
+
+# 知覚ハッシュを分割するバンド数
+# ハミング距離がPHASH_BANDS未満の2つのハッシュは、鳩の巣原理により少なくとも1つのバンドが完全に一致する
+PHASH_BANDS = PHASH_MAX_DISTANCE + 1
+BAND_COLUMNS = [f"phash_band{band}" for band in range(PHASH_BANDS)]
+
+# バンドで絞り込めない距離が指定された場合に走査する最新の件数
+PHASH_SCAN_LIMIT = 5000
+
+# スキーマの初期化が完了したDBファイルのパス
+_initialized_paths: Set[str] = set()
+_init_lock = threading.Lock()
+
+
+def _connect(db_path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def init_database(db_path: str = OCR_CACHE_DB_PATH) -> None:
+    """キャッシュ用データベースのテーブル・インデックスを作成する（DBファイルごとに一度だけ実行する）"""
+    with _init_lock:
+        if db_path in _initialized_paths:
+            return
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir)
+
+        with closing(_connect(db_path)) as conn, conn:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version < SCHEMA_VERSION:
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS ocr_cache (
+                        image_hash TEXT NOT NULL,                -- 前処理済み画像のSHA-256
+                        model_name TEXT NOT NULL,                -- OCRに使用したモデル名
+                        perceptual_hash INTEGER NOT NULL,        -- 知覚ハッシュ（64bit）
+                        result TEXT NOT NULL,                    -- ReceiptOCRResultのJSON
+                        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                        PRIMARY KEY (image_hash, model_name)
+                    )
+                    """)
+
+                # 類似画像の検索用に、知覚ハッシュを分割したバンドの列とインデックスを追加する
+                existing = {row["name"] for row in conn.execute("PRAGMA table_info(ocr_cache)")}
+                for column in BAND_COLUMNS:
+                    if column not in existing:
+                        conn.execute(f"ALTER TABLE ocr_cache ADD COLUMN {column} INTEGER")
+                    conn.execute(
+                        f"CREATE INDEX IF NOT EXISTS index_ocr_cache_on_{column} ON ocr_cache({column})"
+                    )
+
+                # 既存の行のバンドを埋める
+                rows = conn.execute(
+                    "SELECT rowid, perceptual_hash FROM ocr_cache WHERE phash_band0 IS NULL"
+                ).fetchall()
+                conn.executemany(
+                    f"UPDATE ocr_cache SET {', '.join(f'{column} = ?' for column in BAND_COLUMNS)}"
+                    " WHERE rowid = ?",
+                    [
+                        (*split_perceptual_hash(row["perceptual_hash"]), row["rowid"])
+                        for row in rows
+                    ],
+                )
+
+                conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+        _initialized_paths.add(db_path)
+
+
+def get_connection(db_path: str = OCR_CACHE_DB_PATH) -> sqlite3.Connection:
+    """
+    キャッシュ用データベースへの接続を取得する（初回接続時にスキーマを初期化する）
+
+    呼び出し側は`with closing(get_connection()) as conn, conn:`のように接続を閉じること。
+    """
+    if db_path not in _initialized_paths:
+        init_database(db_path)
+    return _connect(db_path)
+
+
+def compute_image_hash(image_data: bytes) -> str:
+    """画像データのSHA-256ハッシュを返す"""
+    return hashlib.sha256(image_data).hexdigest()
+
+
+def compute_perceptual_hash(image_data: bytes) -> int:
+    """
+    画像の知覚ハッシュ（dHash, 64bit）を返す
+
+    画像を9x8のグレースケールに縮小し、隣接する画素の明暗の大小をビット列にする。
+    撮り直しや再スキャンなどで画像データが異なっても、似た画像は近い値になる。
+    """
+    with Image.open(io.BytesIO(image_data)) as img:
+        small = img.convert("L").resize((9, 8), Image.Resampling.BILINEAR)
+        pixels = list(small.getdata())
+
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            value = (value << 1) | int(left > right)
+
+    # SQLiteのINTEGER（符号付き64bit）に収まるよう変換する
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def split_perceptual_hash(perceptual_hash: int) -> List[int]:
+    """知覚ハッシュ（64bit）をPHASH_BANDS個のバンドに分割する"""
+    value = perceptual_hash & ((1 << 64) - 1)
+    bounds = [64 * band // PHASH_BANDS for band in range(PHASH_BANDS + 1)]
+    return [(value >> start) & ((1 << (end - start)) - 1) for start, end in zip(bounds, bounds[1:])]
+
+
+def hamming_distance(a: int, b: int) -> int:
+    """2つの知覚ハッシュのハミング距離を返す"""
+    return ((a ^ b) & ((1 << 64) - 1)).bit_count()
+
+
+def get_cached_ocr_result(
+    image_hash: str, model_name: str, db_path: str = OCR_CACHE_DB_PATH
+) -> Optional[ReceiptOCRResult]:
+    """
+    キャッシュされたOCR結果を取得する
+
+    Parameters:
+    -----------
+    image_hash: str
+        前処理済み画像のSHA-256ハッシュ
+    model_name: str
+        OCRに使用するモデル名
+    db_path: str
+        キャッシュ用データベースのパス
+
+    Returns:
+    --------
+    Optional[ReceiptOCRResult]
+        キャッシュされたOCR結果。存在しない場合はNone
+    """
+    try:
+        with closing(get_connection(db_path)) as conn, conn:
+            row = conn.execute(
+                "SELECT result FROM ocr_cache WHERE image_hash = ? AND model_name = ?",
+                (image_hash, model_name),
+            ).fetchone()
+        return ReceiptOCRResult.model_validate_json(row["result"]) if row else None
+    except Exception as e:
+        print(f"OCRキャッシュ読み込みエラー: {e}")
+        return None
+
+
+def save_ocr_result(
+    image_data: bytes,
+    model_name: str,
+    result: ReceiptOCRResult,
+    db_path: str = OCR_CACHE_DB_PATH,
+) -> bool:
+    """
+    OCR結果をキャッシュに保存する
+
+    Parameters:
+    -----------
+    image_data: bytes
+        前処理済みの画像データ
+    model_name: str
+        OCRに使用したモデル名
+    result: ReceiptOCRResult
+        OCR結果
+    db_path: str
+        キャッシュ用データベースのパス
+
+    Returns:
+    --------
+    bool
+        保存が成功したかどうか
+    """
+    perceptual_hash = compute_perceptual_hash(image_data)
+    columns = ["image_hash", "model_name", "perceptual_hash", "result", *BAND_COLUMNS]
+
+    try:
+        with closing(get_connection(db_path)) as conn, conn:
+            conn.execute(
+                f"INSERT OR REPLACE INTO ocr_cache ({', '.join(columns)})"
+                f" VALUES ({', '.join('?' for _ in columns)})",
+                (
+                    compute_image_hash(image_data),
+                    model_name,
+                    perceptual_hash,
+                    result.model_dump_json(),
+                    *split_perceptual_hash(perceptual_hash),
+                ),
+            )
+        return True
+    except Exception as e:
+        print(f"OCRキャッシュ保存エラー: {e}")
+        return False
+
+
+def find_near_duplicates(
+    image_data: bytes,
+    max_distance: int = PHASH_MAX_DISTANCE,
+    db_path: str = OCR_CACHE_DB_PATH,
+) -> List[Dict[str, Any]]:
+    """
+    過去に処理した領収書のうち、見た目がよく似たもの（二重提出の可能性）を返す
+
+    知覚ハッシュのバンドのいずれかが一致する行のみをインデックスで取り出して距離を計算する。
+    max_distanceがPHASH_BANDS以上の場合はバンドで絞り込めないため、最新のPHASH_SCAN_LIMIT件を走査する。
+
+    Parameters:
+    -----------
+    image_data: bytes
+        前処理済みの画像データ
+    max_distance: int
+        重複とみなす知覚ハッシュのハミング距離の上限
+    db_path: str
+        キャッシュ用データベースのパス
+
+    Returns:
+    --------
+    List[Dict[str, Any]]
+        類似する領収書の情報（日付・金額・店舗名・距離）。距離の近い順
+    """
+    image_hash = compute_image_hash(image_data)
+    perceptual_hash = compute_perceptual_hash(image_data)
+
+    if max_distance < PHASH_BANDS:
+        conditions = " OR ".join(f"{column} = ?" for column in BAND_COLUMNS)
+        sql = (
+            "SELECT image_hash, perceptual_hash, result FROM ocr_cache"
+            f" WHERE ({conditions}) AND image_hash != ?"
+        )
+        params: List[Any] = [*split_perceptual_hash(perceptual_hash), image_hash]
+    else:
+        sql = (
+            "SELECT image_hash, perceptual_hash, result FROM ocr_cache"
+            " WHERE image_hash != ? ORDER BY created_at DESC LIMIT ?"
+        )
+        params = [image_hash, PHASH_SCAN_LIMIT]
+
+    try:
+        with closing(get_connection(db_path)) as conn, conn:
+            rows = conn.execute(sql, params).fetchall()
+    except Exception as e:
+        print(f"OCRキャッシュ読み込みエラー: {e}")
+        return []
+
+    duplicates: Dict[str, Dict[str, Any]] = {}
+    for row in rows:
+        distance = hamming_distance(perceptual_hash, row["perceptual_hash"])
+        if distance > max_distance or row["image_hash"] in duplicates:
+            continue
+        result = ReceiptOCRResult.model_validate_json(row["result"])
+        duplicates[row["image_hash"]] = {
+            "date": result.date,
+            "amount": result.amount,
+            "shop_name": result.shop_name,
+            "distance": distance,
+        }
+
+    return sorted(duplicates.values(), key=lambda item: item["distance"])
@@ -1,122 +1,485 @@
 """
-CSV保存機能
+領収書データの保存機能（SQLiteの台帳とCSVエクスポート）
 """
 
 import csv
+import json
 import os
-from pathlib import Path
-from typing import Any, Dict, List
+import sqlite3
+import threading
+from contextlib import closing
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set
 
-import pandas as pd
+from src.receipt_processor.constants import CSV_FILE_PATH, LEDGER_DB_PATH, REVIEW_QUEUE_PATH
+from src.receipt_processor.journal import get_journal
+from src.receipt_processor.models import AccountInfo, ReviewItem
 
-from src.receipt_processor.constants import CSV_FILE_PATH
-from src.receipt_processor.models import AccountInfo
+# 台帳に保存する列（AccountInfoのフィールド名）
+LEDGER_COLUMNS = list(AccountInfo.model_fields.keys())
 
 
-def save_to_csv(data: AccountInfo, csv_path: str = CSV_FILE_PATH) -> bool:
+# スキーマの初期化が完了したDBファイルのパス
+_initialized_paths: Set[str] = set()
+_init_lock = threading.Lock()
+
+
+def _connect(db_path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def init_database(db_path: str = LEDGER_DB_PATH, import_legacy_csv: bool = True) -> None:
+    """
+    台帳データベースのテーブル・インデックスを作成する（DBファイルごとに一度だけ実行する）
+
+    Parameters:
+    -----------
+    db_path: str
+        台帳データベースのパス
+    import_legacy_csv: bool
+        台帳を新規作成した場合に、以前のCSVに保存されたデータを取り込むかどうか
+    """
+    with _init_lock:
+        if db_path in _initialized_paths:
+            return
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir)
+
+        is_new = not os.path.exists(db_path)
+
+        with closing(_connect(db_path)) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+
+            columns = ", ".join(f"{column} TEXT" for column in LEDGER_COLUMNS)
+            with conn:
+                conn.execute(f"""
+                    CREATE TABLE IF NOT EXISTS receipts (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        {columns},
+                        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                    )
+                    """)
+                conn.execute("CREATE INDEX IF NOT EXISTS index_receipts_on_date ON receipts(date)")
+                conn.execute(
+                    "CREATE INDEX IF NOT EXISTS index_receipts_on_account ON receipts(account)"
+                )
+                conn.execute(
+                    "CREATE INDEX IF NOT EXISTS index_receipts_on_vendor ON receipts(vendor)"
+                )
+
+            # 台帳を新規作成した場合は、以前のCSVに保存されたデータを取り込む
+            if import_legacy_csv and is_new and os.path.exists(CSV_FILE_PATH):
+                import_from_csv(conn, CSV_FILE_PATH)
+
+        _initialized_paths.add(db_path)
+
+
+def get_connection(db_path: str = LEDGER_DB_PATH) -> sqlite3.Connection:
+    """
+    台帳データベースへの接続を取得する（初回接続時にスキーマを初期化する）
+
+    呼び出し側は`with closing(get_connection()) as conn, conn:`のように接続を閉じること。
+
+    Parameters:
+    -----------
+    db_path: str
+        台帳データベースのパス
+
+    Returns:
+    --------
+    sqlite3.Connection
+        データベース接続
+    """
+    if db_path not in _initialized_paths:
+        init_database(db_path)
+    return _connect(db_path)
+
+
+def import_from_csv(conn: sqlite3.Connection, csv_path: str) -> int:
+    """
+    CSVファイルのデータを台帳に取り込む
+
+    Parameters:
+    -----------
+    conn: sqlite3.Connection
+        台帳データベースへの接続
+    csv_path: str
+        取り込むCSVファイルのパス
+
+    Returns:
+    --------
+    int
+        取り込んだ件数
+    """
+    with open(csv_path, newline="", encoding="utf-8") as file:
+        rows = [
+            tuple(row.get(column) or "" for column in LEDGER_COLUMNS)
+            for row in csv.DictReader(file)
+        ]
+
+    # 取り込んだデータもジャーナルから復元できるよう、ジャーナルに記録しながら挿入する
+    insert_with_journal(conn, [dict(zip(LEDGER_COLUMNS, row)) for row in rows])
+    return len(rows)
+
+
+def insert_with_journal(conn: sqlite3.Connection, records: List[Dict[str, Any]]) -> None:
+    """
+    台帳にデータを挿入してコミットする（コミットの前にジャーナルへ書き込む）
+
+    ジャーナルに書き込めない場合は挿入を取り消して例外を送出する。
+    ジャーナルへの書き込み後にコミットに失敗した場合は、書き込んだレコードを取り消す
+    レコード（"abort"）をジャーナルに追記する。
+
+    Parameters:
+    -----------
+    conn: sqlite3.Connection
+        台帳データベースへの接続
+    records: List[Dict[str, Any]]
+        挿入するデータ（台帳の列名をキーとする辞書）
+    """
+    journal = get_journal()
+    placeholders = ", ".join("?" for _ in LEDGER_COLUMNS)
+    record_ids: List[str] = []
+    try:
+        with conn:
+            conn.executemany(
+                f"INSERT INTO receipts ({', '.join(LEDGER_COLUMNS)}) VALUES ({placeholders})",
+                [tuple(record.get(column, "") for column in LEDGER_COLUMNS) for record in records],
+            )
+            for record in records:
+                record_ids.append(journal.append("insert", record))
+    except Exception:
+        for record_id in record_ids:
+            journal.append("abort", {"id": record_id})
+        raise
+
+
+def save_to_ledger(data: AccountInfo, db_path: str = LEDGER_DB_PATH) -> bool:
     """
-    データをCSVファイルに保存する
+    データを台帳に保存する
 
     Parameters:
     -----------
     data: AccountInfo
         保存するデータ（日付、金額、勘定科目情報など）
-    csv_path: str
-        CSVファイルのパス
+    db_path: str
+        台帳データベースのパス
 
     Returns:
     --------
     bool
         保存が成功したかどうか
     """
-    # 保存先ディレクトリが存在しない場合は作成
-    csv_dir = os.path.dirname(csv_path)
-    if not os.path.exists(csv_dir):
-        os.makedirs(csv_dir)
+    try:
+        # 復元用にジャーナルへ書き込んでから台帳にコミットする（書き込めない場合は保存しない）
+        with closing(get_connection(db_path)) as conn:
+            insert_with_journal(conn, [data.model_dump()])
+    except Exception as e:
+        print(f"台帳保存エラー: {e}")
+        return False
 
-    # ファイルが存在するかチェック
-    file_exists = os.path.isfile(csv_path)
+    return True
 
-    # CSVに保存（新規作成または追記）
-    try:
-        with open(csv_path, mode="a", newline="", encoding="utf-8") as file:
-            # AccountInfoのフィールド名を動的に取得
-            fieldnames = list(AccountInfo.model_fields.keys())
-            writer = csv.DictWriter(file, fieldnames=fieldnames)
 
-            # ファイルが存在しない場合はヘッダーを書き込む
-            if not file_exists:
-                writer.writeheader()
+def restore_from_journal(db_path: str, until: Optional[datetime] = None) -> int:
+    """
+    ジャーナルを再生して台帳を復元する（ポイントインタイムリストア）
 
-            # データを書き込む
-            writer.writerow(data.model_dump())
+    Parameters:
+    -----------
+    db_path: str
+        復元先の台帳データベースのパス（存在しないパスを指定する）
+    until: Optional[datetime]
+        指定した場合、この時刻の状態まで復元する
 
-        return True
+    Returns:
+    --------
+    int
+        復元した件数
+    """
+    if os.path.exists(db_path):
+        raise FileExistsError(f"復元先の台帳が既に存在します: {db_path}")
+
+    # ジャーナル以外のデータが混ざらないよう、以前のCSVは取り込まずに台帳を作成する
+    init_database(db_path, import_legacy_csv=False)
+
+    journal = get_journal()
+    journal.flush()
+
+    # コミットに失敗して取り消されたレコードは復元しない
+    aborted_ids = {
+        record["data"]["id"] for record in journal.read_records() if record["op"] == "abort"
+    }
+
+    placeholders = ", ".join("?" for _ in LEDGER_COLUMNS)
+    count = 0
+    with closing(get_connection(db_path)) as conn, conn:
+        for record in journal.read_records(until):
+            if record["op"] != "insert" or record.get("id") in aborted_ids:
+                continue
+            conn.execute(
+                f"INSERT INTO receipts ({', '.join(LEDGER_COLUMNS)}) VALUES ({placeholders})",
+                tuple(record["data"].get(column, "") for column in LEDGER_COLUMNS),
+            )
+            count += 1
+    return count
+
+
+def count_saved_receipts(db_path: str = LEDGER_DB_PATH) -> int:
+    """
+    保存された領収書データの件数を取得する
+
+    Parameters:
+    -----------
+    db_path: str
+        台帳データベースのパス
+
+    Returns:
+    --------
+    int
+        保存されたデータの件数
+    """
+    try:
+        with closing(get_connection(db_path)) as conn, conn:
+            return int(conn.execute("SELECT COUNT(*) FROM receipts").fetchone()[0])
     except Exception as e:
-        print(f"CSV保存エラー: {e}")
-        return False
+        print(f"台帳読み込みエラー: {e}")
+        return 0
 
 
-def get_saved_receipts(csv_path: str = CSV_FILE_PATH) -> List[Dict[str, Any]]:
+def get_saved_receipts(
+    limit: int = 50,
+    offset: int = 0,
+    account: Optional[str] = None,
+    vendor: Optional[str] = None,
+    db_path: str = LEDGER_DB_PATH,
+) -> List[Dict[str, Any]]:
     """
-    保存された領収書データを取得する
+    保存された領収書データを新しい順に1ページ分取得する
 
     Parameters:
     -----------
-    csv_path: str
-        CSVファイルのパス
+    limit: int
+        取得する最大件数
+    offset: int
+        読み飛ばす件数
+    account: Optional[str]
+        勘定科目で絞り込む場合に指定
+    vendor: Optional[str]
+        取引先で絞り込む場合に指定
+    db_path: str
+        台帳データベースのパス
 
     Returns:
     --------
     List[Dict[str, Any]]
         保存されたデータのリスト
     """
-    if not os.path.exists(csv_path):
-        return []
+    sql = f"SELECT {', '.join(LEDGER_COLUMNS)} FROM receipts"
+    conditions = []
+    params: List[Any] = []
+    if account:
+        conditions.append("account = ?")
+        params.append(account)
+    if vendor:
+        conditions.append("vendor = ?")
+        params.append(vendor)
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += " ORDER BY date DESC, id DESC LIMIT ? OFFSET ?"
+    params.extend([limit, offset])
 
     try:
-        # pandasでCSVを読み込む
-        df = pd.read_csv(csv_path, encoding="utf-8")
+        with closing(get_connection(db_path)) as conn, conn:
+            return [dict(row) for row in conn.execute(sql, params).fetchall()]
+    except Exception as e:
+        print(f"台帳読み込みエラー: {e}")
+        return []
 
-        # 古いフォーマットとの互換性のため、raw_textカラムが存在する場合は削除
-        if "raw_text" in df.columns:
-            df = df.drop(columns=["raw_text"])
 
-        # DataFrame -> Dict変換
-        receipts = df.to_dict(orient="records")
-        return receipts
+def get_vendor_accounts(vendor: str, db_path: str = LEDGER_DB_PATH) -> List[Dict[str, Any]]:
+    """
+    取引先ごとの勘定科目・補助科目の使用件数を取得する
+
+    Parameters:
+    -----------
+    vendor: str
+        取引先
+    db_path: str
+        台帳データベースのパス
+
+    Returns:
+    --------
+    List[Dict[str, Any]]
+        勘定科目・補助科目と件数（"account", "sub_account", "count"）。件数の多い順
+    """
+    try:
+        with closing(get_connection(db_path)) as conn, conn:
+            rows = conn.execute(
+                """
+                SELECT account, sub_account, COUNT(*) AS count
+                FROM receipts
+                WHERE vendor = ?
+                GROUP BY account, sub_account
+                ORDER BY count DESC
+                """,
+                (vendor,),
+            ).fetchall()
+        return [dict(row) for row in rows]
     except Exception as e:
-        print(f"CSV読み込みエラー: {e}")
+        print(f"台帳読み込みエラー: {e}")
         return []
 
 
-def backup_csv(csv_path: str = CSV_FILE_PATH) -> bool:
+def export_to_csv(csv_path: str, db_path: str = LEDGER_DB_PATH) -> int:
     """
-    CSVファイルのバックアップを作成する
+    台帳の全データをCSVファイルに書き出す
 
     Parameters:
     -----------
     csv_path: str
-        バックアップするCSVファイルのパス
+        出力するCSVファイルのパス
+    db_path: str
+        台帳データベースのパス
+
+    Returns:
+    --------
+    int
+        書き出した件数
+    """
+    count = 0
+    with (
+        closing(get_connection(db_path)) as conn,
+        open(csv_path, mode="w", newline="", encoding="utf-8") as file,
+    ):
+        writer = csv.writer(file)
+        writer.writerow(LEDGER_COLUMNS)
+        # 全件をメモリに載せずに1行ずつ書き出す
+        for row in conn.execute(
+            f"SELECT {', '.join(LEDGER_COLUMNS)} FROM receipts ORDER BY date, id"
+        ):
+            writer.writerow(tuple(row))
+            count += 1
+    return count
+
+
+def get_review_queue(queue_path: str = REVIEW_QUEUE_PATH) -> List[ReviewItem]:
+    """
+    承認待ちのレビュー項目を取得する
+
+    Parameters:
+    -----------
+    queue_path: str
+        レビューキューのファイルパス
+
+    Returns:
+    --------
+    List[ReviewItem]
+        承認待ちのレビュー項目のリスト
+    """
+    if not os.path.exists(queue_path):
+        return []
+
+    try:
+        with open(queue_path, encoding="utf-8") as file:
+            return [ReviewItem.model_validate(item) for item in json.load(file)]
+    except Exception as e:
+        print(f"レビューキュー読み込みエラー: {e}")
+        return []
+
+
+def _write_review_queue(items: List[ReviewItem], queue_path: str) -> None:
+    """レビューキューを一時ファイル経由で書き込む"""
+    queue_dir = os.path.dirname(queue_path)
+    if queue_dir and not os.path.exists(queue_dir):
+        os.makedirs(queue_dir)
+
+    tmp_path = f"{queue_path}.tmp"
+    with open(tmp_path, mode="w", encoding="utf-8") as file:
+        json.dump([item.model_dump() for item in items], file, ensure_ascii=False)
+    os.replace(tmp_path, queue_path)
+
+
+def add_to_review_queue(items: List[ReviewItem], queue_path: str = REVIEW_QUEUE_PATH) -> bool:
+    """
+    レビュー項目をレビューキューに追加する
+
+    Parameters:
+    -----------
+    items: List[ReviewItem]
+        追加するレビュー項目
+    queue_path: str
+        レビューキューのファイルパス
 
     Returns:
     --------
     bool
-        バックアップが成功したかどうか
+        追加が成功したかどうか
     """
-    if not os.path.exists(csv_path):
+    try:
+        _write_review_queue(get_review_queue(queue_path) + items, queue_path)
+        return True
+    except Exception as e:
+        print(f"レビューキュー保存エラー: {e}")
         return False
 
-    try:
-        # 元のファイルパスと拡張子を取得
-        path = Path(csv_path)
-        backup_path = path.with_name(f"{path.stem}_backup{path.suffix}")
 
-        # ファイルをコピー
-        import shutil
+def remove_from_review_queue(item_ids: List[str], queue_path: str = REVIEW_QUEUE_PATH) -> bool:
+    """
+    指定したIDのレビュー項目をレビューキューから削除する
 
-        shutil.copy2(csv_path, backup_path)
+    Parameters:
+    -----------
+    item_ids: List[str]
+        削除するレビュー項目のID
+    queue_path: str
+        レビューキューのファイルパス
+
+    Returns:
+    --------
+    bool
+        削除が成功したかどうか
+    """
+    try:
+        remaining = [item for item in get_review_queue(queue_path) if item.id not in item_ids]
+        _write_review_queue(remaining, queue_path)
         return True
     except Exception as e:
-        print(f"バックアップエラー: {e}")
+        print(f"レビューキュー保存エラー: {e}")
         return False
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="領収書データの台帳を操作する")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="台帳の全データをCSVに書き出す")
+    export_parser.add_argument("csv_path", help="出力するCSVファイルのパス")
+
+    restore_parser = subparsers.add_parser("restore", help="ジャーナルから台帳を復元する")
+    restore_parser.add_argument("db_path", help="復元先の台帳データベースのパス")
+    restore_parser.add_argument(
+        "--until", type=datetime.fromisoformat, help="この時刻の状態まで復元する（ISO形式）"
+    )
+
+    subparsers.add_parser("compact", help="ジャーナルのセグメントをスナップショットにまとめる")
+
+    args = parser.parse_args()
+
+    if args.command == "export":
+        exported = export_to_csv(args.csv_path)
+        print(f"{exported}件のデータを {args.csv_path} に書き出しました")
+    elif args.command == "restore":
+        restored = restore_from_journal(args.db_path, args.until)
+        print(f"{restored}件のデータを {args.db_path} に復元しました")
+    elif args.command == "compact":
+        compacted = get_journal().compact()
+        print(
+            f"{compacted}個のセグメントをスナップショットにまとめました（書き込み中のセグメントは除く）"
+        )
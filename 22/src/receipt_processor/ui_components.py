@@ -2,14 +2,16 @@
 Streamlit UI関連コンポーネント
 """
 
+import io
+import os
 import tempfile
-import time
-from typing import Optional
+import zipfile
+from typing import Any, Dict, List, Optional
 
 import pandas as pd
 import streamlit as st
 
-from src.receipt_processor.models import AccountInfo, CommandType, Feedback
+from src.receipt_processor.models import AccountInfo, CommandType, Feedback, ReviewItem
 
 
 def setup_page() -> None:
@@ -35,9 +37,7 @@ def handle_image_input() -> Optional[str]:
     st.subheader("領収書画像を選択")
 
     # ファイルアップロード機能
-    uploaded_file = st.file_uploader(
-        "領収書画像をアップロード", type=["jpg", "jpeg", "png"]
-    )
+    uploaded_file = st.file_uploader("領収書画像をアップロード", type=["jpg", "jpeg", "png"])
     if uploaded_file is not None:
         # 画像プレビュー表示
         st.image(uploaded_file, caption="アップロード画像", use_container_width=True)
@@ -51,6 +51,118 @@ def handle_image_input() -> Optional[str]:
     return None
 
 
+def handle_batch_input() -> List[Any]:
+    """
+    一括処理用の画像入力処理（複数画像またはZIPファイルのアップロード）
+
+    Returns:
+    --------
+    List[Any]
+        アップロードされたファイルのリスト。未アップロードの場合は空リスト
+    """
+    st.subheader("領収書画像をまとめて選択")
+
+    uploaded_files = st.file_uploader(
+        "領収書画像またはZIPファイルをアップロード",
+        type=["jpg", "jpeg", "png", "zip"],
+        accept_multiple_files=True,
+    )
+    if not uploaded_files:
+        return []
+
+    st.caption(f"{len(uploaded_files)}件のファイルが選択されています")
+    return list(uploaded_files)
+
+
+def save_uploaded_files(uploaded_files: List[Any], upload_dir: str) -> None:
+    """
+    アップロードされたファイルをディレクトリに保存する（ZIPファイルは展開する）
+
+    Parameters:
+    -----------
+    uploaded_files: List[Any]
+        アップロードされたファイルのリスト
+    upload_dir: str
+        保存先ディレクトリ
+    """
+    for uploaded_file in uploaded_files:
+        file_path = os.path.join(upload_dir, os.path.basename(uploaded_file.name))
+        if file_path.lower().endswith(".zip"):
+            with zipfile.ZipFile(io.BytesIO(uploaded_file.getvalue())) as archive:
+                archive.extractall(os.path.splitext(file_path)[0])
+        else:
+            with open(file_path, "wb") as file:
+                file.write(uploaded_file.getvalue())
+
+
+def display_review_queue(items: List[ReviewItem]) -> List[str]:
+    """
+    レビューキュー（承認待ちの一括処理結果）を表示し、承認された項目のIDを返す
+
+    Parameters:
+    -----------
+    items: List[ReviewItem]
+        承認待ちのレビュー項目
+
+    Returns:
+    --------
+    List[str]
+        承認ボタンが押された場合は選択された項目のID。押されなかった場合は空リスト
+    """
+    if not items:
+        st.info("承認待ちの領収書はありません")
+        return []
+
+    st.subheader(f"承認待ちの領収書（{len(items)}件）")
+
+    rows = []
+    for item in items:
+        account_info = item.account_info
+        rows.append(
+            {
+                "承認": account_info is not None,
+                "ファイル名": item.image_name,
+                "日付": account_info.date if account_info else "",
+                "勘定科目": account_info.account if account_info else "",
+                "取引先": account_info.vendor if account_info else "",
+                "金額": account_info.amount if account_info else "",
+                "摘要": account_info.description if account_info else "",
+                "エラー": item.error,
+            }
+        )
+
+    # 承認列のみ編集可能な表を表示
+    edited = st.data_editor(
+        pd.DataFrame(rows),
+        disabled=[column for column in rows[0] if column != "承認"],
+        hide_index=True,
+        use_container_width=True,
+        key="review_queue_editor",
+    )
+
+    if st.button("選択した領収書を一括承認", type="primary", use_container_width=True):
+        return [item.id for item, approved in zip(items, edited["承認"]) if approved]
+
+    return []
+
+
+def display_duplicate_warning(duplicates: List[Dict[str, Any]]) -> None:
+    """
+    二重提出の可能性がある領収書の警告を表示
+
+    Parameters:
+    -----------
+    duplicates: List[Dict[str, Any]]
+        類似する過去の領収書の情報（日付・金額・店舗名）
+    """
+    lines = [f"- {item['date']} {item['shop_name']} {item['amount']}円" for item in duplicates]
+    st.warning(
+        "過去に処理した領収書とよく似ています。二重提出でないか確認してください。\n\n"
+        + "\n".join(lines),
+        icon="⚠️",
+    )
+
+
 def display_ocr_text(ocr_text: str) -> None:
     """OCRテキストを表示"""
     with st.expander("OCR抽出テキスト", expanded=False):
@@ -173,9 +285,7 @@ def display_action_buttons() -> Optional[Feedback]:
     )
 
     # 説明文
-    st.markdown(
-        "自然言語でエージェントにフィードバックを送り、勘定科目情報を再生成できます"
-    )
+    st.markdown("自然言語でエージェントにフィードバックを送り、勘定科目情報を再生成できます")
 
     # 送信ボタン
     if st.button(
@@ -194,6 +304,37 @@ def display_action_buttons() -> Optional[Feedback]:
     return None
 
 
+def select_history_page(total: int, page_size: int) -> int:
+    """
+    履歴のページ選択を表示し、選択されたページ番号を返す
+
+    Parameters:
+    -----------
+    total: int
+        保存されている領収書の件数
+    page_size: int
+        1ページあたりの表示件数
+
+    Returns:
+    --------
+    int
+        選択されたページ番号（1始まり）
+    """
+    page_count = max((total + page_size - 1) // page_size, 1)
+    if page_count == 1:
+        return 1
+
+    page = st.number_input(
+        f"ページ（全{page_count}ページ / {total}件）",
+        min_value=1,
+        max_value=page_count,
+        value=1,
+        step=1,
+        key="history_page",
+    )
+    return int(page)
+
+
 def display_receipt_history(receipts: list) -> None:
     """
     保存された領収書履歴を表示
@@ -219,10 +360,10 @@ def display_receipt_history(receipts: list) -> None:
     # データフレームを表示
     st.dataframe(df, use_container_width=True)
 
-    # CSVダウンロード機能
+    # CSVダウンロード機能（表示中のページ。全件は storage モジュールのコマンドで書き出す）
     csv = df.to_csv(index=False).encode("utf-8")
     st.download_button(
-        label="CSVダウンロード",
+        label="表示中のデータをCSVダウンロード",
         data=csv,
         file_name="receipts_data.csv",
         mime="text/csv",
@@ -250,10 +391,3 @@ def display_success_message() -> None:
         st.session_state.account_info = {}
         # 画面を再読み込み
         st.rerun()
-
-
-def display_loading_spinner(message: str = "処理中...") -> None:
-    """ローディングスピナーを表示"""
-    with st.spinner(message):
-        time.sleep(0.1)  # スピナー表示のための最小遅延
-        # 実際の処理は呼び出し側で行うため、ここでは何もしない
@@ -3,40 +3,39 @@
 """
 
 import base64
-import mimetypes
-import os
-import pathlib
-import tempfile
-from typing import Any, Dict, List
+import io
+import math
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Tuple, cast
 
 from langchain_anthropic import ChatAnthropic
-from PIL import Image, ImageEnhance
+from langchain_core.output_parsers.openai_tools import JsonOutputKeyToolsParser
+from langchain_core.runnables import Runnable
+from PIL import Image, ImageEnhance, ImageFilter, ImageStat
 
 from src.receipt_processor.constants import CLAUDE_FAST_MODEL
 from src.receipt_processor.models import ReceiptOCRResult
+from src.receipt_processor.ocr_cache import (
+    compute_image_hash,
+    get_cached_ocr_result,
+    save_ocr_result,
+)
 
+# 前処理後の画像の長辺の最大サイズ（px、従来の固定の前処理で使用）
+MAX_IMAGE_SIZE = 1000
 
-def build_vision_message(image_path: str) -> List[Dict[str, Any]]:
-    """
-    画像をClaudeのVision APIで使用可能なメッセージ形式に変換
-
-    Parameters:
-    -----------
-    image_path: str
-        画像ファイルのパス
-
-    Returns:
-    --------
-    List[Dict[str, Any]]
-        Claudeに送信するメッセージリスト
-    """
-    path = pathlib.Path(image_path)
-    data = path.read_bytes()
-    media_type = mimetypes.guess_type(path.name)[0] or "image/png"
-    b64 = base64.b64encode(data).decode()
+# 適応的な前処理の設定
+ADAPTIVE_WORKING_SIZE = 2000  # 領収書の検出と文字の高さの推定を行う画像の長辺（px）
+ADAPTIVE_MIN_IMAGE_SIZE = 400  # 前処理後の画像の長辺の最小サイズ（px）
+ADAPTIVE_MAX_IMAGE_SIZE = (
+    1568  # 前処理後の画像の長辺の最大サイズ（px、Claudeが縮小せずに扱える大きさ）
+)
+TARGET_TEXT_HEIGHT = 20  # 縮小後の文字の高さの目標（px）
+RECEIPT_MIN_AREA_RATIO = 0.2  # 領収書の領域とみなす最小の面積比
+JPEG_QUALITY = 85  # JPEGで保存する場合の品質
 
-    # OCRタスク用システムプロンプト
-    system_prompt = """\
+# OCRタスク用システムプロンプト（画像によらず共通のため、モジュールの定数として定義する）
+OCR_SYSTEM_PROMPT = """\
 あなたは領収書OCRシステムです。画像内の領収書からテキストや情報を抽出し、指定された形式で返します。
 以下の点に注意してください：
 1. 日本語の領収書に特化してください
@@ -48,10 +47,32 @@ def build_vision_message(image_path: str) -> List[Dict[str, Any]]:
 7. 生テキストは領収書の全テキストを含めてください
 """.strip()
 
+
+def build_vision_message(
+    image_data: bytes, media_type: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """
+    画像をClaudeのVision APIで使用可能なメッセージ形式に変換
+
+    Parameters:
+    -----------
+    image_data: bytes
+        エンコード済みの画像データ
+    media_type: Optional[str]
+        画像のメディアタイプ（Noneの場合は画像データから判定する）
+
+    Returns:
+    --------
+    List[Dict[str, Any]]
+        Claudeに送信するメッセージリスト
+    """
+    b64 = base64.b64encode(image_data).decode()
+    media_type = media_type or detect_media_type(image_data)
+
     return [
         {
             "role": "system",
-            "content": system_prompt,
+            "content": OCR_SYSTEM_PROMPT,
         },
         {
             "role": "user",
@@ -73,56 +94,411 @@ def build_vision_message(image_path: str) -> List[Dict[str, Any]]:
     ]
 
 
-def preprocess_receipt_image(image_path: str) -> str:
+def resize_to_long_edge(img: Image.Image, max_size: int) -> Image.Image:
+    """
+    長辺がmax_size以内になるように縮小する
+
+    Parameters:
+    -----------
+    img: Image.Image
+        元の画像
+    max_size: int
+        長辺の最大サイズ（px）
+
+    Returns:
+    --------
+    Image.Image
+        縮小後の画像（max_size以内の場合は元の画像）
+    """
+    if max(img.size) <= max_size:
+        return img
+
+    # 整数倍の縮小を先に行い、リサンプリングの計算量を減らす
+    factor = max(img.size) // max_size
+    if factor >= 2:
+        img = img.reduce(factor)
+    if max(img.size) > max_size:
+        ratio = max_size / max(img.size)
+        new_size = (
+            max(int(img.size[0] * ratio), 1),
+            max(int(img.size[1] * ratio), 1),
+        )
+        img = img.resize(new_size, Image.Resampling.BICUBIC)
+    return img
+
+
+def crop_to_receipt(img: Image.Image) -> Image.Image:
+    """
+    画像から領収書（背景より明るい紙）の領域を切り出す
+
+    縮小画像で明るい領域を検出し、その外接矩形で切り出す。
+    領域を検出できない場合や、領域が小さすぎる場合は元の画像を返す。
+
+    Parameters:
+    -----------
+    img: Image.Image
+        グレースケールの画像
+
+    Returns:
+    --------
+    Image.Image
+        領収書の領域を切り出した画像
+    """
+    small = img.copy()
+    small.thumbnail((256, 256))
+
+    # 平均より十分明るい画素を紙とみなし、収縮処理で細かいノイズを除去する
+    mean = ImageStat.Stat(small).mean[0]
+    # グレースケール画像のgetextremaは(最小値, 最大値)を返す
+    _, brightest = cast(Tuple[int, int], small.getextrema())
+    threshold = mean + (max(brightest, mean) - mean) / 2
+    mask = small.point(lambda p: 255 if p >= threshold else 0).filter(ImageFilter.MinFilter(5))
+    bbox = mask.getbbox()
+    if bbox is None:
+        return img
+
+    left, top, right, bottom = bbox
+    if (right - left) * (bottom - top) < small.size[0] * small.size[1] * RECEIPT_MIN_AREA_RATIO:
+        return img
+
+    # 元の画像の座標に戻し、収縮処理で削った分の余白を付ける
+    scale = img.size[0] / small.size[0]
+    margin = 3
+    return img.crop(
+        (
+            max(int((left - margin) * scale), 0),
+            max(int((top - margin) * scale), 0),
+            min(int((right + margin) * scale), img.size[0]),
+            min(int((bottom + margin) * scale), img.size[1]),
+        )
+    )
+
+
+def estimate_text_height(img: Image.Image) -> Optional[float]:
+    """
+    画像内の文字の高さ（px）を推定する
+
+    暗い画素を文字とみなして行ごとに数え、文字を含む行が連続する区間を1行の文字とする。
+    小さい文字が読めるよう、区間の高さの下位25%点を文字の高さとする。
+
+    Parameters:
+    -----------
+    img: Image.Image
+        グレースケールの画像（領収書の領域を切り出したもの）
+
+    Returns:
+    --------
+    Optional[float]
+        文字の高さ（px）。文字を検出できない場合はNone
+    """
+    # 切り出しで残った左右の背景を除くため、中央の80%の幅で判定する
+    width, height = img.size
+    img = img.crop((width // 10, 0, width - width // 10, height))
+
+    # 最も多い明るさを紙の明るさとし、それより十分暗い画素を文字とみなす
+    histogram = img.histogram()
+    paper = max(range(128, 256), key=lambda value: histogram[value])
+    mask = img.point(lambda p: 255 if p < paper * 0.6 else 0)
+
+    # 行ごとの文字の画素の割合
+    profile = list(mask.resize((1, height), Image.Resampling.BOX).getdata())
+    is_text = [value > 255 * 0.01 for value in profile]
+
+    # 文字を含む行が連続する区間の高さ
+    # （上下端に接する区間は背景の可能性があるため除き、罫線やノイズ、大きすぎる区間も除く）
+    min_run = max(3, height // 200)
+    runs: List[int] = []
+    start = 0
+    for row, flag in enumerate(is_text + [False]):
+        if flag:
+            continue
+        run = row - start
+        if start > 0 and row < height and min_run <= run <= height // 4:
+            runs.append(run)
+        start = row + 1
+
+    if not runs:
+        return None
+    return float(sorted(runs)[len(runs) // 4])
+
+
+def encode_image(
+    img: Image.Image, image_format: Optional[str] = None, quality: int = JPEG_QUALITY
+) -> bytes:
+    """
+    画像をエンコードする
+
+    Parameters:
+    -----------
+    img: Image.Image
+        エンコードする画像
+    image_format: Optional[str]
+        "PNG"または"JPEG"。Noneの場合は両方でエンコードし、小さい方を返す
+    quality: int
+        JPEGの品質
+
+    Returns:
+    --------
+    bytes
+        エンコードした画像のバイト列
+    """
+    encoded = []
+    for fmt in [image_format] if image_format else ["PNG", "JPEG"]:
+        buffer = io.BytesIO()
+        if fmt == "PNG":
+            img.save(buffer, format="PNG", optimize=True)
+        else:
+            img.save(buffer, format="JPEG", quality=quality)
+        encoded.append(buffer.getvalue())
+    return min(encoded, key=len)
+
+
+def detect_media_type(image_data: bytes) -> str:
+    """画像データのメディアタイプを判定する（PNGまたはJPEG）"""
+    return "image/png" if image_data.startswith(b"\x89PNG") else "image/jpeg"
+
+
+def estimate_image_tokens(image_data: bytes) -> int:
+    """
+    画像の入力トークン数を見積もる（Claudeの画像トークン数の目安: 幅×高さ/750）
+
+    Parameters:
+    -----------
+    image_data: bytes
+        エンコード済みの画像データ
+
+    Returns:
+    --------
+    int
+        入力トークン数の見積もり
+    """
+    with Image.open(io.BytesIO(image_data)) as img:
+        width, height = img.size
+    return math.ceil(width * height / 750)
+
+
+def preprocess_receipt_image(
+    image_path: str,
+    adaptive: bool = True,
+    target_text_height: float = TARGET_TEXT_HEIGHT,
+    image_format: Optional[str] = None,
+) -> bytes:
     """
     OCR精度向上のための画像前処理
 
+    adaptiveがTrueの場合は、領収書の領域を切り出し、文字の高さがtarget_text_height程度に
+    なるまで縮小する。文字が大きい領収書ほど小さな画像になり、送信量と入力トークン数が減る。
+    Falseの場合は長辺をMAX_IMAGE_SIZEに縮小してJPEG（品質95）で保存する（従来の処理）。
+
     Parameters:
     -----------
     image_path: str
         元の画像パス
+    adaptive: bool
+        領収書の内容に応じて解像度とエンコード形式を選ぶかどうか
+    target_text_height: float
+        縮小後の文字の高さの目標（px）
+    image_format: Optional[str]
+        "PNG"または"JPEG"。Noneの場合は小さくなる方を選ぶ（adaptiveがTrueの場合のみ）
 
     Returns:
     --------
-    str
-        処理後の画像の一時ファイルパス
+    bytes
+        処理後の画像（PNGまたはJPEG形式）のバイト列
     """
     # 画像を開く
     img = Image.open(image_path)
+    max_size = ADAPTIVE_WORKING_SIZE if adaptive else MAX_IMAGE_SIZE
+
+    # JPEGの場合はデコード時に縮小する（必要なサイズ以上で最も小さい縮尺が選ばれる）
+    ratio = min(max_size / max(img.size), 1.0)
+    target_size = (int(img.size[0] * ratio), int(img.size[1] * ratio))
+    img.draft("L", target_size)
+
+    # グレースケール変換と縮小
+    img_gray = resize_to_long_edge(img.convert("L"), max_size)
 
-    # グレースケール変換
-    img_gray = img.convert("L")
+    if adaptive:
+        # 領収書の領域を切り出し、文字の高さから縮小率を決める
+        img_gray = crop_to_receipt(img_gray)
+        text_height = estimate_text_height(img_gray)
+        long_edge = max(img_gray.size)
+        if text_height is not None:
+            long_edge = int(long_edge * min(target_text_height / text_height, 1.0))
+        long_edge = min(max(long_edge, ADAPTIVE_MIN_IMAGE_SIZE), ADAPTIVE_MAX_IMAGE_SIZE)
+        img_gray = resize_to_long_edge(img_gray, long_edge)
 
-    # コントラスト強調
+    # コントラスト強調（縮小後の画像に対して行う）
     enhancer = ImageEnhance.Contrast(img_gray)
     img_enhanced = enhancer.enhance(2.0)  # コントラスト2倍
 
-    # 必要に応じてリサイズ（長辺が1000px以内に）
-    max_size = 1000
-    if max(img_enhanced.size) > max_size:
-        ratio = max_size / max(img_enhanced.size)
-        new_size = (
-            int(img_enhanced.size[0] * ratio),
-            int(img_enhanced.size[1] * ratio),
-        )
-        img_resized = img_enhanced.resize(
-            new_size,
-            Image.BICUBIC if hasattr(Image, "BICUBIC") else Image.Resampling.BICUBIC,
-        )
-    else:
-        img_resized = img_enhanced
+    # 処理済み画像をメモリ上でエンコード
+    if not adaptive:
+        return encode_image(img_enhanced, "JPEG", quality=95)
+    return encode_image(img_enhanced, image_format)
+
+
+@lru_cache(maxsize=None)
+def get_ocr_llm(model_name: str = CLAUDE_FAST_MODEL) -> ChatAnthropic:
+    """
+    OCR用のLLMクライアントを返す（モデル名ごとに一度だけ生成して再利用する）
+
+    Parameters:
+    -----------
+    model_name: str
+        使用するClaudeモデル名
+
+    Returns:
+    --------
+    ChatAnthropic
+        OCR用のLLMクライアント
+    """
+    return ChatAnthropic(
+        model_name=model_name,
+        temperature=0,
+        timeout=None,
+        stop=None,
+        max_retries=3,
+    )
+
+
+@lru_cache(maxsize=None)
+def get_ocr_chain(model_name: str = CLAUDE_FAST_MODEL) -> Runnable:
+    """
+    OCR用のチェーンを返す（モデル名ごとに一度だけ構築して再利用する）
+
+    Parameters:
+    -----------
+    model_name: str
+        使用するClaudeモデル名
+
+    Returns:
+    --------
+    Runnable
+        Vision APIのメッセージを受け取り、ReceiptOCRResultを返すチェーン
+    """
+    # 構造化出力を使って処理
+    return get_ocr_llm(model_name).with_structured_output(ReceiptOCRResult)
+
+
+@lru_cache(maxsize=None)
+def get_ocr_stream_chain(model_name: str = CLAUDE_FAST_MODEL) -> Runnable:
+    """
+    ストリーミングOCR用のチェーンを返す（モデル名ごとに一度だけ構築して再利用する）
+
+    Parameters:
+    -----------
+    model_name: str
+        使用するClaudeモデル名
+
+    Returns:
+    --------
+    Runnable
+        Vision APIのメッセージを受け取り、生成途中の構造化データ（辞書）を順次返すチェーン
+    """
+    tool_name = ReceiptOCRResult.__name__
+    llm = get_ocr_llm(model_name).bind_tools([ReceiptOCRResult], tool_choice=tool_name)
+
+    # ツール呼び出しの引数（JSON）を途中までパースした辞書をストリーミングする
+    return llm | JsonOutputKeyToolsParser(key_name=tool_name, first_tool_only=True)
+
+
+def ocr_processed_image(image_data: bytes, model_name: str = CLAUDE_FAST_MODEL) -> ReceiptOCRResult:
+    """
+    前処理済みの画像からClaude Vision APIでテキストを抽出し、構造化データとして返す
+
+    Parameters:
+    -----------
+    image_data: bytes
+        前処理済みの画像（PNGまたはJPEG形式）のバイト列
+    model_name: str
+        使用するClaudeモデル名
+
+    Returns:
+    --------
+    ReceiptOCRResult
+        抽出された領収書情報（構造化データ）
+    """
+    ocr_chain = get_ocr_chain(model_name)
+
+    # OCR処理を実行
+    result: ReceiptOCRResult = ocr_chain.invoke(build_vision_message(image_data))  # type: ignore
+
+    return result
+
+
+def ocr_image(image_data: bytes, model_name: str = CLAUDE_FAST_MODEL) -> ReceiptOCRResult:
+    """
+    前処理済みの画像をOCRする（同じ画像・モデルの結果はキャッシュから返す）
+
+    Parameters:
+    -----------
+    image_data: bytes
+        前処理済みの画像（PNGまたはJPEG形式）のバイト列
+    model_name: str
+        使用するClaudeモデル名
+
+    Returns:
+    --------
+    ReceiptOCRResult
+        抽出された領収書情報（構造化データ）
+    """
+    cached = get_cached_ocr_result(compute_image_hash(image_data), model_name)
+    if cached is not None:
+        return cached
 
-    # 処理済み画像を一時ファイルに保存
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as tmp:
-        temp_path = tmp.name
-        img_resized.save(temp_path, format="JPEG", quality=95)
+    result = ocr_processed_image(image_data, model_name)
+    save_ocr_result(image_data, model_name, result)
 
-    return temp_path
+    return result
 
 
-def ocr_receipt(
-    image_path: str, model_name: str = CLAUDE_FAST_MODEL
+def ocr_image_streaming(
+    image_data: bytes,
+    on_partial: Callable[[Dict[str, Any]], None],
+    model_name: str = CLAUDE_FAST_MODEL,
 ) -> ReceiptOCRResult:
+    """
+    前処理済みの画像をストリーミングでOCRする（同じ画像・モデルの結果はキャッシュから返す）
+
+    生成途中の構造化データを受け取るたびにon_partialを呼び出すため、
+    OCRの完了を待たずに抽出済みの項目を使った処理を開始できる。
+    キャッシュから返す場合、on_partialは呼び出さない。
+
+    Parameters:
+    -----------
+    image_data: bytes
+        前処理済みの画像（PNGまたはJPEG形式）のバイト列
+    on_partial: Callable[[Dict[str, Any]], None]
+        生成途中の構造化データ（辞書）を受け取るコールバック
+    model_name: str
+        使用するClaudeモデル名
+
+    Returns:
+    --------
+    ReceiptOCRResult
+        抽出された領収書情報（構造化データ）
+    """
+    cached = get_cached_ocr_result(compute_image_hash(image_data), model_name)
+    if cached is not None:
+        return cached
+
+    partial: Optional[Dict[str, Any]] = None
+    for chunk in get_ocr_stream_chain(model_name).stream(build_vision_message(image_data)):
+        if chunk:
+            partial = chunk
+            on_partial(partial)
+
+    if partial is None:
+        raise ValueError("OCR結果を取得できませんでした")
+
+    result = ReceiptOCRResult.model_validate(partial)
+    save_ocr_result(image_data, model_name, result)
+
+    return result
+
+
+def ocr_receipt(image_path: str, model_name: str = CLAUDE_FAST_MODEL) -> ReceiptOCRResult:
     """
     Claude Vision APIを使用して領収書画像からテキストを抽出し、構造化データとして返す
 
@@ -138,29 +514,7 @@ def ocr_receipt(
     ReceiptOCRResult
         抽出された領収書情報（構造化データ）
     """
-    # 前処理を実行
-    processed_image_path = preprocess_receipt_image(image_path)
-
-    try:
-        # LLMの初期化
-        llm = ChatAnthropic(
-            model_name=model_name,
-            temperature=0,
-            timeout=None,
-            stop=None,
-            max_retries=3,
-        )
-
-        # 構造化出力を使って処理
-        ocr_chain = llm.with_structured_output(ReceiptOCRResult)
-
-        # OCR処理を実行
-        result: ReceiptOCRResult = ocr_chain.invoke(
-            build_vision_message(processed_image_path)
-        )  # type: ignore
+    # 前処理を実行（一時ファイルを経由せずメモリ上で受け渡す）
+    image_data = preprocess_receipt_image(image_path)
 
-        return result
-    finally:
-        # 一時ファイルを削除
-        if os.path.exists(processed_image_path):
-            os.unlink(processed_image_path)
+    return ocr_image(image_data, model_name)